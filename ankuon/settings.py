@@ -89,6 +89,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
 
+    # outermost, so its latency covers the rest of the stack
+    "app.api.middleware.MetricsMiddleware",
+
+    # read-replica state per request; unused without DATABASE_REPLICA_URL
+    "app.api.middleware.ReplicaMiddleware",
+
     "django.middleware.security.SecurityMiddleware",
 
     "corsheaders.middleware.CorsMiddleware",
@@ -166,6 +172,87 @@ DATABASES = {
     )
 }
 
+# read replica for admin and reporting reads (see app.services.replica)
+DATABASE_REPLICA_URL = os.getenv(
+    "DATABASE_REPLICA_URL",
+    ""
+)
+
+if DATABASE_REPLICA_URL:
+    DATABASES["replica"] = dj_database_url.parse(
+        DATABASE_REPLICA_URL,
+        conn_max_age=600,
+    )
+    # tests read the replica alias from the default test database
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+    DATABASE_ROUTERS = ["app.services.replica.ReplicaRouter"]
+
+# seconds a user or admin keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = int(
+    os.getenv(
+        "REPLICA_PIN_SECONDS",
+        "5"
+    )
+)
+
+# replica reads fall back to the primary beyond this lag
+REPLICA_MAX_LAG_SECONDS = float(
+    os.getenv(
+        "REPLICA_MAX_LAG_SECONDS",
+        "10"
+    )
+)
+
+# how often each process measures the replica lag
+REPLICA_LAG_CHECK_SECONDS = float(
+    os.getenv(
+        "REPLICA_LAG_CHECK_SECONDS",
+        "5"
+    )
+)
+
+
+# =====================================================
+# CACHE
+# =====================================================
+
+REDIS_URL = os.getenv(
+    "REDIS_URL",
+    ""
+)
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+
+# seconds the admin dashboard counters are served from cache
+ADMIN_STATS_CACHE_TTL = int(
+    os.getenv(
+        "ADMIN_STATS_CACHE_TTL",
+        "60"
+    )
+)
+
+# rows each counter is spread over, so concurrent money movements rarely
+# wait on the same counter row lock
+ADMIN_STATS_SHARDS = int(
+    os.getenv(
+        "ADMIN_STATS_SHARDS",
+        "8"
+    )
+)
+
 
 # =====================================================
 # PASSWORD VALIDATION
@@ -263,12 +350,78 @@ REST_FRAMEWORK = {
 
     "DEFAULT_AUTHENTICATION_CLASSES": [
 
+        "app.api.authentication.SignedTokenAuthentication",
+
         "rest_framework.authentication.SessionAuthentication",
 
     ],
 }
 
 
+# lifetime (seconds) of the signed Bearer access token
+ACCESS_TOKEN_MAX_AGE = int(
+    os.getenv(
+        "ACCESS_TOKEN_MAX_AGE",
+        "3600"
+    )
+)
+
+# per-process profile LRU used for token-authenticated requests
+PROFILE_CACHE_SIZE = int(
+    os.getenv(
+        "PROFILE_CACHE_SIZE",
+        "1024"
+    )
+)
+
+PROFILE_CACHE_TTL = int(
+    os.getenv(
+        "PROFILE_CACHE_TTL",
+        "30"
+    )
+)
+
+
+# =====================================================
+# OTP (Redis from REDIS_URL or CELERY_BROKER_URL, else a shared cache)
+# =====================================================
+
+# redis | cache | memory; empty picks the first shared store configured
+OTP_STORE = os.getenv(
+    "OTP_STORE",
+    ""
+)
+
+OTP_TTL_SECONDS = int(
+    os.getenv(
+        "OTP_TTL_SECONDS",
+        "300"
+    )
+)
+
+OTP_MAX_ATTEMPTS = int(
+    os.getenv(
+        "OTP_MAX_ATTEMPTS",
+        "5"
+    )
+)
+
+# sends allowed per email within OTP_SEND_WINDOW_SECONDS
+OTP_SEND_LIMIT = int(
+    os.getenv(
+        "OTP_SEND_LIMIT",
+        "5"
+    )
+)
+
+OTP_SEND_WINDOW_SECONDS = int(
+    os.getenv(
+        "OTP_SEND_WINDOW_SECONDS",
+        "3600"
+    )
+)
+
+
 # =====================================================
 # EMAIL
 # =====================================================
@@ -306,6 +459,51 @@ EMAIL_HOST_PASSWORD = os.getenv(
     ""
 )
 
+# pooled delivery (app.services.mailer): one SMTP session per worker,
+# flushed in micro-batches of EMAIL_BATCH_SIZE or EMAIL_BATCH_WAIT_MS
+EMAIL_BATCH_SIZE = int(
+    os.getenv(
+        "EMAIL_BATCH_SIZE",
+        "50"
+    )
+)
+
+EMAIL_BATCH_WAIT_MS = int(
+    os.getenv(
+        "EMAIL_BATCH_WAIT_MS",
+        "50"
+    )
+)
+
+EMAIL_MAX_RETRIES = int(
+    os.getenv(
+        "EMAIL_MAX_RETRIES",
+        "4"
+    )
+)
+
+EMAIL_RETRY_BACKOFF_SECONDS = float(
+    os.getenv(
+        "EMAIL_RETRY_BACKOFF_SECONDS",
+        "0.5"
+    )
+)
+
+# close the SMTP session after this many idle seconds
+EMAIL_CONNECTION_MAX_IDLE = int(
+    os.getenv(
+        "EMAIL_CONNECTION_MAX_IDLE",
+        "30"
+    )
+)
+
+EMAIL_QUEUE_SIZE = int(
+    os.getenv(
+        "EMAIL_QUEUE_SIZE",
+        "10000"
+    )
+)
+
 
 # =====================================================
 # CASHFREE
@@ -332,6 +530,226 @@ CASHFREE_API_VERSION = os.getenv(
     "2023-08-01"
 )
 
+# webhooks signed further than this from now are rejected
+CASHFREE_WEBHOOK_TOLERANCE_SECONDS = int(
+    os.getenv(
+        "CASHFREE_WEBHOOK_TOLERANCE_SECONDS",
+        "300"
+    )
+)
+
+CASHFREE_WEBHOOK_DEDUP_TTL = int(
+    os.getenv(
+        "CASHFREE_WEBHOOK_DEDUP_TTL",
+        "86400"
+    )
+)
+
+# Auto Collect (virtual accounts); defaults to the CASHFREE_ENV endpoint
+CASHFREE_VA_BASE_URL = os.getenv(
+    "CASHFREE_VA_BASE_URL",
+    ""
+)
+
+CASHFREE_VA_CONNECT_TIMEOUT = float(
+    os.getenv(
+        "CASHFREE_VA_CONNECT_TIMEOUT",
+        "3.05"
+    )
+)
+
+CASHFREE_VA_READ_TIMEOUT = float(
+    os.getenv(
+        "CASHFREE_VA_READ_TIMEOUT",
+        "10"
+    )
+)
+
+CASHFREE_VA_RETRIES = int(
+    os.getenv(
+        "CASHFREE_VA_RETRIES",
+        "2"
+    )
+)
+
+CASHFREE_VA_BACKOFF_SECONDS = float(
+    os.getenv(
+        "CASHFREE_VA_BACKOFF_SECONDS",
+        "0.25"
+    )
+)
+
+# consecutive failures before invest stops calling the gateway inline
+CASHFREE_VA_BREAKER_THRESHOLD = int(
+    os.getenv(
+        "CASHFREE_VA_BREAKER_THRESHOLD",
+        "5"
+    )
+)
+
+CASHFREE_VA_BREAKER_RESET_SECONDS = float(
+    os.getenv(
+        "CASHFREE_VA_BREAKER_RESET_SECONDS",
+        "30"
+    )
+)
+
+# True: never call Cashfree in the request, always via Celery
+CASHFREE_VA_DEFER = (
+    os.getenv(
+        "CASHFREE_VA_DEFER",
+        "False"
+    ).lower() == "true"
+)
+
+# simple monthly return on confirmed principal, accrued daily
+RETURNS_MONTHLY_RATE = os.getenv(
+    "RETURNS_MONTHLY_RATE",
+    "0.02"
+)
+
+RETURNS_DAYS_PER_MONTH = int(
+    os.getenv(
+        "RETURNS_DAYS_PER_MONTH",
+        "30"
+    )
+)
+
+# investments read and updated per accrual transaction
+RETURNS_ACCRUAL_CHUNK = int(
+    os.getenv(
+        "RETURNS_ACCRUAL_CHUNK",
+        "2000"
+    )
+)
+
+# per-route latency/query/size histograms served at /api/metrics/
+METRICS_ENABLED = os.getenv(
+    "METRICS_ENABLED",
+    "True"
+).lower() == "true"
+
+# shared directory where each process writes its metrics (gunicorn workers,
+# Celery children); empty keeps them per process. Clear it on deploy.
+METRICS_DIR = os.getenv(
+    "METRICS_DIR",
+    ""
+)
+
+# how often each process rewrites its file in METRICS_DIR
+METRICS_FLUSH_SECONDS = float(
+    os.getenv(
+        "METRICS_FLUSH_SECONDS",
+        "5"
+    )
+)
+
+# Bearer token for Prometheus scrapes of /api/metrics/ (admins can always read it)
+METRICS_TOKEN = os.getenv(
+    "METRICS_TOKEN",
+    ""
+)
+
+# rows fetched per server-side cursor round trip and per streamed export chunk
+EXPORT_CHUNK_SIZE = int(
+    os.getenv(
+        "EXPORT_CHUNK_SIZE",
+        "2000"
+    )
+)
+
+# SecurityLog rows are written by a background thread in batches
+SECURITY_LOG_ASYNC = os.getenv(
+    "SECURITY_LOG_ASYNC",
+    "True"
+).lower() == "true"
+
+# rows per SecurityLog insert
+SECURITY_LOG_BATCH_SIZE = int(
+    os.getenv(
+        "SECURITY_LOG_BATCH_SIZE",
+        "500"
+    )
+)
+
+# longest a queued SecurityLog row waits before its batch is written
+SECURITY_LOG_FLUSH_MS = int(
+    os.getenv(
+        "SECURITY_LOG_FLUSH_MS",
+        "1000"
+    )
+)
+
+# queued rows per process; beyond this callers write synchronously
+SECURITY_LOG_QUEUE_SIZE = int(
+    os.getenv(
+        "SECURITY_LOG_QUEUE_SIZE",
+        "50000"
+    )
+)
+
+# monthly partitions created ahead of time (PostgreSQL)
+SECURITY_LOG_PARTITIONS_AHEAD = int(
+    os.getenv(
+        "SECURITY_LOG_PARTITIONS_AHEAD",
+        "3"
+    )
+)
+
+# whole months kept in the table; older ones are archived to gzipped JSONL
+SECURITY_LOG_RETENTION_MONTHS = int(
+    os.getenv(
+        "SECURITY_LOG_RETENTION_MONTHS",
+        "12"
+    )
+)
+
+# order id node: pins one node id (unique per worker process); unset leases one from the DB
+ORDER_ID_NODE = (
+    int(os.getenv("ORDER_ID_NODE"))
+    if os.getenv("ORDER_ID_NODE")
+    else None
+)
+
+# bits of the order id given to the node id; the rest of 22 is the sequence
+ORDER_ID_NODE_BITS = int(
+    os.getenv(
+        "ORDER_ID_NODE_BITS",
+        "10"
+    )
+)
+
+# how long a leased order id node stays held without renewal (renewed at half)
+ORDER_ID_LEASE_SECONDS = int(
+    os.getenv(
+        "ORDER_ID_LEASE_SECONDS",
+        "600"
+    )
+)
+
+# pre-created VAs kept ready per CASHFREE_ENV (0 disables the pool)
+VA_POOL_SIZE = int(
+    os.getenv(
+        "VA_POOL_SIZE",
+        "0"
+    )
+)
+
+# refill as soon as fewer than this many are available
+VA_POOL_LOW_WATER = int(
+    os.getenv(
+        "VA_POOL_LOW_WATER",
+        "50"
+    )
+)
+
+VA_POOL_REFILL_BATCH = int(
+    os.getenv(
+        "VA_POOL_REFILL_BATCH",
+        "100"
+    )
+)
+
 
 # =====================================================
 # CELERY
@@ -355,6 +773,54 @@ CELERY_TASK_SERIALIZER = "json"
 
 CELERY_RESULT_SERIALIZER = "json"
 
+# Without a broker (local dev, tests) tasks run inline.
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+
+CELERY_BEAT_SCHEDULE = {
+
+    # backstop for webhook events whose drain task was never enqueued
+    "drain-webhook-inbox": {
+        "task": "app.tasks.process_webhook_inbox",
+        "schedule": 30.0,
+    },
+
+    # pending virtual accounts whose creation task was lost
+    "retry-pending-virtual-accounts": {
+        "task": "app.tasks.retry_pending_virtual_accounts",
+        "schedule": 5 * 60.0,
+    },
+
+    # keep the VA pool above its low-water mark
+    "refill-va-pool": {
+        "task": "app.tasks.refill_va_pool",
+        "schedule": 60.0,
+    },
+
+    # daily returns; a no-op once today's run has completed
+    "accrue-returns": {
+        "task": "app.tasks.accrue_returns",
+        "schedule": 60 * 60.0,
+    },
+
+    # per-user ledger snapshots so balance reads only scan a short tail
+    "snapshot-ledger": {
+        "task": "app.tasks.snapshot_ledger",
+        "schedule": 60 * 60.0,
+    },
+
+    # next months' SecurityLog partitions exist before rows arrive
+    "maintain-security-log-partitions": {
+        "task": "app.tasks.maintain_security_log_partitions",
+        "schedule": 24 * 60 * 60.0,
+    },
+
+    # correct any drift in the incrementally maintained admin counters
+    "reconcile-admin-stats": {
+        "task": "app.tasks.reconcile_admin_stats",
+        "schedule": 15 * 60.0,
+    },
+}
+
 
 # =====================================================
 # CORS (for frontend)
@@ -362,6 +828,11 @@ CELERY_RESULT_SERIALIZER = "json"
 
 CORS_ALLOW_CREDENTIALS = True
 
+# keyset pagination cursor for list endpoints that return bare arrays
+CORS_EXPOSE_HEADERS = [
+    "X-Next-Cursor",
+]
+
 if DEBUG:
     CORS_ALLOW_ALL_ORIGINS = True
 else:
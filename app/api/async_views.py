@@ -0,0 +1,173 @@
+# app/api/async_views.py
+"""Async (ASGI) variants of the hot user-facing endpoints, mounted under /api/async/.
+
+They share validation and response shapes with the DRF views in views.py
+but read through Django's async ORM, so a uvicorn worker keeps serving
+other requests while one is waiting on the database or on Cashfree.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from app.models import Investment, UserProfile
+from app.services import cashfree_va, cashfree_webhook, idempotency, order_ids, profile_cache, va_pool
+from .authentication import SignedTokenAuthentication, TokenUser
+from .serializers import UserProfileSerializer, UserProfileHistorySerializer
+from .views import (
+    create_virtual_account, process_webhook_inbox,
+    parse_investment, needs_virtual_account,
+    record_investment, transaction_status, TRANSACTION_FIELDS,
+)
+
+
+def _csrf_failure(request):
+    # DRF only enforces CSRF for session-authenticated calls; mirror that
+    check = CsrfViewMiddleware(lambda req: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+async def aget_profile(request, enforce_csrf=False, fresh=False):
+    """(profile or None, error response or None): Bearer token first, then the session."""
+    auth = SignedTokenAuthentication().authenticate(request)
+    if auth and isinstance(auth[0], TokenUser) and auth[0].profile_id:
+        return await profile_cache.aget_profile(auth[0].profile_id, fresh=fresh), None
+    email = await request.session.aget('user_email')
+    if not email:
+        return None, None
+    if enforce_csrf:
+        failure = _csrf_failure(request)
+        if failure is not None:
+            return None, JsonResponse({'error': 'CSRF Failed'}, status=403)
+    try:
+        return await UserProfile.objects.select_related('kyc').aget(email=email), None
+    except UserProfile.DoesNotExist:
+        return None, None
+
+
+def _json_body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@require_GET
+async def profile_view(request):
+    profile, _ = await aget_profile(request)
+    if not profile:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+    if request.GET.get('include') == 'history':
+        data = await sync_to_async(lambda: UserProfileHistorySerializer(profile).data)()
+    else:
+        data = UserProfileSerializer(profile).data
+    return JsonResponse(data)
+
+
+@csrf_exempt
+@require_POST
+async def invest_view(request):
+    profile, error = await aget_profile(request, enforce_csrf=True, fresh=True)
+    if error:
+        return error
+    if not profile:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+    if profile.kyc_status != 'Verified':
+        return JsonResponse({'error': 'KYC verification required'}, status=403)
+
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    try:
+        amount, payment_method, request_va = parse_investment(data)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    # a due lease renewal goes to the sync thread; otherwise no blocking call
+    order_id = await order_ids.anew_order_id()
+    virtual_account = None
+    if needs_virtual_account(amount, payment_method, request_va):
+        virtual_account = await sync_to_async(va_pool.claim)(order_id)
+        if virtual_account is None:
+            # the gateway call runs on the thread pool, not the shared sync thread,
+            # so slow Cashfree responses never serialize other requests
+            virtual_account = await sync_to_async(create_virtual_account, thread_sensitive=False)(
+                **cashfree_va.details_for(profile, order_id)
+            )
+
+    # create + counter bump must share a transaction, which the async ORM cannot open
+    body = await sync_to_async(record_investment)(
+        profile, amount, order_id, payment_method, virtual_account,
+    )
+    return JsonResponse(body)
+
+
+@require_GET
+async def check_transaction_view(request, order_id):
+    profile, _ = await aget_profile(request)
+    if not profile:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+    inv = await (
+        Investment.objects.filter(order_id=order_id, user_id=profile.id)
+        .values(*TRANSACTION_FIELDS).afirst()
+    )
+    if inv is None:
+        return JsonResponse({'error': 'Order not found'}, status=404)
+    return JsonResponse(transaction_status(inv))
+
+
+async def _enqueue_drain():
+    try:
+        enqueue = getattr(process_webhook_inbox, 'delay', process_webhook_inbox)
+        await sync_to_async(enqueue)()
+    except Exception as e:
+        # the event is durable; the periodic drain will pick it up
+        print(f'[Webhook] drain enqueue skipped: {e}')
+
+
+@csrf_exempt
+@require_POST
+async def cashfree_webhook_view(request):
+    raw_body = request.body
+    signature = request.headers.get('x-webhook-signature')
+    timestamp = request.headers.get('x-webhook-timestamp')
+
+    if not await idempotency.atimestamp_is_fresh(timestamp):
+        return JsonResponse({'error': 'Stale timestamp'}, status=401)
+
+    sig_key = idempotency.signature_key(signature, timestamp)
+    if await idempotency.aseen(sig_key):
+        return JsonResponse({'status': 'duplicate'})
+
+    if not cashfree_webhook.verify_signature(raw_body, signature, timestamp):
+        print('[Webhook] Invalid signature')
+        return JsonResponse({'error': 'Invalid signature'}, status=401)
+
+    data = _json_body(request)
+    if data is None:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    event = cashfree_webhook.parse_event(data)
+    if not event['order_id']:
+        print('[Webhook] No order_id:', data)
+        return JsonResponse({'status': 'ignored'})
+
+    evt_key = idempotency.event_key(cashfree_webhook.dedup_key(event))
+    if await idempotency.aseen(evt_key):
+        await idempotency.aremember(sig_key)
+        return JsonResponse({'status': 'duplicate', 'order_id': event['order_id']})
+    await idempotency.abump('misses')
+
+    _, created = await cashfree_webhook.arecord_event(event, data)
+    await idempotency.aremember(sig_key, evt_key)
+    if created:
+        await _enqueue_drain()
+    return JsonResponse({
+        'status': 'queued' if created else 'duplicate',
+        'order_id': event['order_id'],
+    })
@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core import signing
+from rest_framework.authentication import BaseAuthentication
+
+from app.services import profile_cache
+
+TOKEN_SALT = 'ankuon.access'
+
+
+def issue_token(profile=None, admin_email=None):
+    """Signed (HMAC-SHA256 over SECRET_KEY), timestamped access token.
+
+    The KYC claim is tagged with the profile's shared version token, so it
+    lapses as soon as the profile (and its KYC status) changes.
+    """
+    payload = {}
+    if profile is not None:
+        payload['pid'] = profile.id
+        payload['kyc'] = profile.kyc_status
+        payload['kv'] = profile_cache.current_version(profile.id)
+    if admin_email:
+        payload['adm'] = admin_email
+    return signing.dumps(payload, salt=TOKEN_SALT)
+
+
+def read_token(token):
+    return signing.loads(
+        token,
+        salt=TOKEN_SALT,
+        max_age=getattr(settings, 'ACCESS_TOKEN_MAX_AGE', 60 * 60),
+    )
+
+
+class TokenUser:
+    """Request principal resolved from an access token (no DB access)."""
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, payload):
+        self.profile_id = payload.get('pid')
+        self.admin_email = payload.get('adm')
+        self._kyc = payload.get('kyc')
+        self._kyc_version = payload.get('kv')
+
+    @property
+    def kyc_status(self):
+        """The token's KYC claim while the profile is unchanged since issue, else None."""
+        if self._kyc is None or self.profile_id is None:
+            return None
+        if profile_cache.current_version(self.profile_id) != self._kyc_version:
+            return None  # stale: read the profile instead
+        return self._kyc
+
+    def __str__(self):
+        return self.admin_email or f'profile:{self.profile_id}'
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """``Authorization: Bearer <token>``.
+
+    Invalid or expired tokens are ignored rather than rejected so that the
+    session fallback in ``get_profile``/``is_admin`` still applies.
+    """
+
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        parts = header.split()
+        if len(parts) != 2 or parts[0] != self.keyword:
+            return None
+        try:
+            payload = read_token(parts[1])
+        except signing.BadSignature:
+            return None
+        return TokenUser(payload), parts[1]
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,100 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+
+from app.services import metrics, replica
+
+
+class MetricsMiddleware:
+    """Latency, DB query count/time and response size of every /api/ route.
+
+    Requests are labelled with the URL pattern (``api/admin/users/<int:user_id>/``),
+    not the path, so the series stay bounded. Streamed responses are
+    recorded once their body has been sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = metrics.enabled()
+        if self.enabled:
+            metrics.install()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        started = time.perf_counter()
+        db = metrics.start_request()
+        return self._finish(request, self.get_response(request), started, db)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        db = metrics.start_request()
+        return self._finish(request, await self.get_response(request), started, db)
+
+    def _finish(self, request, response, started, db):
+        route = getattr(request.resolver_match, 'route', None)
+        if not route or not route.startswith('api/'):
+            metrics.discard_request()
+            return response
+        record = (route, request.method, response.status_code, started, db)
+        if not response.streaming:
+            metrics.finish_request(*record, size=len(response.content))
+        elif not response.is_async:
+            response.streaming_content = self._counted(response.streaming_content, record)
+        else:
+            metrics.finish_request(*record)
+        return response
+
+    @staticmethod
+    def _counted(chunks, record):
+        size = 0
+        try:
+            for chunk in chunks:
+                size += len(chunk)
+                yield chunk
+        finally:
+            metrics.finish_request(*record, size=size)
+
+
+class ReplicaMiddleware:
+    """Per-request read-replica state; see app.services.replica.
+
+    Sits outside SessionMiddleware so a session saved by the request also
+    counts as a write. Streamed bodies are read after the state is gone,
+    so their querysets must pick a database up front (see exports.stream).
+    Unused without DATABASE_REPLICA_URL.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica.configured():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = replica.start_request(request)
+        try:
+            return self.get_response(request)
+        finally:
+            replica.finish_request(token)
+
+    async def __acall__(self, request):
+        token = replica.start_request(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            replica.finish_request(token)
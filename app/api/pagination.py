@@ -0,0 +1,44 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def encode_cursor(value, pk):
+    raw = f'{value.isoformat()}|{pk}'.encode('utf-8')
+    return urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    value, pk = urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').split('|', 1)
+    return datetime.fromisoformat(value), int(pk)
+
+
+def parse_limit(raw):
+    try:
+        limit = int(raw)
+    except (TypeError, ValueError):
+        return DEFAULT_LIMIT
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def keyset_page(qs, field, cursor=None, limit=DEFAULT_LIMIT):
+    """Newest-first page of ``qs`` keyed on (field, id).
+
+    Returns (rows, next_cursor); raises ValueError for a malformed cursor.
+    """
+    qs = qs.order_by(f'-{field}', '-id')
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        qs = qs.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'id__lt': pk}))
+    rows = list(qs[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.id)
+    return rows, next_cursor
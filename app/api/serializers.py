@@ -18,15 +18,13 @@ class UserProfileSerializer(serializers.ModelSerializer):
     kycStatus = serializers.CharField(source='kyc_status')
     twoFactorEnabled = serializers.BooleanField(source='two_factor_enabled')
     lastLogin = serializers.DateTimeField(source='last_login')
-    investments = serializers.SerializerMethodField()
-    withdrawals = serializers.SerializerMethodField()
 
     class Meta:
         model = UserProfile
         fields = [
             'email', 'name', 'upi_id', 'mobile', 'kycStatus',
             'verified', 'twoFactorEnabled', 'lastLogin',
-            'kyc', 'kycData', 'investments', 'withdrawals'
+            'kyc', 'kycData',
         ]
 
     def get_kycData(self, obj):
@@ -34,6 +32,15 @@ class UserProfileSerializer(serializers.ModelSerializer):
             return KycSerializer(obj.kyc).data
         return None
 
+
+class UserProfileHistorySerializer(UserProfileSerializer):
+    """Full profile shape with the complete investment/withdrawal history."""
+    investments = serializers.SerializerMethodField()
+    withdrawals = serializers.SerializerMethodField()
+
+    class Meta(UserProfileSerializer.Meta):
+        fields = UserProfileSerializer.Meta.fields + ['investments', 'withdrawals']
+
     def get_investments(self, obj):
         return InvestmentSerializer(obj.investments.all().order_by('-date'), many=True).data
 
@@ -3,17 +3,23 @@ from .views import (
     SendOTPView, VerifyOTPView, InvestView, CheckTransactionView,
     WithdrawView, CancelWithdrawalView, UpdateProfileView,
     KycVerificationView, ProfileView, CashfreeWebhookView,
-    AdminLoginView, AdminStatsView, AdminSearchUsersView,
-    AdminUserDetailView, AdminUserInvestmentsView, AdminUserWithdrawalsView,
+    InvestmentListView, WithdrawalListView,
+    AdminLoginView, AdminStatsView, AdminStatsSeriesView, AdminSearchUsersView,
+    AdminWebhookInboxView, AdminVAPoolView, MetricsView,
+    AdminUserDetailView, AdminUserInvestmentsView, AdminUserWithdrawalsView, AdminExportView,
     AdminPendingWithdrawalsView, AdminProcessWithdrawalView,
     AdminRejectWithdrawalView, AdminPendingBankTransfersView,
-    AdminConfirmBankTransferView,
+    AdminConfirmBankTransferView, AdminBulkConfirmBankTransfersView,
+    AdminBulkProcessWithdrawalsView, AdminBulkRejectWithdrawalsView,
 )
+from . import async_views
 
 urlpatterns = [
     path('send-otp/', SendOTPView.as_view()),
     path('verify-otp/', VerifyOTPView.as_view()),
     path('profile/', ProfileView.as_view()),
+    path('investments/', InvestmentListView.as_view()),
+    path('withdrawals/', WithdrawalListView.as_view()),
     path('invest/', InvestView.as_view()),
     path('check-transaction/<str:order_id>/', CheckTransactionView.as_view()),
     path('withdraw/', WithdrawView.as_view()),
@@ -22,15 +28,29 @@ urlpatterns = [
     path('kyc-verification/', KycVerificationView.as_view()),
     path('webhooks/cashfree/', CashfreeWebhookView.as_view()),
 
+    # ASGI variants of the hot user endpoints (serve with uvicorn)
+    path('async/profile/', async_views.profile_view),
+    path('async/invest/', async_views.invest_view),
+    path('async/check-transaction/<str:order_id>/', async_views.check_transaction_view),
+    path('async/webhooks/cashfree/', async_views.cashfree_webhook_view),
+
     path('admin/login/', AdminLoginView.as_view()),
     path('admin/stats/', AdminStatsView.as_view()),
+    path('admin/stats/series/', AdminStatsSeriesView.as_view()),
+    path('admin/webhooks/inbox/', AdminWebhookInboxView.as_view()),
+    path('admin/va-pool/', AdminVAPoolView.as_view()),
+    path('metrics/', MetricsView.as_view()),
     path('admin/users/', AdminSearchUsersView.as_view()),
     path('admin/users/<int:user_id>/', AdminUserDetailView.as_view()),
     path('admin/users/<int:user_id>/investments/', AdminUserInvestmentsView.as_view()),
     path('admin/users/<int:user_id>/withdrawals/', AdminUserWithdrawalsView.as_view()),
+    path('admin/exports/<slug:dataset>.<slug:fmt>', AdminExportView.as_view()),
     path('admin/withdrawals/', AdminPendingWithdrawalsView.as_view()),
+    path('admin/withdrawals/bulk-process/', AdminBulkProcessWithdrawalsView.as_view()),
+    path('admin/withdrawals/bulk-reject/', AdminBulkRejectWithdrawalsView.as_view()),
     path('admin/withdrawals/<int:withdrawal_id>/process/', AdminProcessWithdrawalView.as_view()),
     path('admin/withdrawals/<int:withdrawal_id>/reject/', AdminRejectWithdrawalView.as_view()),
     path('admin/investments/', AdminPendingBankTransfersView.as_view()),
+    path('admin/investments/bulk-confirm/', AdminBulkConfirmBankTransfersView.as_view()),
     path('admin/investments/<int:investment_id>/confirm/', AdminConfirmBankTransferView.as_view()),
 ]
@@ -2,26 +2,32 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
-from django.db import models
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from datetime import timedelta
-import random
-import hmac
-import hashlib
-import base64
+from decimal import Decimal, InvalidOperation
+import csv
 import json
 import traceback
 
-from .serializers import UserProfileSerializer, InvestmentSerializer, WithdrawalSerializer
-from app.models import UserProfile, Investment, Withdrawal, Kyc, SecurityLog
-
-try:
-    from app.services.cashfree_va import create_virtual_account
-except ImportError:
-    def create_virtual_account(*args, **kwargs):
-        return None
+from .serializers import (
+    UserProfileSerializer, UserProfileHistorySerializer,
+    InvestmentSerializer, WithdrawalSerializer,
+)
+from .pagination import keyset_page, parse_limit
+from .authentication import TokenUser, issue_token
+from app.models import UserProfile, Investment, Withdrawal, Kyc, PortfolioBalance, PooledVirtualAccount
+from app.services import (
+    accrual, portfolio, cashfree_webhook, idempotency, bulk_admin, stats, user_search,
+    profile_cache, otp as otp_service, cashfree_va, va_pool, order_ids, ledger,
+    security_log, exports, metrics, replica,
+)
+
+from app.services.cashfree_va import create_virtual_account
 
 try:
     from app.tasks import send_otp_email
@@ -29,8 +35,17 @@ except ImportError:
     def send_otp_email(email, otp):
         print(f'[OTP] {email}: {otp}')
 
+try:
+    from app.tasks import process_webhook_inbox
+except ImportError:
+    process_webhook_inbox = cashfree_webhook.drain_inbox
 
-def get_profile(request):
+
+def get_profile(request, fresh=False):
+    """Caller's profile; ``fresh`` bypasses the profile cache for money-moving views."""
+    user = request.user
+    if isinstance(user, TokenUser) and user.profile_id:
+        return profile_cache.get_profile(user.profile_id, fresh=fresh)
     email = request.session.get('user_email')
     if not email:
         return None
@@ -40,6 +55,13 @@ def get_profile(request):
         return None
 
 
+def profile_data(request, profile):
+    """Lightweight profile unless the caller asks for ?include=history."""
+    if request.query_params.get('include') == 'history':
+        return UserProfileHistorySerializer(profile).data
+    return UserProfileSerializer(profile).data
+
+
 # ==================== USER ====================
 
 class SendOTPView(APIView):
@@ -50,16 +72,15 @@ class SendOTPView(APIView):
             if not email or not name:
                 return Response({'error': 'Email and name required'}, status=400)
 
-            profile, _ = UserProfile.objects.get_or_create(
-                email=email,
-                defaults={'name': name},
-            )
-            if name and profile.name != name:
-                profile.name = name
-
-            otp = str(random.randint(100000, 999999))
-            profile.otp = otp
-            profile.save()
+            try:
+                otp = otp_service.get_store().issue(email, name)
+            except otp_service.RateLimited as e:
+                return Response({
+                    'error': 'Too many OTP requests. Please try again later.',
+                    'retryAfter': e.retry_after,
+                }, status=429, headers={'Retry-After': str(e.retry_after)})
+            except otp_service.StoreUnavailable:
+                return Response({'error': 'OTP service unavailable. Please try again shortly.'}, status=503)
 
             print(f'[DEMO OTP] {email}: {otp}')
 
@@ -85,24 +106,42 @@ class VerifyOTPView(APIView):
     def post(self, request):
         email = (request.data.get('email') or '').strip().lower()
         otp = (request.data.get('otp') or '').strip()
-        try:
-            profile = UserProfile.objects.select_related('kyc').get(email=email)
-            if profile.otp != otp:
-                return Response({'error': 'Invalid OTP'}, status=400)
+        if not email or not otp:
+            return Response({'error': 'Email and OTP required'}, status=400)
 
-            profile.verified = True
-            profile.otp = None
-            profile.last_login = timezone.now()
-            profile.save()
-            request.session['user_email'] = email
-            SecurityLog.objects.create(user=profile, action='LOGIN')
+        try:
+            outcome, name = otp_service.get_store().verify(email, otp)
+        except otp_service.StoreUnavailable:
+            return Response({'error': 'OTP service unavailable. Please try again shortly.'}, status=503)
+        if outcome == otp_service.INVALID:
+            return Response({'error': 'Invalid OTP'}, status=400)
+        if outcome == otp_service.LOCKED:
+            return Response({'error': 'Too many attempts. Please request a new OTP.'}, status=429)
+        if outcome != otp_service.OK:
+            return Response({'error': 'OTP expired. Please request a new one.'}, status=400)
+
+        profile, created = UserProfile.objects.select_related('kyc').get_or_create(
+            email=email,
+            defaults={'name': name or email.split('@')[0]},
+        )
+        if created:
+            stats.user_created()
+        fields = ['verified', 'last_login']
+        if name and profile.name != name:
+            profile.name = name
+            fields.append('name')
+        profile.verified = True
+        profile.last_login = timezone.now()
+        profile.save(update_fields=fields)
+        profile_cache.invalidate(profile)
+        request.session['user_email'] = email
+        security_log.record(profile, 'LOGIN')
 
-            return Response({
-                'message': 'Verified',
-                'user': UserProfileSerializer(profile).data
-            }, status=200)
-        except UserProfile.DoesNotExist:
-            return Response({'error': 'User not found'}, status=404)
+        return Response({
+            'message': 'Verified',
+            'token': issue_token(profile),
+            'user': profile_data(request, profile)
+        }, status=200)
 
 
 class ProfileView(APIView):
@@ -110,90 +149,223 @@ class ProfileView(APIView):
         profile = get_profile(request)
         if not profile:
             return Response({'error': 'Unauthorized'}, status=401)
-        return Response(UserProfileSerializer(profile).data, status=200)
+        return Response(profile_data(request, profile), status=200)
+
+
+class InvestmentListView(APIView):
+    def get(self, request):
+        profile = get_profile(request)
+        if not profile:
+            return Response({'error': 'Unauthorized'}, status=401)
+        try:
+            rows, next_cursor = keyset_page(
+                Investment.objects.filter(user=profile),
+                'date',
+                cursor=request.GET.get('cursor'),
+                limit=parse_limit(request.GET.get('limit')),
+            )
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=400)
+        data = {
+            'results': InvestmentSerializer(rows, many=True).data,
+            'next': next_cursor,
+        }
+        if not request.GET.get('cursor'):
+            # whole-history totals for the dashboard summary, on the first page only
+            balance = PortfolioBalance.objects.filter(user=profile).first() or PortfolioBalance()
+            data['totals'] = {
+                'invested': str(balance.confirmed_principal),
+                'returns': str(balance.accrued_returns),
+                'available': str(balance.available_balance),
+            }
+        return Response(data, status=200)
+
+
+class WithdrawalListView(APIView):
+    def get(self, request):
+        profile = get_profile(request)
+        if not profile:
+            return Response({'error': 'Unauthorized'}, status=401)
+        try:
+            rows, next_cursor = keyset_page(
+                Withdrawal.objects.filter(user=profile),
+                'requested',
+                cursor=request.GET.get('cursor'),
+                limit=parse_limit(request.GET.get('limit')),
+            )
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=400)
+        return Response({
+            'results': WithdrawalSerializer(rows, many=True).data,
+            'next': next_cursor,
+        }, status=200)
+
+
+def parse_investment(data):
+    """(amount, payment_method, request_va) from an invest payload; ValueError on bad input."""
+    amount = data.get('amount')
+    payment_method = (
+        data.get('payment_method')
+        or data.get('paymentMethod')
+        or 'bank'
+    )
+    request_va = data.get('requestVirtualAccount', True)
+
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid amount')
+
+    if amount < 10000:
+        raise ValueError('Minimum amount is ₹10,000')
+    if amount > 10000000:
+        raise ValueError('Maximum amount is ₹1 Crore')
+    return amount, payment_method, request_va
+
+
+def parse_withdrawal_amount(value):
+    """Decimal rupee amount of a withdrawal request, None when omitted; ValueError on bad input."""
+    if value in (None, ''):
+        return None
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError('Invalid amount')
+    # Decimal accepts 'nan' and 'inf'; a negative amount would credit the balance
+    if not amount.is_finite() or amount.quantize(Decimal('0.01')) <= 0:
+        raise ValueError('Invalid amount')
+    return amount.quantize(Decimal('0.01'))
+
+
+def withdrawable(investment):
+    """What is left of ``investment`` after its pending and completed withdrawals."""
+    taken = (
+        Withdrawal.objects.filter(investment=investment, status__in=accrual.OPEN_WITHDRAWALS)
+        .aggregate(total=Sum('amount'))['total']
+    )
+    return investment.amount + investment.returns - (taken or 0)
+
+
+def new_order_id():
+    return order_ids.new_order_id()
+
+
+def needs_virtual_account(amount, payment_method, request_va):
+    return payment_method == 'bank' and bool(request_va or amount > 500000)
+
+
+ORDER_ID_ATTEMPTS = 3
+
+
+def _reissue_order_id(order_id, va_id, virtual_account, va_pending):
+    """A fresh order id (and VA details) after ``order_id`` turned out to be taken."""
+    fresh = new_order_id()
+    print(f'[Invest] order id {order_id} already used, retrying as {fresh}')
+    if va_pending:
+        virtual_account = cashfree_va.pending(fresh, virtual_account.get('reason', ''))
+    elif va_id:
+        PooledVirtualAccount.objects.filter(va_id=va_id, order_id=order_id).update(order_id=fresh)
+    return fresh, virtual_account
+
+
+def record_investment(profile, amount, order_id, payment_method, virtual_account):
+    status_value = 'Pending Bank Transfer' if payment_method == 'bank' else 'Pending'
+    va_pending = cashfree_va.is_pending(virtual_account)
+    va_id = virtual_account['vAccountId'] if virtual_account and not va_pending else None
+    try:
+        for attempt in range(ORDER_ID_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    Investment.objects.create(
+                        user=profile,
+                        amount=amount,
+                        order_id=order_id,
+                        status=status_value,
+                        payment_method=payment_method,
+                        virtual_account=virtual_account,
+                        va_id=va_id,
+                    )
+                    stats.investment_created(status_value)
+                    if va_pending:
+                        cashfree_va.defer(order_id)
+                break
+            except IntegrityError:
+                # two nodes minted the same id (clock skew, reused node): take another
+                if attempt + 1 == ORDER_ID_ATTEMPTS or not Investment.objects.filter(order_id=order_id).exists():
+                    raise
+                order_id, virtual_account = _reissue_order_id(order_id, va_id, virtual_account, va_pending)
+    except Exception:
+        if va_id:
+            va_pool.release(va_id)
+        raise
+
+    data = {
+        'orderId': order_id,
+        'order_id': order_id,
+        'status': status_value,
+    }
+    if virtual_account:
+        data['virtualAccount'] = virtual_account
+    return data
 
 
 class InvestView(APIView):
     def post(self, request):
-        profile = get_profile(request)
+        profile = get_profile(request, fresh=True)
         if not profile:
             return Response({'error': 'Unauthorized'}, status=401)
         if profile.kyc_status != 'Verified':
             return Response({'error': 'KYC verification required'}, status=403)
 
-        amount = request.data.get('amount')
-        payment_method = (
-            request.data.get('payment_method')
-            or request.data.get('paymentMethod')
-            or 'bank'
-        )
-        request_va = request.data.get('requestVirtualAccount', True)
-
         try:
-            amount = float(amount)
-        except (TypeError, ValueError):
-            return Response({'error': 'Invalid amount'}, status=400)
+            amount, payment_method, request_va = parse_investment(request.data)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
 
-        if amount < 10000:
-            return Response({'error': 'Minimum amount is ₹10,000'}, status=400)
-        if amount > 10000000:
-            return Response({'error': 'Maximum amount is ₹1 Crore'}, status=400)
-
-        order_id = f"AO2-{timezone.now().strftime('%Y%m%d')}-{random.randint(10000, 99999)}"
+        order_id = new_order_id()
         virtual_account = None
-        status_value = 'Pending'
-
-        if payment_method == 'bank':
-            status_value = 'Pending Bank Transfer'
-            if request_va or amount > 500000:
-                kyc = getattr(profile, 'kyc', None)
-                virtual_account = create_virtual_account(
-                    order_id=order_id,
-                    name=profile.name,
-                    email=profile.email,
-                    phone=getattr(kyc, 'mobile', None) or profile.mobile,
-                    pan=getattr(kyc, 'pan', None),
-                    aadhaar=getattr(kyc, 'aadhaar', None),
-                )
-
-        Investment.objects.create(
-            user=profile,
-            amount=amount,
-            order_id=order_id,
-            status=status_value,
-            payment_method=payment_method,
-            virtual_account=virtual_account,
-        )
+        if needs_virtual_account(amount, payment_method, request_va):
+            virtual_account = (
+                va_pool.claim(order_id)
+                or create_virtual_account(**cashfree_va.details_for(profile, order_id))
+            )
 
-        data = {
-            'orderId': order_id,
-            'order_id': order_id,
-            'status': status_value,
-        }
-        if virtual_account:
-            data['virtualAccount'] = virtual_account
+        data = record_investment(profile, amount, order_id, payment_method, virtual_account)
         return Response(data, status=200)
 
 
+TRANSACTION_FIELDS = ('order_id', 'status', 'virtual_account')
+
+
+def transaction_status(inv):
+    data = {
+        'order_id': inv['order_id'],
+        'status': inv['status'],
+        'order_status': 'PAID' if inv['status'] == 'Confirmed' else inv['status'],
+    }
+    # a VA that was pending at invest time shows up here once created
+    if inv.get('virtual_account'):
+        data['virtualAccount'] = inv['virtual_account']
+    return data
+
+
 class CheckTransactionView(APIView):
     def get(self, request, order_id):
         profile = get_profile(request)
         if not profile:
             return Response({'error': 'Unauthorized'}, status=401)
-        try:
-            inv = Investment.objects.get(order_id=order_id, user=profile)
-            return Response({
-                'order_id': inv.order_id,
-                'status': inv.status,
-                'order_status': 'PAID' if inv.status == 'Confirmed' else inv.status,
-            }, status=200)
-        except Investment.DoesNotExist:
+        inv = (
+            Investment.objects.filter(order_id=order_id, user=profile)
+            .values(*TRANSACTION_FIELDS).first()
+        )
+        if inv is None:
             return Response({'error': 'Order not found'}, status=404)
+        return Response(transaction_status(inv), status=200)
 
 
 class WithdrawView(APIView):
     def post(self, request):
-        profile = get_profile(request)
+        profile = get_profile(request, fresh=True)
         if not profile:
             return Response({'error': 'Unauthorized'}, status=401)
         if profile.kyc_status != 'Verified':
@@ -215,23 +387,31 @@ class WithdrawView(APIView):
             return Response({'error': 'Only confirmed investments can be withdrawn'}, status=400)
 
         try:
-            amount = float(amount)
-        except (TypeError, ValueError):
-            amount = float(investment.amount + investment.returns)
-
-        if amount > float(investment.amount + investment.returns):
-            return Response({'error': 'Insufficient balance'}, status=400)
-
-        wd = Withdrawal.objects.create(
-            user=profile,
-            investment=investment,
-            amount=amount,
-            processing_end=timezone.now() + timedelta(days=3),
-            bank_account=kyc.bank_account,
-            ifsc=kyc.ifsc,
-            account_name=kyc.account_name or profile.name,
-            method='NEFT/RTGS/IMPS',
-        )
+            amount = parse_withdrawal_amount(amount)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        with transaction.atomic():
+            # the balance row lock serializes concurrent requests for this user
+            portfolio.locked_balance(profile.id)
+            remaining = withdrawable(investment)
+            if amount is None:
+                amount = remaining
+            if amount <= 0 or amount > remaining or amount > ledger.balance(profile.id)['available']:
+                return Response({'error': 'Insufficient balance'}, status=400)
+            wd = Withdrawal.objects.create(
+                user=profile,
+                investment=investment,
+                amount=amount,
+                processing_end=timezone.now() + timedelta(days=3),
+                bank_account=kyc.bank_account,
+                ifsc=kyc.ifsc,
+                account_name=kyc.account_name or profile.name,
+                method='NEFT/RTGS/IMPS',
+            )
+            portfolio.withdrawal_requested(profile.id, amount)
+            ledger.withdrawal_requested(profile.id, amount, wd.id)
+            stats.withdrawal_requested()
         return Response({
             'message': 'Withdrawal requested',
             'withdrawal': WithdrawalSerializer(wd).data
@@ -250,7 +430,15 @@ class CancelWithdrawalView(APIView):
                 return Response({'error': 'Cannot cancel'}, status=400)
             if wd.status != 'Pending':
                 return Response({'error': 'Only pending can be cancelled'}, status=400)
-            wd.delete()
+            with transaction.atomic():
+                # kept as Cancelled so the ledger history can be replayed
+                cancelled = Withdrawal.objects.filter(id=wd.id, status='Pending').update(
+                    status='Cancelled', notes='Cancelled by user',
+                )
+                if cancelled:
+                    portfolio.withdrawal_cancelled(profile.id, wd.amount)
+                    ledger.withdrawals_cancelled([(profile.id, wd.amount, wd.id)])
+                    stats.withdrawals_closed([wd.amount], completed=False)
             return Response({'message': 'Withdrawal cancelled'}, status=200)
         except Withdrawal.DoesNotExist:
             return Response({'error': 'Not found'}, status=404)
@@ -268,9 +456,10 @@ class UpdateProfileView(APIView):
         if upi_id:
             profile.upi_id = upi_id.strip()
         profile.save()
+        profile_cache.invalidate(profile)
         return Response({
             'message': 'Profile updated',
-            'user': UserProfileSerializer(profile).data
+            'user': profile_data(request, profile)
         }, status=200)
 
 
@@ -311,6 +500,7 @@ class KycVerificationView(APIView):
             kyc.mobile = mobile
             profile.mobile = mobile
             profile.save()
+            profile_cache.invalidate(profile)
 
         if request.data.get('aadhaarMobileLinked') or request.data.get('otp_verified'):
             kyc.aadhaar_mobile_linked = True
@@ -331,6 +521,7 @@ class KycVerificationView(APIView):
             kyc.verified_at = timezone.now()
             profile.kyc_status = 'Verified'
             profile.save()
+            profile_cache.invalidate(profile)
             kyc.banks = [{
                 'id': 1,
                 'bankAccount': kyc.bank_account,
@@ -338,16 +529,14 @@ class KycVerificationView(APIView):
                 'accountName': kyc.account_name,
                 'isPrimary': True,
             }]
-            SecurityLog.objects.create(
-                user=profile,
-                action='KYC_VERIFIED',
-                detail='Aadhaar + Bank',
-            )
+            security_log.record(profile, 'KYC_VERIFIED', 'Aadhaar + Bank')
 
         kyc.save()
+        profile_cache.invalidate(profile)
         return Response({
             'message': 'KYC updated',
-            'user': UserProfileSerializer(profile).data,
+            'token': issue_token(profile),
+            'user': profile_data(request, profile),
             'kycStatus': profile.kyc_status,
         }, status=200)
 
@@ -368,7 +557,15 @@ class CashfreeWebhookView(APIView):
             or request.headers.get('X-Webhook-Timestamp')
         )
 
-        if not self._verify_signature(raw_body, signature, timestamp):
+        if not idempotency.timestamp_is_fresh(timestamp):
+            return Response({'error': 'Stale timestamp'}, status=401)
+
+        # Cashfree retries resend the same signed delivery: answer from cache
+        sig_key = idempotency.signature_key(signature, timestamp)
+        if idempotency.seen(sig_key):
+            return Response({'status': 'duplicate'}, status=200)
+
+        if not cashfree_webhook.verify_signature(raw_body, signature, timestamp):
             print('[Webhook] Invalid signature')
             return Response({'error': 'Invalid signature'}, status=401)
 
@@ -381,91 +578,36 @@ class CashfreeWebhookView(APIView):
         except Exception:
             data = request.data
 
-        event_type = data.get('type') or data.get('event') or ''
-        print(f'[Webhook] type={event_type}')
-
-        order_id = None
-        utr = None
-        amount = None
-
-        if event_type in ('PAYMENT_SUCCESS_WEBHOOK', 'PAYMENT_SUCCESS'):
-            payload = data.get('data') or {}
-            order = payload.get('order') or {}
-            payment = payload.get('payment') or {}
-            order_id = order.get('order_id') or payment.get('order_id')
-            utr = payment.get('bank_reference') or payment.get('cf_payment_id')
-            amount = order.get('order_amount') or payment.get('payment_amount')
-
-        if not order_id:
-            payload = data.get('data') or data
-            payment = payload.get('payment') or {}
-            vba = (payment.get('payment_method') or {}).get('vba_transfer') or {}
-            order = payload.get('order') or {}
-            order_id = (
-                order.get('order_id')
-                or vba.get('vaccount_id')
-                or data.get('vAccountId')
-                or data.get('order_id')
-                or data.get('orderId')
-            )
-            utr = utr or vba.get('utr') or payment.get('bank_reference') or data.get('utr')
-            amount = amount or payment.get('payment_amount') or data.get('amount')
+        event = cashfree_webhook.parse_event(data)
+        print(f"[Webhook] type={event['event_type']}")
 
-        if not order_id:
+        if not event['order_id']:
             print('[Webhook] No order_id:', data)
             return Response({'status': 'ignored'}, status=200)
 
-        updated = self._confirm_investment(order_id, utr, amount)
-        print(f'[Webhook] order={order_id} utr={utr} updated={updated}')
+        evt_key = idempotency.event_key(cashfree_webhook.dedup_key(event))
+        if idempotency.seen(evt_key):
+            idempotency.remember(sig_key)
+            return Response({'status': 'duplicate', 'order_id': event['order_id']}, status=200)
+        idempotency.bump('misses')
+
+        _, created = cashfree_webhook.record_event(event, data)
+        idempotency.remember(sig_key, evt_key)
+        if created:
+            try:
+                if hasattr(process_webhook_inbox, 'delay'):
+                    process_webhook_inbox.delay()
+                else:
+                    process_webhook_inbox()
+            except Exception as e:
+                # the event is durable; the periodic drain will pick it up
+                print(f'[Webhook] drain enqueue skipped: {e}')
+        print(f"[Webhook] order={event['order_id']} utr={event['utr']} queued={created}")
         return Response({
-            'status': 'ok',
-            'order_id': order_id,
-            'updated': updated,
+            'status': 'queued' if created else 'duplicate',
+            'order_id': event['order_id'],
         }, status=200)
 
-    def _verify_signature(self, raw_body, signature, timestamp):
-        secret = getattr(settings, 'CASHFREE_SECRET_KEY', '') or ''
-        if not secret:
-            return getattr(settings, 'DEBUG', False)
-        if not signature or not timestamp:
-            return getattr(settings, 'DEBUG', False)
-        try:
-            body_str = (
-                raw_body.decode('utf-8')
-                if isinstance(raw_body, bytes)
-                else (raw_body if isinstance(raw_body, str) else json.dumps(raw_body))
-            )
-            signed_payload = f'{timestamp}{body_str}'
-            computed = base64.b64encode(
-                hmac.new(
-                    secret.encode('utf-8'),
-                    signed_payload.encode('utf-8'),
-                    hashlib.sha256,
-                ).digest()
-            ).decode('utf-8')
-            return hmac.compare_digest(computed, signature)
-        except Exception as e:
-            print('[Webhook] signature error:', e)
-            return getattr(settings, 'DEBUG', False)
-
-    def _confirm_investment(self, order_id, utr=None, amount=None):
-        qs = Investment.objects.filter(
-            order_id=order_id,
-            status__in=['Pending', 'Pending Bank Transfer'],
-        )
-        count = 0
-        for inv in qs:
-            inv.status = 'Confirmed'
-            inv.confirmed_at = timezone.now()
-            inv.save(update_fields=['status', 'confirmed_at'])
-            count += 1
-            SecurityLog.objects.create(
-                user=inv.user,
-                action='PAYMENT_CONFIRMED',
-                detail=f'order={order_id} utr={utr or "-"} amount={amount or inv.amount}',
-            )
-        return count
-
 
 # ==================== ADMIN ====================
 
@@ -476,6 +618,9 @@ ADMIN_EMAILS = [
 
 
 def is_admin(request):
+    user = request.user
+    if isinstance(user, TokenUser) and user.admin_email in ADMIN_EMAILS:
+        return True
     email = request.session.get('admin_email') or request.session.get('user_email')
     return email in ADMIN_EMAILS
 
@@ -490,71 +635,101 @@ class AdminLoginView(APIView):
             request.session['admin_email'] = email
             request.session['user_email'] = email
             return Response({
-                'token': 'admin-session',
+                'token': issue_token(admin_email=email),
                 'admin': {'email': email},
             }, status=200)
         return Response({'error': 'Invalid admin credentials'}, status=401)
 
 
 class AdminStatsView(APIView):
+    @replica.use_replica()
     def get(self, request):
         if not is_admin(request):
             return Response({'error': 'Unauthorized'}, status=401)
-        total_users = UserProfile.objects.count()
-        total_invested = Investment.objects.filter(status='Confirmed').aggregate(
-            s=models.Sum('amount')
-        )['s'] or 0
-        pending_bank = Investment.objects.filter(
-            status='Pending Bank Transfer'
-        ).count()
-        pending_wd = Withdrawal.objects.filter(status='Pending').count()
-        return Response({
-            'totalUsers': total_users,
-            'totalInvested': float(total_invested),
-            'pendingBankTransfers': pending_bank,
-            'pendingWithdrawals': pending_wd,
-        }, status=200)
+        return Response(stats.snapshot(), status=200)
+
+
+class AdminStatsSeriesView(APIView):
+    @replica.use_replica()
+    def get(self, request):
+        if not is_admin(request):
+            return Response({'error': 'Unauthorized'}, status=401)
+        try:
+            days = max(1, min(int(request.GET.get('days', 30)), stats.RECONCILE_DAYS))
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid days'}, status=400)
+        return Response(stats.series(days), status=200)
+
+
+class AdminWebhookInboxView(APIView):
+    @replica.use_replica()
+    def get(self, request):
+        if not is_admin(request):
+            return Response({'error': 'Unauthorized'}, status=401)
+        data = cashfree_webhook.inbox_lag()
+        data['dedup'] = idempotency.stats()
+        return Response(data, status=200)
+
+
+class AdminVAPoolView(APIView):
+    @replica.use_replica()
+    def get(self, request):
+        if not is_admin(request):
+            return Response({'error': 'Unauthorized'}, status=401)
+        return Response(va_pool.metrics(), status=200)
+
+
+class MetricsView(APIView):
+    def get(self, request):
+        if not (metrics.token_ok(request) or is_admin(request)):
+            return Response({'error': 'Unauthorized'}, status=401)
+        return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 
 class AdminSearchUsersView(APIView):
+    @replica.use_replica()
     def get(self, request):
         if not is_admin(request):
             return Response({'error': 'Unauthorized'}, status=401)
         q = (request.GET.get('q') or '').strip()
-        qs = UserProfile.objects.all()
-        if q:
-            qs = qs.filter(
-                models.Q(email__icontains=q)
-                | models.Q(name__icontains=q)
-                | models.Q(mobile__icontains=q)
+        try:
+            users, next_cursor = user_search.search(
+                q,
+                cursor=request.GET.get('cursor'),
+                limit=parse_limit(request.GET.get('limit') or 50),
             )
+        except ValueError:
+            return Response({'error': 'Invalid cursor'}, status=400)
         result = []
-        for u in qs[:50]:
-            total = u.investments.filter(status='Confirmed').aggregate(
-                s=models.Sum('amount')
-            )['s'] or 0
+        for u in users:
+            balance = getattr(u, 'portfolio', None)
             result.append({
                 'id': u.id,
                 'email': u.email,
                 'name': u.name,
                 'kycStatus': u.kyc_status,
-                'totalInvested': float(total),
+                'totalInvested': float(balance.confirmed_principal if balance else 0),
             })
-        return Response(result, status=200)
+        response = Response(result, status=200)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
 
 
 class AdminUserDetailView(APIView):
+    @replica.use_replica()
     def get(self, request, user_id):
         if not is_admin(request):
             return Response({'error': 'Unauthorized'}, status=401)
         try:
             profile = UserProfile.objects.select_related('kyc').get(id=user_id)
-            return Response(UserProfileSerializer(profile).data, status=200)
+            return Response(profile_data(request, profile), status=200)
         except UserProfile.DoesNotExist:
             return Response({'error': 'User not found'}, status=404)
 
 
 class AdminUserInvestmentsView(APIView):
+    @replica.use_replica()
     def get(self, request, user_id):
         if not is_admin(request):
             return Response({'error': 'Unauthorized'}, status=401)
@@ -563,6 +738,7 @@ class AdminUserInvestmentsView(APIView):
 
 
 class AdminUserWithdrawalsView(APIView):
+    @replica.use_replica()
     def get(self, request, user_id):
         if not is_admin(request):
             return Response({'error': 'Unauthorized'}, status=401)
@@ -570,7 +746,35 @@ class AdminUserWithdrawalsView(APIView):
         return Response(WithdrawalSerializer(wds, many=True).data, status=200)
 
 
+class AdminExportView(APIView):
+    """Whole-table CSV/JSONL download, streamed; ?from=&to= (dates), ?status=a,b, ?gzip=1."""
+
+    @replica.use_replica()
+    def get(self, request, dataset, fmt):
+        if not is_admin(request):
+            return Response({'error': 'Unauthorized'}, status=401)
+        if dataset not in exports.DATASETS:
+            return Response({'error': 'Unknown export'}, status=404)
+        gzip = request.GET.get('gzip', '').lower() in ('1', 'true')
+        try:
+            start, end, statuses = exports.parse_filters(
+                request.GET.get('from'), request.GET.get('to'), request.GET.get('status'),
+            )
+            chunks = exports.stream(dataset, fmt, start, end, statuses, gzip=gzip)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        response = StreamingHttpResponse(
+            chunks,
+            content_type='application/gzip' if gzip else exports.FORMATS[fmt],
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{exports.filename(dataset, fmt, gzip)}"'
+        )
+        return response
+
+
 class AdminPendingWithdrawalsView(APIView):
+    @replica.use_replica()
     def get(self, request):
         if not is_admin(request):
             return Response({'error': 'Unauthorized'}, status=401)
@@ -596,15 +800,16 @@ class AdminProcessWithdrawalView(APIView):
         notes = request.data.get('notes', '')
         if not utr:
             return Response({'error': 'UTR required'}, status=400)
-        try:
-            wd = Withdrawal.objects.get(id=withdrawal_id, status='Pending')
-            wd.status = 'Completed'
-            wd.utr = utr
-            wd.notes = notes
-            wd.save()
-            return Response({'message': 'Withdrawal processed'}, status=200)
-        except Withdrawal.DoesNotExist:
-            return Response({'error': 'Not found'}, status=404)
+        with transaction.atomic():
+            wd = Withdrawal.objects.filter(id=withdrawal_id, status='Pending').first()
+            if not wd or not Withdrawal.objects.filter(id=wd.id, status='Pending').update(
+                status='Completed', utr=utr, notes=notes, completed_at=timezone.now(),
+            ):
+                return Response({'error': 'Not found'}, status=404)
+            portfolio.withdrawals_completed([(wd.user_id, wd.amount)])
+            ledger.withdrawals_completed([(wd.user_id, wd.amount, wd.id)])
+            stats.withdrawals_closed([wd.amount], completed=True)
+        return Response({'message': 'Withdrawal processed'}, status=200)
 
 
 class AdminRejectWithdrawalView(APIView):
@@ -612,17 +817,20 @@ class AdminRejectWithdrawalView(APIView):
         if not is_admin(request):
             return Response({'error': 'Unauthorized'}, status=401)
         reason = request.data.get('reason', 'Rejected by admin')
-        try:
-            wd = Withdrawal.objects.get(id=withdrawal_id, status='Pending')
-            wd.status = 'Rejected'
-            wd.notes = reason
-            wd.save()
-            return Response({'message': 'Rejected'}, status=200)
-        except Withdrawal.DoesNotExist:
-            return Response({'error': 'Not found'}, status=404)
+        with transaction.atomic():
+            wd = Withdrawal.objects.filter(id=withdrawal_id, status='Pending').first()
+            if not wd or not Withdrawal.objects.filter(id=wd.id, status='Pending').update(
+                status='Rejected', notes=reason,
+            ):
+                return Response({'error': 'Not found'}, status=404)
+            portfolio.withdrawals_rejected([(wd.user_id, wd.amount)])
+            ledger.withdrawals_rejected([(wd.user_id, wd.amount, wd.id)])
+            stats.withdrawals_closed([wd.amount], completed=False)
+        return Response({'message': 'Rejected'}, status=200)
 
 
 class AdminPendingBankTransfersView(APIView):
+    @replica.use_replica()
     def get(self, request):
         if not is_admin(request):
             return Response({'error': 'Unauthorized'}, status=401)
@@ -647,14 +855,43 @@ class AdminConfirmBankTransferView(APIView):
         utr = (request.data.get('utr') or '').strip()
         if not utr:
             return Response({'error': 'UTR required'}, status=400)
-        try:
-            inv = Investment.objects.get(
+        with transaction.atomic():
+            inv = Investment.objects.filter(
                 id=investment_id,
                 status='Pending Bank Transfer',
-            )
-            inv.status = 'Confirmed'
-            inv.confirmed_at = timezone.now()
-            inv.save()
-            return Response({'message': 'Bank transfer confirmed'}, status=200)
-        except Investment.DoesNotExist:
-            return Response({'error': 'Not found'}, status=404)
+            ).first()
+            if not inv or not Investment.objects.filter(
+                id=inv.id, status='Pending Bank Transfer',
+            ).update(status='Confirmed', confirmed_at=timezone.now(), utr=utr[:64]):
+                return Response({'error': 'Not found'}, status=404)
+            portfolio.investments_confirmed([(inv.user_id, inv.amount)])
+            ledger.investments_confirmed([(inv.user_id, inv.amount, inv.order_id)])
+            stats.investments_confirmed([(inv.amount, 'Pending Bank Transfer')])
+        return Response({'message': 'Bank transfer confirmed'}, status=200)
+
+
+class AdminBulkView(APIView):
+    operation = None
+
+    def post(self, request):
+        if not is_admin(request):
+            return Response({'error': 'Unauthorized'}, status=401)
+        try:
+            items = bulk_admin.read_items(request)
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            return Response({'error': str(e)}, status=400)
+        if not items:
+            return Response({'error': 'No rows supplied'}, status=400)
+        return Response(self.operation(items), status=200)
+
+
+class AdminBulkConfirmBankTransfersView(AdminBulkView):
+    operation = staticmethod(bulk_admin.confirm_bank_transfers)
+
+
+class AdminBulkProcessWithdrawalsView(AdminBulkView):
+    operation = staticmethod(bulk_admin.process_withdrawals)
+
+
+class AdminBulkRejectWithdrawalsView(AdminBulkView):
+    operation = staticmethod(bulk_admin.reject_withdrawals)
@@ -0,0 +1,35 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.services import accrual
+
+
+class Command(BaseCommand):
+    help = 'Accrue daily returns on confirmed investments (resumes from the checkpoint).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--as-of', default=None,
+            help='Accrue through this date (YYYY-MM-DD); defaults to today.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help='Investments per transaction (default RETURNS_ACCRUAL_CHUNK).',
+        )
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options['as_of']:
+            try:
+                as_of = date.fromisoformat(options['as_of'])
+            except ValueError:
+                raise CommandError('--as-of must be YYYY-MM-DD')
+        summary = accrual.run(as_of=as_of, chunk_size=options['chunk_size'])
+        if summary['skipped']:
+            self.stdout.write(f"Skipped: {summary['skipped']}")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Accrued through {summary['asOf']}: {summary['updated']} updated, "
+            f"{summary['scanned']} scanned"
+        ))
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.services import security_log
+
+
+class Command(BaseCommand):
+    help = 'Export whole months of SecurityLog past retention to gzipped JSONL and remove them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-months', type=int, default=settings.SECURITY_LOG_RETENTION_MONTHS,
+            help='Keep this many whole months (default SECURITY_LOG_RETENTION_MONTHS).',
+        )
+        parser.add_argument(
+            '--out', required=True,
+            help='Directory for security_log-YYYY-MM.jsonl.gz files.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report the months and row counts that would be archived.',
+        )
+        parser.add_argument(
+            '--ensure-partitions', action='store_true',
+            help='Also create the upcoming monthly partitions (PostgreSQL).',
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than_months'] < 1:
+            raise CommandError('--older-than-months must be at least 1')
+        if options['ensure_partitions']:
+            for name in security_log.ensure_partitions():
+                self.stdout.write(f'Partition {name} ready')
+
+        try:
+            archived = security_log.archive(
+                options['older_than_months'], options['out'], dry_run=options['dry_run'],
+            )
+        except FileExistsError as e:
+            raise CommandError(str(e))
+
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        for month, rows, path in archived:
+            self.stdout.write(f'{verb} {month}: {rows} rows -> {path}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {sum(rows for _, rows, _ in archived)} rows in {len(archived)} months'
+        ))
@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.services import exports, replica
+
+
+class Command(BaseCommand):
+    help = 'Stream users, investments or withdrawals to CSV/JSONL (optionally gzipped).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(exports.DATASETS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument(
+            '--out', default='-',
+            help='Output file; - (default) writes to stdout.',
+        )
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output.')
+        parser.add_argument('--from', dest='start', help='First day (YYYY-MM-DD), inclusive.')
+        parser.add_argument('--to', dest='end', help='Last day (YYYY-MM-DD), inclusive.')
+        parser.add_argument('--status', help='Comma-separated statuses (KYC status for users).')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Rows per fetch and write.')
+
+    def handle(self, *args, **options):
+        try:
+            start, end, statuses = exports.parse_filters(options['start'], options['end'], options['status'])
+            with replica.use_replica():
+                chunks = exports.stream(
+                    options['dataset'], options['fmt'], start, end, statuses,
+                    gzip=options['gzip'], chunk_size=options['chunk_size'],
+                )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['out'] == '-':
+            out = getattr(self.stdout, 'buffer', None) or sys.stdout.buffer
+            for chunk in chunks:
+                out.write(chunk)
+            out.flush()
+            return
+        written = 0
+        with open(options['out'], 'wb') as out:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        self.stderr.write(f'Wrote {written} bytes to {options["out"]}')
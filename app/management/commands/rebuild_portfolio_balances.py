@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app.services import portfolio
+
+
+class Command(BaseCommand):
+    help = 'Rebuild (or verify) PortfolioBalance rows from investments and withdrawals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Only compare stored balances with the ledger; exit non-zero on drift.',
+        )
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='Limit to a user profile id (repeatable).',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+
+        if options['verify']:
+            mismatches = portfolio.verify(user_ids)
+            for user_id, field, stored, expected in mismatches:
+                self.stdout.write(
+                    f'user={user_id} {field}: stored={stored} expected={expected}'
+                )
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} balance mismatches found')
+            self.stdout.write(self.style.SUCCESS('Balances match the ledger'))
+            return
+
+        with transaction.atomic():
+            count = portfolio.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} balances'))
@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.services import reconciliation
+
+
+class Command(BaseCommand):
+    help = 'Stream a bank statement (CSV or MT940) and confirm matching bank transfers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Statement file, or '-' for stdin.")
+        parser.add_argument('--format', choices=sorted(reconciliation.PARSERS), default='csv')
+        parser.add_argument('--report', help='Write the match report CSV here (default: stdout).')
+        parser.add_argument('--dry-run', action='store_true', help='Report matches without confirming.')
+        parser.add_argument('--window-days', type=int, default=7)
+        parser.add_argument(
+            '--amount-only', action='store_true',
+            help='Treat a unique amount-within-window match as confident.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            stream = sys.stdin if options['path'] == '-' else open(
+                options['path'], newline='', encoding='utf-8-sig',
+            )
+        except OSError as e:
+            raise CommandError(str(e))
+        report = open(options['report'], 'w', newline='') if options['report'] else self.stdout
+        try:
+            counts = reconciliation.reconcile(
+                stream,
+                fmt=options['format'],
+                report=report,
+                dry_run=options['dry_run'],
+                window_days=options['window_days'],
+                amount_only=options['amount_only'],
+                batch_size=options['batch_size'],
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if report is not self.stdout:
+                report.close()
+        summary = ' '.join(f'{k}={v}' for k, v in sorted(counts.items()))
+        self.stderr.write(self.style.SUCCESS(f'Reconciled: {summary}'))
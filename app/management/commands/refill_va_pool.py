@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.services import cashfree_va, va_pool
+
+
+class Command(BaseCommand):
+    help = 'Top the virtual account pool back up to VA_POOL_SIZE.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch', type=int, default=None,
+            help='Create at most this many VAs (default VA_POOL_REFILL_BATCH).',
+        )
+
+    def handle(self, *args, **options):
+        if not cashfree_va.configured():
+            raise CommandError('Cashfree is not configured')
+        released = va_pool.release_orphans()
+        created = va_pool.refill(options['batch'])
+        metrics = va_pool.metrics()
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created}, released {released}; "
+            f"{metrics['available']}/{metrics['target']} available"
+        ))
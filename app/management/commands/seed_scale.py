@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.services import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with production-sized synthetic users, KYC, investments, withdrawals and logs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--investments', type=int, default=1_000_000)
+        parser.add_argument(
+            '--withdrawal-rate', type=float, default=0.3,
+            help='Share of confirmed investments with a withdrawal against them.',
+        )
+        parser.add_argument('--security-logs', type=int, default=0, help='SecurityLog rows.')
+        parser.add_argument('--kyc-verified', type=float, default=0.8, help='Share of users with KYC done.')
+        parser.add_argument('--days', type=int, default=730, help='Spread the rows over the last N days.')
+        parser.add_argument(
+            '--investment-statuses', default=synthetic.DEFAULT_INVESTMENT_STATUSES,
+            help='Weighted statuses, e.g. "Confirmed=70,Pending=30".',
+        )
+        parser.add_argument('--withdrawal-statuses', default=synthetic.DEFAULT_WITHDRAWAL_STATUSES)
+        parser.add_argument('--workers', type=int, default=1, help='Parallel writer processes.')
+        parser.add_argument('--chunk-size', type=int, default=50_000, help='Rows per task and transaction.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; same seed, same data.')
+
+    def handle(self, *args, **options):
+        for name in ('users', 'days', 'workers', 'chunk_size'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be at least 1')
+        for name in ('investments', 'security_logs'):
+            if options[name] < 0:
+                raise CommandError(f'--{name.replace("_", "-")} must not be negative')
+        for name in ('withdrawal_rate', 'kyc_verified'):
+            if not 0 <= options[name] <= 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be between 0 and 1')
+        try:
+            plan = synthetic.Plan(
+                options['users'], options['investments'], security_logs=options['security_logs'],
+                withdrawal_rate=options['withdrawal_rate'], kyc_rate=options['kyc_verified'],
+                days=options['days'], investment_statuses=options['investment_statuses'],
+                withdrawal_statuses=options['withdrawal_statuses'], chunk_size=options['chunk_size'],
+                seed=options['seed'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+
+        def progress(kind, rows):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{kind}: +{rows} rows ({time.monotonic() - started:.1f}s)')
+
+        totals = synthetic.run(plan, workers=options['workers'], progress=progress)
+        elapsed = time.monotonic() - started
+        written = sum(totals.values())
+        for kind, rows in totals.items():
+            self.stdout.write(f'{kind}: {rows} rows')
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {written} rows in {elapsed:.1f}s ({written / max(elapsed, 1e-9) * 60:,.0f} rows/min)'
+        ))
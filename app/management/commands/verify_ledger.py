@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import PortfolioBalance
+from app.services import ledger
+
+
+class Command(BaseCommand):
+    help = 'Replay the ledger in id order and check snapshots, txn balance and balances.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help='Ledger entries read per query.',
+        )
+        parser.add_argument(
+            '--balances', action='store_true',
+            help='Also compare the replayed totals with PortfolioBalance.',
+        )
+        parser.add_argument(
+            '--snapshot', action='store_true',
+            help='Take a snapshot of every active user first.',
+        )
+
+    def handle(self, *args, **options):
+        if options['snapshot']:
+            self.stdout.write(f'Wrote {ledger.take_snapshots()} snapshots')
+
+        replay = ledger.Replay(chunk_size=options['chunk_size'])
+        problems = 0
+        for kind, detail in replay.problems():
+            problems += 1
+            self.stdout.write(f'{kind}: {detail}')
+
+        if options['balances']:
+            stored = PortfolioBalance.objects.values_list(
+                'user_id', 'confirmed_principal', 'accrued_returns',
+                'pending_withdrawals', 'completed_withdrawals',
+            ).iterator(chunk_size=options['chunk_size'])
+            for user_id, *values in stored:
+                replayed = replay.balances.get(user_id, dict.fromkeys(ledger.ACCOUNTS, ledger.ZERO))
+                for account, value in zip(ledger.ACCOUNTS, values):
+                    if ledger.money(value) != replayed[account]:
+                        problems += 1
+                        self.stdout.write(
+                            f'balance: user={user_id} {account}: '
+                            f'stored={ledger.money(value)} ledger={replayed[account]}'
+                        )
+
+        if problems:
+            raise CommandError(f'{problems} ledger problems found')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ledger consistent: {replay.entries} entries, {replay.snapshots} snapshots checked'
+        ))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(fields=['user', '-date'], name='inv_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(fields=['status', 'date'], name='inv_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(condition=models.Q(('status', 'Pending Bank Transfer')), fields=['date'], name='inv_pending_bank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='withdrawal',
+            index=models.Index(fields=['user', '-requested'], name='wd_user_requested_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='withdrawal',
+            index=models.Index(fields=['status', 'requested'], name='wd_status_requested_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='withdrawal',
+            index=models.Index(condition=models.Q(('status', 'Pending')), fields=['requested'], name='wd_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_balances(apps, schema_editor):
+    Investment = apps.get_model('app', 'Investment')
+    Withdrawal = apps.get_model('app', 'Withdrawal')
+    PortfolioBalance = apps.get_model('app', 'PortfolioBalance')
+
+    balances = {}
+
+    def row(user_id):
+        return balances.setdefault(user_id, PortfolioBalance(user_id=user_id))
+
+    for r in Investment.objects.filter(status='Confirmed').values('user_id').annotate(
+        principal=Sum('amount'), returns=Sum('returns'),
+    ).order_by():
+        b = row(r['user_id'])
+        b.confirmed_principal = r['principal'] or 0
+        b.accrued_returns = r['returns'] or 0
+    for r in Withdrawal.objects.filter(status__in=['Pending', 'Completed']).values(
+        'user_id', 'status',
+    ).annotate(total=Sum('amount')).order_by():
+        b = row(r['user_id'])
+        if r['status'] == 'Pending':
+            b.pending_withdrawals = r['total'] or 0
+        else:
+            b.completed_withdrawals = r['total'] or 0
+    for b in balances.values():
+        b.available_balance = (
+            b.confirmed_principal + b.accrued_returns
+            - b.pending_withdrawals - b.completed_withdrawals
+        )
+    PortfolioBalance.objects.bulk_create(balances.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_status_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('confirmed_principal', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('accrued_returns', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('pending_withdrawals', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('completed_withdrawals', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('available_balance', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='portfolio', to='app.userprofile')),
+            ],
+        ),
+        migrations.RunPython(backfill_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:30
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def seed_counters(apps, schema_editor):
+    UserProfile = apps.get_model('app', 'UserProfile')
+    Investment = apps.get_model('app', 'Investment')
+    Withdrawal = apps.get_model('app', 'Withdrawal')
+    StatCounter = apps.get_model('app', 'StatCounter')
+    values = {
+        'total_users': UserProfile.objects.count(),
+        'total_invested': Investment.objects.filter(status='Confirmed').aggregate(
+            s=Sum('amount')
+        )['s'] or 0,
+        'pending_bank_transfers': Investment.objects.filter(status='Pending Bank Transfer').count(),
+        'pending_withdrawals': Withdrawal.objects.filter(status='Pending').count(),
+    }
+    StatCounter.objects.bulk_create(
+        [StatCounter(name=name, value=value) for name, value in values.items()]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_webhook_inbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('inflow', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('outflow', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='withdrawal',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
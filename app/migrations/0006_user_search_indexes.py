@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:31
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+PG_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS profile_email_trgm ON app_userprofile USING gin (email gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS profile_name_trgm ON app_userprofile USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS profile_mobile_trgm ON app_userprofile USING gin (mobile gin_trgm_ops)',
+]
+PG_BACKWARD = [
+    'DROP INDEX IF EXISTS profile_email_trgm',
+    'DROP INDEX IF EXISTS profile_name_trgm',
+    'DROP INDEX IF EXISTS profile_mobile_trgm',
+]
+
+# External-content FTS5 table kept in sync by triggers (dev/SQLite only).
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS app_userprofile_fts USING fts5(
+        email, name, mobile,
+        content='app_userprofile', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS app_userprofile_fts_ai AFTER INSERT ON app_userprofile BEGIN
+        INSERT INTO app_userprofile_fts(rowid, email, name, mobile)
+        VALUES (new.id, new.email, new.name, new.mobile);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS app_userprofile_fts_ad AFTER DELETE ON app_userprofile BEGIN
+        INSERT INTO app_userprofile_fts(app_userprofile_fts, rowid, email, name, mobile)
+        VALUES ('delete', old.id, old.email, old.name, old.mobile);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS app_userprofile_fts_au
+    AFTER UPDATE OF email, name, mobile ON app_userprofile BEGIN
+        INSERT INTO app_userprofile_fts(app_userprofile_fts, rowid, email, name, mobile)
+        VALUES ('delete', old.id, old.email, old.name, old.mobile);
+        INSERT INTO app_userprofile_fts(rowid, email, name, mobile)
+        VALUES (new.id, new.email, new.name, new.mobile);
+    END""",
+    "INSERT INTO app_userprofile_fts(app_userprofile_fts) VALUES ('rebuild')",
+]
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS app_userprofile_fts_ai',
+    'DROP TRIGGER IF EXISTS app_userprofile_fts_ad',
+    'DROP TRIGGER IF EXISTS app_userprofile_fts_au',
+    'DROP TABLE IF EXISTS app_userprofile_fts',
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, PG_FORWARD)
+    elif vendor == 'sqlite':
+        try:
+            _run(schema_editor, SQLITE_FORWARD)
+        except OperationalError as e:
+            # SQLite built without FTS5/trigram: search falls back to LIKE
+            print(f'[migrate] skipping FTS5 user search: {e}')
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, PG_BACKWARD)
+    elif vendor == 'sqlite':
+        _run(schema_editor, SQLITE_BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_admin_stat_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['mobile'], name='profile_mobile_idx'),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:41
+
+from django.db import migrations, models
+
+
+def backfill_va_ids(apps, schema_editor):
+    Investment = apps.get_model('app', 'Investment')
+    rows = Investment.objects.filter(virtual_account__isnull=False).only('id', 'virtual_account')
+    batch = []
+    for inv in rows.iterator(chunk_size=2000):
+        va = inv.virtual_account if isinstance(inv.virtual_account, dict) else {}
+        va_id = va.get('vAccountId') or va.get('vaccount_id')
+        if va_id and va.get('accountNumber'):
+            inv.va_id = str(va_id)[:40]
+            batch.append(inv)
+        if len(batch) >= 1000:
+            Investment.objects.bulk_update(batch, ['va_id'])
+            batch = []
+    Investment.objects.bulk_update(batch, ['va_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_remove_userprofile_otp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='investment',
+            name='va_id',
+            field=models.CharField(blank=True, max_length=40, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_va_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_investment_va_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledVirtualAccount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('va_id', models.CharField(max_length=40, unique=True)),
+                ('environment', models.CharField(max_length=20)),
+                ('account_number', models.CharField(max_length=40)),
+                ('ifsc', models.CharField(max_length=15)),
+                ('bank_name', models.CharField(blank=True, max_length=100)),
+                ('status', models.CharField(choices=[('Available', 'Available'), ('Claimed', 'Claimed')], default='Available', max_length=20)),
+                ('order_id', models.CharField(blank=True, max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'Available')), fields=['environment', 'id'], name='va_pool_available_idx')],
+            },
+        ),
+    ]
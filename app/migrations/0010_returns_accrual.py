@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_virtual_account_pool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccrualCheckpoint',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('accrued_through', models.DateField()),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(condition=models.Q(('status', 'Confirmed')), fields=['id'], name='inv_confirmed_id_idx'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:09
+
+import django.db.models.deletion
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def opening_balances(apps, schema_editor):
+    """One balanced opening txn per user for the history written before the ledger."""
+    Investment = apps.get_model('app', 'Investment')
+    Withdrawal = apps.get_model('app', 'Withdrawal')
+    LedgerEntry = apps.get_model('app', 'LedgerEntry')
+    totals = defaultdict(lambda: defaultdict(Decimal))
+    for row in Investment.objects.filter(status='Confirmed').values('user_id').annotate(
+        principal=Sum('amount'), returns=Sum('returns'),
+    ).order_by():
+        totals[row['user_id']]['principal'] = row['principal'] or Decimal('0')
+        totals[row['user_id']]['returns'] = row['returns'] or Decimal('0')
+    for row in Withdrawal.objects.filter(status__in=['Pending', 'Completed']).values(
+        'user_id', 'status',
+    ).annotate(total=Sum('amount')).order_by():
+        account = 'withdrawal_pending' if row['status'] == 'Pending' else 'withdrawn'
+        totals[row['user_id']][account] = row['total'] or Decimal('0')
+    batch = []
+    for user_id, accounts in totals.items():
+        txn = uuid.uuid4().hex
+        legs = [(user_id, a, v) for a, v in accounts.items() if v]
+        legs.append((None, 'house:opening', -sum(v for _, _, v in legs)))
+        batch.extend(
+            LedgerEntry(txn=txn, user_id=uid, account=account, amount=amount,
+                        kind='opening_balance', reference='migration')
+            for uid, account, amount in legs if amount
+        )
+        if len(batch) >= 2000:
+            LedgerEntry.objects.bulk_create(batch)
+            batch = []
+    LedgerEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_returns_accrual'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='withdrawal',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Completed', 'Completed'), ('Rejected', 'Rejected'), ('Cancelled', 'Cancelled')], default='Pending', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('txn', models.CharField(db_index=True, max_length=32)),
+                ('account', models.CharField(max_length=30)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('kind', models.CharField(max_length=30)),
+                ('reference', models.CharField(blank=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='app.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='ledger_user_id_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('through_entry_id', models.BigIntegerField()),
+                ('principal', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('returns', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('withdrawal_pending', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('withdrawn', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_snapshots', to='app.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['through_entry_id'], name='ledger_snapshot_through_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'through_entry_id'), name='ledger_snapshot_user_entry_uniq')],
+            },
+        ),
+        migrations.RunPython(opening_balances, migrations.RunPython.noop),
+    ]
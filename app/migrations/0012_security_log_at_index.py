@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:11
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='securitylog',
+            name='at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='securitylog',
+            index=models.Index(fields=['at'], name='securitylog_at_idx'),
+        ),
+    ]
@@ -0,0 +1,126 @@
+"""Range-partition app_securitylog by month on PostgreSQL (no-op elsewhere).
+
+The table is rebuilt as ``PARTITION BY RANGE (at)`` with the primary key
+widened to (id, at), as PostgreSQL requires the partition key in every
+unique index. Existing rows are copied into monthly partitions, the
+identity sequence continues from the old maximum, and a DEFAULT partition
+catches rows outside the months created so far. Reversing copies every
+partition back into a plain table keyed on id.
+"""
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations
+
+TABLE = 'app_securitylog'
+
+
+def _months(first, last):
+    months_ahead = getattr(settings, 'SECURITY_LOG_PARTITIONS_AHEAD', 3)
+    index = first.year * 12 + first.month - 1
+    end = last.year * 12 + last.month - 1 + months_ahead
+    while index <= end:
+        yield (
+            datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc),
+            datetime((index + 1) // 12, (index + 1) % 12 + 1, 1, tzinfo=timezone.utc),
+        )
+        index += 1
+
+
+def partition(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_legacy')
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s",
+            [f'{TABLE}_legacy'],
+        )
+        indexes = [(name, sql) for name, sql in cursor.fetchall() if not name.endswith('_pkey')]
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {name}')
+        # the new table reuses the primary key and foreign key names
+        cursor.execute(
+            f"SELECT conname FROM pg_constraint WHERE conrelid = '{TABLE}_legacy'::regclass AND contype IN ('f', 'p')"
+        )
+        for (name,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {TABLE}_legacy DROP CONSTRAINT {name}')
+
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {TABLE}_legacy INCLUDING DEFAULTS INCLUDING IDENTITY) '
+            f'PARTITION BY RANGE (at)'
+        )
+        cursor.execute(f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id, at)')
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_id_fk '
+            f'FOREIGN KEY (user_id) REFERENCES app_userprofile (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+        for _, sql in indexes:
+            cursor.execute(sql.replace(f'{TABLE}_legacy', TABLE))
+
+        cursor.execute(f'SELECT MIN(at) FROM {TABLE}_legacy')
+        now = datetime.now(timezone.utc)
+        oldest = cursor.fetchone()[0] or now
+        for lower, upper in _months(oldest, now):
+            # same names as app.services.security_log.partition_name
+            cursor.execute(
+                f'CREATE TABLE {TABLE}_y{lower.year}m{lower.month:02d} PARTITION OF {TABLE} '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [lower, upper],
+            )
+        cursor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {TABLE}_legacy')
+        cursor.execute(f'DROP TABLE {TABLE}_legacy')
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}"
+        )
+
+
+def unpartition(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_partitioned')
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s",
+            [f'{TABLE}_partitioned'],
+        )
+        indexes = [(name, sql) for name, sql in cursor.fetchall() if not name.endswith('_pkey')]
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {name}')  # and the partitions' copies with it
+        cursor.execute(
+            f"SELECT conname FROM pg_constraint WHERE conrelid = '{TABLE}_partitioned'::regclass AND contype IN ('f', 'p')"
+        )
+        for (name,) in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {TABLE}_partitioned DROP CONSTRAINT {name}')
+
+        cursor.execute(
+            f'CREATE TABLE {TABLE} (LIKE {TABLE}_partitioned INCLUDING DEFAULTS INCLUDING IDENTITY)'
+        )
+        cursor.execute(f'ALTER TABLE {TABLE} ADD PRIMARY KEY (id)')
+        cursor.execute(
+            f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_id_fk '
+            f'FOREIGN KEY (user_id) REFERENCES app_userprofile (id) DEFERRABLE INITIALLY DEFERRED'
+        )
+        for _, sql in indexes:
+            cursor.execute(sql.replace(f'{TABLE}_partitioned', TABLE).replace(' ON ONLY ', ' ON '))
+
+        cursor.execute(f'INSERT INTO {TABLE} SELECT * FROM {TABLE}_partitioned')
+        cursor.execute(f'DROP TABLE {TABLE}_partitioned')  # drops every partition
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {TABLE}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_security_log_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition, unpartition),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_partition_security_log'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='investment',
+            name='utr',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
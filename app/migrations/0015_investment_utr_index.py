@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_investment_utr'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='investment',
+            index=models.Index(condition=models.Q(('utr', ''), _negated=True), fields=['utr'], name='inv_utr_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_investment_utr_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailystat',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='dailystat',
+            name='day',
+            field=models.DateField(),
+        ),
+        migrations.AddConstraint(
+            model_name='dailystat',
+            constraint=models.UniqueConstraint(fields=('day', 'shard'), name='dailystat_day_shard_uniq'),
+        ),
+    ]
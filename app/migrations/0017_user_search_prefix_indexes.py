@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:02
+
+from django.db import migrations
+
+# Indexes a ``startswith`` (LIKE 'q%') lookup can range-scan: PostgreSQL
+# needs the pattern operator class unless the database collation is C,
+# SQLite only rewrites a case-insensitive LIKE for a NOCASE index.
+PG_FORWARD = [
+    'CREATE INDEX IF NOT EXISTS profile_email_prefix ON app_userprofile (email text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS profile_mobile_prefix ON app_userprofile (mobile text_pattern_ops)',
+]
+SQLITE_FORWARD = [
+    'CREATE INDEX IF NOT EXISTS profile_email_prefix ON app_userprofile (email COLLATE NOCASE)',
+    'CREATE INDEX IF NOT EXISTS profile_mobile_prefix ON app_userprofile (mobile COLLATE NOCASE)',
+]
+BACKWARD = [
+    'DROP INDEX IF EXISTS profile_email_prefix',
+    'DROP INDEX IF EXISTS profile_mobile_prefix',
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_prefix_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, PG_FORWARD)
+    elif vendor == 'sqlite':
+        _run(schema_editor, SQLITE_FORWARD)
+
+
+def drop_prefix_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        _run(schema_editor, BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_shard_admin_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_indexes, drop_prefix_indexes),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_user_search_prefix_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderIdNode',
+            fields=[
+                ('node', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('holder', models.CharField(blank=True, max_length=100)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -12,12 +12,16 @@ class UserProfile(models.Model):
     upi_id = models.CharField(max_length=256, blank=True)
     mobile = models.CharField(max_length=15, blank=True)
     kyc_status = models.CharField(max_length=20, default='Not Verified')
-    otp = models.CharField(max_length=6, blank=True, null=True)
     verified = models.BooleanField(default=False)
     two_factor_enabled = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     last_login = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['mobile'], name='profile_mobile_idx'),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -53,7 +57,28 @@ class Investment(models.Model):
     status = models.CharField(max_length=30, choices=STATUS_CHOICES, default='Pending')
     payment_method = models.CharField(max_length=20, blank=True)  # qr | collect | bank
     virtual_account = models.JSONField(null=True, blank=True)  # VA details
+    va_id = models.CharField(max_length=40, unique=True, null=True, blank=True)  # Cashfree vAccountId
     confirmed_at = models.DateTimeField(null=True, blank=True)
+    utr = models.CharField(max_length=64, blank=True)  # bank reference an admin confirmed against
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-date'], name='inv_user_date_idx'),
+            models.Index(fields=['status', 'date'], name='inv_status_date_idx'),
+            models.Index(
+                fields=['date'],
+                name='inv_pending_bank_idx',
+                condition=models.Q(status='Pending Bank Transfer'),
+            ),
+            # keyset scan of the returns accrual job
+            models.Index(
+                fields=['id'],
+                name='inv_confirmed_id_idx',
+                condition=models.Q(status='Confirmed'),
+            ),
+            # statement reconciliation looks up references already applied
+            models.Index(fields=['utr'], name='inv_utr_idx', condition=~models.Q(utr='')),
+        ]
 
     def __str__(self):
         return f"{self.order_id} - {self.user.email} - ₹{self.amount}"
@@ -64,6 +89,7 @@ class Withdrawal(models.Model):
         ('Pending', 'Pending'),
         ('Completed', 'Completed'),
         ('Rejected', 'Rejected'),
+        ('Cancelled', 'Cancelled'),
     ]
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='withdrawals')
     investment = models.ForeignKey(Investment, on_delete=models.CASCADE, null=True, blank=True)
@@ -77,13 +103,198 @@ class Withdrawal(models.Model):
     method = models.CharField(max_length=30, default='NEFT/RTGS/IMPS')
     utr = models.CharField(max_length=50, blank=True)
     notes = models.TextField(blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-requested'], name='wd_user_requested_idx'),
+            models.Index(fields=['status', 'requested'], name='wd_status_requested_idx'),
+            models.Index(
+                fields=['requested'],
+                name='wd_pending_idx',
+                condition=models.Q(status='Pending'),
+            ),
+        ]
 
     def __str__(self):
         return f"Withdrawal {self.id} - {self.user.email}"
 
 
+class PortfolioBalance(models.Model):
+    user = models.OneToOneField(UserProfile, on_delete=models.CASCADE, related_name='portfolio')
+    confirmed_principal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    accrued_returns = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pending_withdrawals = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    completed_withdrawals = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # confirmed_principal + accrued_returns - pending_withdrawals - completed_withdrawals
+    available_balance = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Balance of {self.user.email} - ₹{self.available_balance}"
+
+
+class LedgerEntry(models.Model):
+    """One leg of a balanced money movement; rows are only ever inserted.
+
+    The legs sharing a ``txn`` sum to zero. User legs (``user`` set) post to
+    the accounts mirrored by PortfolioBalance; house legs (``user`` null)
+    carry the other side.
+    """
+    txn = models.CharField(max_length=32, db_index=True)
+    user = models.ForeignKey(
+        UserProfile, on_delete=models.PROTECT, null=True, blank=True, related_name='ledger_entries',
+    )
+    account = models.CharField(max_length=30)
+    amount = models.DecimalField(max_digits=14, decimal_places=2)  # signed
+    kind = models.CharField(max_length=30)
+    reference = models.CharField(max_length=64, blank=True)  # order id, withdrawal id, accrual date
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='ledger_user_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.txn} {self.account} {self.amount}"
+
+
+class LedgerSnapshot(models.Model):
+    """A user's account balances including every entry up to ``through_entry_id``."""
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='ledger_snapshots')
+    through_entry_id = models.BigIntegerField()
+    principal = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    returns = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    withdrawal_pending = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    withdrawn = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'through_entry_id'], name='ledger_snapshot_user_entry_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['through_entry_id'], name='ledger_snapshot_through_idx'),
+        ]
+
+    def __str__(self):
+        return f"Snapshot of {self.user_id} through {self.through_entry_id}"
+
+
+class StatCounter(models.Model):
+    # one row per counter shard: "total_users", "total_users:1", ...
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+
+class DailyStat(models.Model):
+    day = models.DateField()
+    shard = models.PositiveSmallIntegerField(default=0)
+    inflow = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    outflow = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'shard'], name='dailystat_day_shard_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day}: +{self.inflow} -{self.outflow}"
+
+
+class AccrualCheckpoint(models.Model):
+    """Progress of the returns accrual run for ``accrued_through``."""
+    name = models.CharField(max_length=50, primary_key=True)
+    accrued_through = models.DateField()
+    last_id = models.BigIntegerField(default=0)  # highest investment id done for that day
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} through {self.accrued_through} (id>{self.last_id})"
+
+
+class WebhookEvent(models.Model):
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Processed', 'Processed'),
+        ('Ignored', 'Ignored'),
+    ]
+    dedup_key = models.CharField(max_length=128, unique=True)  # event id or order_id:utr
+    event_type = models.CharField(max_length=64, blank=True)
+    order_id = models.CharField(max_length=50, blank=True)
+    utr = models.CharField(max_length=64, blank=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['received_at'],
+                name='webhook_pending_idx',
+                condition=models.Q(status='Pending'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type or 'webhook'} {self.order_id} ({self.status})"
+
+
+class PooledVirtualAccount(models.Model):
+    """Pre-created Cashfree VA waiting to be bound to an investment."""
+    STATUS_CHOICES = [
+        ('Available', 'Available'),
+        ('Claimed', 'Claimed'),
+    ]
+    va_id = models.CharField(max_length=40, unique=True)
+    environment = models.CharField(max_length=20)  # CASHFREE_ENV it was created in
+    account_number = models.CharField(max_length=40)
+    ifsc = models.CharField(max_length=15)
+    bank_name = models.CharField(max_length=100, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Available')
+    order_id = models.CharField(max_length=50, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['environment', 'id'],
+                name='va_pool_available_idx',
+                condition=models.Q(status='Available'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.va_id} ({self.status})"
+
+
 class SecurityLog(models.Model):
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='security_logs')
     action = models.CharField(max_length=50)
     detail = models.CharField(max_length=255, blank=True)
-    at = models.DateTimeField(auto_now_add=True)
+    # set when the event happens, not when the buffered writer flushes it
+    at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['at'], name='securitylog_at_idx'),
+        ]
+
+
+class OrderIdNode(models.Model):
+    """Lease on one order id node number, renewed by the process holding it."""
+    node = models.PositiveIntegerField(primary_key=True)
+    holder = models.CharField(max_length=100, blank=True)  # host:pid:token
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"node {self.node} -> {self.holder or '-'} until {self.expires_at}"
@@ -0,0 +1,178 @@
+# app/services/accrual.py
+"""Daily accrual of ``Investment.returns``.
+
+    returns = amount * RETURNS_MONTHLY_RATE * days / RETURNS_DAYS_PER_MONTH
+
+simple interest on the confirmed amount, ``days`` being whole days since
+confirmation -- the figure the dashboard projects. A withdrawal against the
+investment (pending or completed) takes its amount out of the principal
+still earning, from the day it was requested, so a fully withdrawn
+investment stops accruing instead of regrowing a withdrawable balance:
+
+    returns = amount * f(days) - sum(principal_w * f(days - days_w))
+
+with ``principal_w`` the part of withdrawal ``w`` the remaining principal
+covers. Every term only grows, so a rerun never takes returns back unless
+a withdrawal is cancelled or rejected (which adds them back). Confirmed investments
+are walked in id order in chunks: each chunk is computed in one pass (one
+factor per distinct day count), written back with a single UPDATE ... FROM
+(VALUES ...) join (see ``bulk_sql``) and its per-user change folded into
+``PortfolioBalance.accrued_returns``, all in one transaction together with
+the checkpoint. A killed run resumes after its last committed chunk; a
+rerun for a day that already completed reads nothing.
+"""
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from app.models import AccrualCheckpoint, Investment, Withdrawal
+from app.services import bulk_sql, ledger, portfolio
+
+CHECKPOINT = 'daily-returns'
+RUN_LOCK_KEY = 'accrual:run'
+CENT = Decimal('0.01')
+ROW_FIELDS = ('id', 'user_id', 'amount', 'returns', 'confirmed_at', 'date')
+OPEN_WITHDRAWALS = ('Pending', 'Completed')  # money that has left (or is leaving) the investment
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def monthly_rate():
+    return Decimal(str(_setting('RETURNS_MONTHLY_RATE', '0.02')))
+
+
+def withdrawn(investment_ids):
+    """{investment_id: [(requested, amount), ...]} of open withdrawals, oldest first."""
+    found = defaultdict(list)
+    rows = (
+        Withdrawal.objects.filter(investment_id__in=investment_ids, status__in=OPEN_WITHDRAWALS)
+        .order_by('requested', 'id').values_list('investment_id', 'requested', 'amount')
+    )
+    for inv_id, requested, amount in rows:
+        found[inv_id].append((requested, amount))
+    return found
+
+
+def compute(rows, as_of, rate=None, days_per_month=None, withdrawals=None):
+    """rows of ROW_FIELDS -> ({investment_id: new_returns}, {user_id: change}) for changed rows.
+
+    ``withdrawals`` is ``withdrawn()`` for the rows; without it every
+    investment accrues on its full amount.
+    """
+    rate = monthly_rate() if rate is None else rate
+    days_per_month = days_per_month or _setting('RETURNS_DAYS_PER_MONTH', 30)
+    withdrawals = withdrawals or {}
+    factors = {}
+    local_dates = {}
+    updates = {}
+    deltas = defaultdict(Decimal)
+
+    def local_date(moment):
+        # UTC offsets are whole quarter hours, so the local date is constant
+        # within a quarter hour: convert once per bucket, not once per row
+        key = moment.replace(minute=moment.minute - moment.minute % 15, second=0, microsecond=0)
+        day = local_dates.get(key)
+        if day is None:
+            day = local_dates[key] = timezone.localdate(key)
+        return day
+
+    def factor(since):
+        days = max(0, (as_of - since).days)
+        value = factors.get(days)
+        if value is None:
+            value = factors[days] = rate * days / days_per_month
+        return value
+
+    for inv_id, user_id, amount, returns, confirmed_at, created in rows:
+        start_date = local_date(confirmed_at or created)
+        earned = amount * factor(start_date)
+        principal = amount
+        for requested, taken in withdrawals.get(inv_id, ()):
+            if principal <= 0:
+                break
+            if taken <= 0:
+                continue  # a bad row must never add principal
+            taken = min(taken, principal)
+            principal -= taken
+            earned -= taken * factor(max(start_date, local_date(requested)))
+        value = earned.quantize(CENT, rounding=ROUND_HALF_UP)
+        if value != returns:
+            updates[inv_id] = value
+            deltas[user_id] += value - returns
+    return updates, deltas
+
+
+def _write(updates):
+    if bulk_sql.supported():
+        bulk_sql.update_from_values(
+            Investment, 'id', ('new_returns',), list(updates.items()),
+            'returns = v.new_returns', where="status = 'Confirmed'",
+        )
+        return
+    Investment.objects.filter(id__in=list(updates), status='Confirmed').update(
+        returns=Case(
+            *[When(id=inv_id, then=Value(value)) for inv_id, value in updates.items()],
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+def run(as_of=None, chunk_size=None):
+    """Accrue returns through ``as_of`` (default today). Returns a summary dict."""
+    as_of = as_of or timezone.localdate()
+    chunk_size = chunk_size or _setting('RETURNS_ACCRUAL_CHUNK', 2000)
+    summary = {'asOf': as_of.isoformat(), 'scanned': 0, 'updated': 0, 'skipped': None}
+
+    if not cache.add(RUN_LOCK_KEY, 1, timeout=60 * 60):
+        summary['skipped'] = 'another accrual run is in progress'
+        return summary
+    try:
+        checkpoint, _ = AccrualCheckpoint.objects.get_or_create(
+            name=CHECKPOINT, defaults={'accrued_through': as_of},
+        )
+        if checkpoint.accrued_through > as_of:
+            summary['skipped'] = f'already accrued through {checkpoint.accrued_through}'
+            return summary
+        if checkpoint.accrued_through == as_of and checkpoint.completed:
+            summary['skipped'] = 'already complete'
+            return summary
+        last_id = checkpoint.last_id if checkpoint.accrued_through == as_of else 0
+        summary['resumedAfter'] = last_id
+
+        rate = monthly_rate()
+        days_per_month = _setting('RETURNS_DAYS_PER_MONTH', 30)
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    Investment.objects.select_for_update()
+                    .filter(status='Confirmed', id__gt=last_id)
+                    .order_by('id').values_list(*ROW_FIELDS)[:chunk_size]
+                )
+                if not rows:
+                    break
+                updates, deltas = compute(
+                    rows, as_of, rate, days_per_month, withdrawn([row[0] for row in rows]),
+                )
+                if updates:
+                    _write(updates)
+                    portfolio.add_accrued_returns(deltas)
+                    ledger.returns_accrued(deltas, as_of)
+                last_id = rows[-1][0]
+                AccrualCheckpoint.objects.filter(name=CHECKPOINT).update(
+                    accrued_through=as_of, last_id=last_id, completed=False,
+                )
+            summary['scanned'] += len(rows)
+            summary['updated'] += len(updates)
+        AccrualCheckpoint.objects.filter(name=CHECKPOINT).update(
+            accrued_through=as_of, last_id=last_id, completed=True,
+        )
+    finally:
+        cache.delete(RUN_LOCK_KEY)
+    return summary
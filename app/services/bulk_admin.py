@@ -0,0 +1,194 @@
+# app/services/bulk_admin.py
+import csv
+import io
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from app.models import Investment, Withdrawal, SecurityLog
+from app.services import bulk_sql, ledger, portfolio, security_log, stats
+
+MAX_ROWS = 20000
+ID_CHUNK = 900  # stays under SQLite's bound-parameter limit
+ID_COLUMNS = ('id', 'investment_id', 'withdrawal_id')
+UTR_COLUMNS = ('utr', 'reference', 'bank_reference')
+NOTES_COLUMNS = ('notes', 'reason', 'remarks')
+
+
+def _first(row, columns):
+    for column in columns:
+        value = row.get(column)
+        if value not in (None, ''):
+            return str(value).strip()
+    return ''
+
+
+def _normalise(row):
+    row = {str(k).strip().lower(): v for k, v in row.items() if k is not None}
+    return {
+        'id': _first(row, ID_COLUMNS),
+        'utr': _first(row, UTR_COLUMNS),
+        'notes': _first(row, NOTES_COLUMNS),
+    }
+
+
+def read_items(request):
+    """Rows from a JSON ``items`` list or an uploaded CSV ``file``."""
+    upload = request.FILES.get('file')
+    if upload:
+        text = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        rows = csv.DictReader(text)
+    else:
+        rows = request.data.get('items') or []
+        if not isinstance(rows, list):
+            raise ValueError('items must be a list')
+    items = []
+    for row in rows:
+        if not isinstance(row, dict):
+            raise ValueError('each item must be an object')
+        items.append(_normalise(row))
+        if len(items) > MAX_ROWS:
+            raise ValueError(f'At most {MAX_ROWS} rows per request')
+    return items
+
+
+def _validate(items, utr_required):
+    """Split items into {id: item} to apply and per-row error results."""
+    valid, results = {}, {}
+    for index, item in enumerate(items):
+        try:
+            pk = int(item['id'])
+        except (TypeError, ValueError):
+            results[index] = {'row': index, 'id': item['id'], 'status': 'error', 'error': 'Invalid id'}
+            continue
+        if utr_required and not item['utr']:
+            results[index] = {'row': index, 'id': pk, 'status': 'error', 'error': 'UTR required'}
+        elif pk in valid:
+            results[index] = {'row': index, 'id': pk, 'status': 'error', 'error': 'Duplicate id'}
+        else:
+            valid[pk] = dict(item, row=index, id=pk)
+    return valid, results
+
+
+def _locked(model, ids, status):
+    rows = []
+    for start in range(0, len(ids), ID_CHUNK):
+        rows.extend(
+            model.objects.select_for_update()
+            .filter(id__in=ids[start:start + ID_CHUNK], status=status)
+        )
+    return rows
+
+
+def _finish(items, valid, results, applied):
+    for pk, item in valid.items():
+        if pk in applied:
+            results[item['row']] = {'row': item['row'], 'id': pk, 'status': 'ok'}
+        else:
+            results[item['row']] = {'row': item['row'], 'id': pk, 'status': 'error', 'error': 'Not found'}
+    ordered = [results[i] for i in range(len(items))]
+    ok = sum(1 for r in ordered if r['status'] == 'ok')
+    return {
+        'results': ordered,
+        'summary': {'total': len(ordered), 'ok': ok, 'failed': len(ordered) - ok},
+    }
+
+
+def _save(rows, fields, shared):
+    """Write ``fields`` of ``rows`` (already set in memory) with one statement per chunk.
+
+    ``fields`` differ per row and travel in the VALUES list; ``shared`` maps
+    the fields every row gets the same value for. A CASE WHEN per field
+    (``bulk_update``) is only used on SQLite before 3.33.
+    """
+    if not rows:
+        return
+    model = type(rows[0])
+    if not bulk_sql.supported():
+        model.objects.bulk_update(rows, [*fields, *shared], batch_size=500)
+        return
+    qn = connection.ops.quote_name
+    assignments = ', '.join(
+        [f'{qn(field)} = %s' for field in shared]
+        + [f'{qn(field)} = v.{qn("new_" + field)}' for field in fields]
+    )
+    params = [model._meta.get_field(field).get_db_prep_save(value, connection) for field, value in shared.items()]
+    for start in range(0, len(rows), ID_CHUNK):
+        chunk = rows[start:start + ID_CHUNK]
+        bulk_sql.update_from_values(
+            model, 'id', [f'new_{field}' for field in fields],
+            [(row.id, *(getattr(row, field) for field in fields)) for row in chunk],
+            assignments, params=params,
+        )
+
+
+def confirm_bank_transfers(items):
+    valid, results = _validate(items, utr_required=True)
+    now = timezone.now()
+    with transaction.atomic():
+        invs = _locked(Investment, list(valid), 'Pending Bank Transfer')
+        for inv in invs:
+            inv.status = 'Confirmed'
+            inv.confirmed_at = now
+            inv.utr = valid[inv.id]['utr'][:64]
+        _save(invs, ['utr'], {'status': 'Confirmed', 'confirmed_at': now})
+        portfolio.investments_confirmed([(inv.user_id, inv.amount) for inv in invs])
+        ledger.investments_confirmed([(inv.user_id, inv.amount, inv.order_id) for inv in invs])
+        stats.investments_confirmed([(inv.amount, 'Pending Bank Transfer') for inv in invs])
+        security_log.record_many(
+            SecurityLog(
+                user_id=inv.user_id,
+                action='BANK_TRANSFER_CONFIRMED',
+                detail=f"order={inv.order_id} utr={inv.utr} {valid[inv.id]['notes']}".strip()[:255],
+                at=now,
+            )
+            for inv in invs
+        )
+    return _finish(items, valid, results, {inv.id for inv in invs})
+
+
+def _settle_withdrawals(items, status, action, utr_required):
+    valid, results = _validate(items, utr_required=utr_required)
+    now = timezone.now()
+    with transaction.atomic():
+        wds = _locked(Withdrawal, list(valid), 'Pending')
+        for wd in wds:
+            item = valid[wd.id]
+            wd.status = status
+            if utr_required:
+                wd.utr = item['utr'][:50]
+                wd.notes = item['notes']
+                wd.completed_at = now
+            else:
+                wd.notes = item['notes'] or 'Rejected by admin'
+        if utr_required:
+            _save(wds, ['utr', 'notes'], {'status': status, 'completed_at': now})
+        else:
+            _save(wds, ['notes'], {'status': status})
+        rows = [(wd.user_id, wd.amount) for wd in wds]
+        refs = [(wd.user_id, wd.amount, wd.id) for wd in wds]
+        if status == 'Completed':
+            portfolio.withdrawals_completed(rows)
+            ledger.withdrawals_completed(refs)
+        else:
+            portfolio.withdrawals_rejected(rows)
+            ledger.withdrawals_rejected(refs)
+        stats.withdrawals_closed([wd.amount for wd in wds], completed=status == 'Completed')
+        security_log.record_many(
+            SecurityLog(
+                user_id=wd.user_id,
+                action=action,
+                detail=f'withdrawal={wd.id} utr={wd.utr or "-"} amount={wd.amount}'[:255],
+                at=now,
+            )
+            for wd in wds
+        )
+    return _finish(items, valid, results, {wd.id for wd in wds})
+
+
+def process_withdrawals(items):
+    return _settle_withdrawals(items, 'Completed', 'WITHDRAWAL_PROCESSED', utr_required=True)
+
+
+def reject_withdrawals(items):
+    return _settle_withdrawals(items, 'Rejected', 'WITHDRAWAL_REJECTED', utr_required=False)
@@ -0,0 +1,49 @@
+# app/services/bulk_sql.py
+"""Keyed bulk UPDATE joined against a VALUES list.
+
+    WITH v (key, new_returns) AS (VALUES (%s, %s), ...)
+    UPDATE app_investment SET returns = v.new_returns FROM v
+    WHERE app_investment.id = v.key
+
+One statement per chunk whose cost grows linearly with the chunk. A CASE
+WHEN id = ... expression (what ``bulk_update`` emits) is compiled by the
+ORM one WHEN at a time and evaluated by the database WHEN by WHEN for every
+row, i.e. quadratically. UPDATE ... FROM needs PostgreSQL or SQLite 3.33+;
+``supported()`` tells callers when to fall back to the ORM.
+"""
+from django.db import connection
+
+
+def supported():
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 33)
+    return False
+
+
+def update_from_values(model, key_field, columns, rows, assignments, where='', params=()):
+    """UPDATE ``model`` rows whose ``key_field`` matches the first value of each row.
+
+    ``columns`` names the remaining values (exposed as ``v.<name>``; keep them
+    distinct from the table's own columns), ``assignments`` is the SET clause
+    and ``where`` an optional extra condition. ``params`` fill placeholders in
+    ``assignments`` then ``where``, for values shared by every row. Returns the
+    affected row count.
+    """
+    if not rows:
+        return 0
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    key_column = qn(model._meta.get_field(key_field).column)
+    width = len(columns) + 1
+    values = ', '.join(['(' + ', '.join(['%s'] * width) + ')'] * len(rows))
+    sql = (
+        f"WITH v ({', '.join(qn(c) for c in ('key', *columns))}) AS (VALUES {values}) "
+        f"UPDATE {table} SET {assignments} FROM v WHERE {table}.{key_column} = v.{qn('key')}"
+    )
+    if where:
+        sql += f' AND {where}'
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [value for row in rows for value in row] + list(params))
+        return cursor.rowcount
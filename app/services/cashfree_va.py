@@ -0,0 +1,315 @@
+# app/services/cashfree_va.py
+"""Cashfree Auto Collect (virtual account) client.
+
+One pooled ``requests.Session`` per process keeps HTTP/1.1 connections to
+the gateway alive. Transient failures (connect/read timeouts, 429, 5xx) are
+retried with jittered exponential backoff; repeated failures open a circuit
+breaker so invest requests stop waiting on a gateway that is down. When a
+VA cannot be created inline the investment is saved with a *pending* VA and
+``app.tasks.open_virtual_account`` finishes the job later.
+"""
+import os
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from requests.adapters import HTTPAdapter
+
+PENDING = 'PENDING'
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+TOKEN_REFRESH_MARGIN = 60
+BASE_URLS = {
+    'sandbox': 'https://sandbox.cashfree.com/cac/v1',
+    'production': 'https://cac-api.cashfree.com/cac/v1',
+}
+
+
+class CashfreeError(Exception):
+    """The gateway could not create the VA (after retries)."""
+
+
+class CashfreeRejected(CashfreeError):
+    """4xx: the request itself is wrong; not a sign the gateway is down."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class CircuitOpen(CashfreeError):
+    pass
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def configured():
+    return bool(_setting('CASHFREE_APP_ID', '') and _setting('CASHFREE_SECRET_KEY', ''))
+
+
+def vaccount_id(order_id):
+    # Cashfree VA ids are alphanumeric, at most 30 characters
+    return ''.join(ch for ch in order_id if ch.isalnum())[:30]
+
+
+def details_for(profile, order_id):
+    kyc = getattr(profile, 'kyc', None)
+    return {
+        'order_id': order_id,
+        'name': profile.name,
+        'email': profile.email,
+        'phone': getattr(kyc, 'mobile', None) or profile.mobile,
+        'pan': getattr(kyc, 'pan', None),
+        'aadhaar': getattr(kyc, 'aadhaar', None),
+    }
+
+
+def pending(order_id, reason):
+    return {'status': PENDING, 'vAccountId': vaccount_id(order_id), 'reason': reason}
+
+
+def is_pending(virtual_account):
+    return bool(virtual_account) and virtual_account.get('status') == PENDING
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures, half-opens after ``reset_timeout``."""
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'half-open':
+                # let exactly one probe through; others keep failing fast
+                self.opened_at = time.monotonic()
+                return True
+            return state == 'closed'
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class CashfreeVAClient:
+    def __init__(self, base_url, client_id, client_secret, timeout=(3.05, 10.0),
+                 retries=2, backoff=0.25, breaker=None, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._token = None
+        self._token_expires = 0.0
+        self._token_lock = threading.Lock()
+
+    def _sleep(self, attempt):
+        # full jitter: spread retries from many workers over the window
+        time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def _send(self, path, payload, headers):
+        """POST with retries on transient errors. Returns the parsed JSON body."""
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._sleep(attempt - 1)
+            try:
+                response = self.session.post(
+                    f'{self.base_url}{path}', json=payload, headers=headers, timeout=self.timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+                continue
+            if response.status_code in RETRY_STATUSES:
+                last_error = CashfreeError(f'{path} returned {response.status_code}')
+                continue
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            if response.status_code >= 400:
+                raise CashfreeRejected(
+                    f"{path} returned {response.status_code}: {body.get('message', '')}",
+                    response.status_code,
+                )
+            return body
+        raise CashfreeError(f'{path} failed after {self.retries + 1} attempts: {last_error}')
+
+    def _auth_token(self):
+        with self._token_lock:
+            if self._token and time.time() < self._token_expires - TOKEN_REFRESH_MARGIN:
+                return self._token
+            body = self._send('/authorize', None, {
+                'X-Client-Id': self.client_id,
+                'X-Client-Secret': self.client_secret,
+            })
+            data = body.get('data') or {}
+            if body.get('status') != 'SUCCESS' or not data.get('token'):
+                raise CashfreeError(f"authorize failed: {body.get('message', '')}")
+            self._token = data['token']
+            self._token_expires = float(data.get('expiry') or time.time() + 300)
+            return self._token
+
+    def create_virtual_account(self, order_id, name, email, phone, **kwargs):
+        if not self.breaker.allow():
+            raise CircuitOpen(f'Cashfree circuit open, retry in {self.breaker.retry_after():.0f}s')
+        va_id = vaccount_id(order_id)
+        payload = {
+            'vAccountId': va_id,
+            'name': name[:100],
+            'phone': phone or '',
+            'email': email,
+        }
+        try:
+            try:
+                body = self._send('/createVA', payload, {'Authorization': f'Bearer {self._auth_token()}'})
+            except CashfreeRejected as e:
+                if e.status not in (401, 403):
+                    raise
+                # token revoked/expired early: re-authorize once
+                self._token = None
+                body = self._send('/createVA', payload, {'Authorization': f'Bearer {self._auth_token()}'})
+        except CashfreeRejected:
+            self.breaker.success()
+            raise
+        except CashfreeError:
+            self.breaker.failure()
+            raise
+        self.breaker.success()
+        if body.get('status') != 'SUCCESS':
+            raise CashfreeError(f"createVA failed: {body.get('message', '')}")
+        data = body.get('data') or {}
+        return {
+            'vAccountId': va_id,
+            'accountNumber': data.get('accountNumber'),
+            'ifsc': data.get('ifsc'),
+            'accountName': _setting('CASHFREE_VA_ACCOUNT_NAME', 'AnkuOn2'),
+            'bankName': data.get('bankName') or '',
+        }
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Per-process client (a forked worker must not share the parent's sockets)."""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                base_url = _setting('CASHFREE_VA_BASE_URL', '') or BASE_URLS.get(
+                    _setting('CASHFREE_ENV', 'sandbox'), BASE_URLS['sandbox'],
+                )
+                _client = CashfreeVAClient(
+                    base_url,
+                    _setting('CASHFREE_APP_ID', ''),
+                    _setting('CASHFREE_SECRET_KEY', ''),
+                    timeout=(
+                        _setting('CASHFREE_VA_CONNECT_TIMEOUT', 3.05),
+                        _setting('CASHFREE_VA_READ_TIMEOUT', 10.0),
+                    ),
+                    retries=_setting('CASHFREE_VA_RETRIES', 2),
+                    backoff=_setting('CASHFREE_VA_BACKOFF_SECONDS', 0.25),
+                    breaker=CircuitBreaker(
+                        _setting('CASHFREE_VA_BREAKER_THRESHOLD', 5),
+                        _setting('CASHFREE_VA_BREAKER_RESET_SECONDS', 30.0),
+                    ),
+                )
+                _client_pid = os.getpid()
+    return _client
+
+
+def reset_client():
+    global _client
+    _client = None
+
+
+def create_virtual_account(order_id, name, email, phone=None, pan=None, aadhaar=None):
+    """VA details for the invest response, or a pending marker. Never raises.
+
+    Returns None when Cashfree is not configured (investors then pay the
+    company account with the order id in the remarks).
+    """
+    if not configured():
+        return None
+    if _setting('CASHFREE_VA_DEFER', False):
+        return pending(order_id, 'deferred')
+    try:
+        return get_client().create_virtual_account(order_id, name, email, phone)
+    except CircuitOpen:
+        return pending(order_id, 'gateway unavailable')
+    except CashfreeError as e:
+        print(f'[Cashfree VA] {order_id}: {e}')
+        return pending(order_id, 'gateway error')
+
+
+def defer(order_id):
+    """Finish a pending VA on a worker once the investment row is committed."""
+    def enqueue():
+        from app.tasks import open_virtual_account
+        try:
+            open_virtual_account.delay(order_id)
+        except Exception as e:
+            # the periodic sweep retries pending VAs
+            print(f'[Cashfree VA] enqueue skipped for {order_id}: {e}')
+    transaction.on_commit(enqueue)
+
+
+def complete_pending(order_id):
+    """Create the VA for a pending investment and attach it. Raises CashfreeError."""
+    from app.models import Investment
+
+    inv = (
+        Investment.objects.select_related('user__kyc')
+        .filter(order_id=order_id, status='Pending Bank Transfer', va_id__isnull=True)
+        .first()
+    )
+    if inv is None or not is_pending(inv.virtual_account):
+        return None
+    details = get_client().create_virtual_account(**details_for(inv.user, order_id))
+    Investment.objects.filter(id=inv.id, va_id__isnull=True).update(
+        virtual_account=details, va_id=details['vAccountId'],
+    )
+    return details
+
+
+def retry_delay(retries):
+    breaker = get_client().breaker
+    return max(breaker.retry_after(), min(600, 5 * (2 ** retries))) + random.uniform(0, 5)
@@ -0,0 +1,195 @@
+# app/services/cashfree_webhook.py
+import base64
+import hashlib
+import hmac
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from app.models import Investment, SecurityLog, WebhookEvent
+from app.services import ledger, portfolio, security_log, stats
+
+PENDING_STATUSES = ['Pending', 'Pending Bank Transfer']
+DRAIN_BATCH_SIZE = 500
+
+
+def verify_signature(raw_body, signature, timestamp):
+    """base64(HMAC-SHA256(secret, timestamp + body)); open only in DEBUG without a secret."""
+    secret = getattr(settings, 'CASHFREE_SECRET_KEY', '') or ''
+    if not secret:
+        return getattr(settings, 'DEBUG', False)
+    if not signature or not timestamp:
+        return getattr(settings, 'DEBUG', False)
+    try:
+        body_str = (
+            raw_body.decode('utf-8')
+            if isinstance(raw_body, bytes)
+            else (raw_body if isinstance(raw_body, str) else json.dumps(raw_body))
+        )
+        signed_payload = f'{timestamp}{body_str}'
+        computed = base64.b64encode(
+            hmac.new(
+                secret.encode('utf-8'),
+                signed_payload.encode('utf-8'),
+                hashlib.sha256,
+            ).digest()
+        ).decode('utf-8')
+        return hmac.compare_digest(computed, signature)
+    except Exception as e:
+        print('[Webhook] signature error:', e)
+        return getattr(settings, 'DEBUG', False)
+
+
+def parse_event(data):
+    """Extract order id, UTR, amount and event id from a Cashfree payload."""
+    event_type = data.get('type') or data.get('event') or ''
+    order_id = None
+    utr = None
+    amount = None
+    payment = {}
+
+    if event_type in ('PAYMENT_SUCCESS_WEBHOOK', 'PAYMENT_SUCCESS'):
+        payload = data.get('data') or {}
+        order = payload.get('order') or {}
+        payment = payload.get('payment') or {}
+        order_id = order.get('order_id') or payment.get('order_id')
+        utr = payment.get('bank_reference') or payment.get('cf_payment_id')
+        amount = order.get('order_amount') or payment.get('payment_amount')
+
+    if not order_id:
+        payload = data.get('data') or data
+        payment = payload.get('payment') or {}
+        vba = (payment.get('payment_method') or {}).get('vba_transfer') or {}
+        order = payload.get('order') or {}
+        order_id = (
+            order.get('order_id')
+            or vba.get('vaccount_id')
+            or data.get('vAccountId')
+            or data.get('order_id')
+            or data.get('orderId')
+        )
+        utr = utr or vba.get('utr') or payment.get('bank_reference') or data.get('utr')
+        amount = amount or payment.get('payment_amount') or data.get('amount')
+
+    event_id = data.get('event_id') or data.get('eventId') or payment.get('cf_payment_id')
+    return {
+        'event_type': event_type,
+        'event_id': str(event_id) if event_id else None,
+        'order_id': str(order_id) if order_id else None,
+        'utr': str(utr) if utr else None,
+        'amount': amount,
+    }
+
+
+def dedup_key(event):
+    if event['event_id']:
+        return f"event:{event['event_id']}"[:128]
+    return f"order:{event['order_id']}:{event['utr'] or '-'}"[:128]
+
+
+def _amount(value):
+    try:
+        return Decimal(str(value)).quantize(Decimal('0.01')) if value not in (None, '') else None
+    except InvalidOperation:
+        return None
+
+
+def _event_defaults(event, payload):
+    return {
+        'event_type': event['event_type'][:64],
+        'order_id': (event['order_id'] or '')[:50],
+        'utr': (event['utr'] or '')[:64],
+        'amount': _amount(event['amount']),
+        'payload': payload,
+    }
+
+
+def record_event(event, payload):
+    """Persist a parsed event to the inbox. Returns (WebhookEvent, created)."""
+    return WebhookEvent.objects.get_or_create(
+        dedup_key=dedup_key(event), defaults=_event_defaults(event, payload),
+    )
+
+
+async def arecord_event(event, payload):
+    return await WebhookEvent.objects.aget_or_create(
+        dedup_key=dedup_key(event), defaults=_event_defaults(event, payload),
+    )
+
+
+def process_batch(events):
+    """Confirm every pending investment referenced by ``events`` set-wise."""
+    now = timezone.now()
+    by_order = {}
+    for e in events:
+        by_order.setdefault(e.order_id, e)
+
+    # VA credits carry the vAccountId rather than our order id
+    keys = list(by_order)
+    candidates = list(
+        Investment.objects.select_for_update()
+        .filter(Q(order_id__in=keys) | Q(va_id__in=keys), status__in=PENDING_STATUSES)
+        .values('id', 'user_id', 'amount', 'order_id', 'va_id', 'status')
+    )
+    for c in candidates:
+        c['event'] = by_order.get(c['order_id']) or by_order[c['va_id']]
+    if candidates:
+        Investment.objects.filter(
+            id__in=[c['id'] for c in candidates],
+            status__in=PENDING_STATUSES,
+        ).update(status='Confirmed', confirmed_at=now)
+        portfolio.investments_confirmed([(c['user_id'], c['amount']) for c in candidates])
+        ledger.investments_confirmed([(c['user_id'], c['amount'], c['order_id']) for c in candidates])
+        stats.investments_confirmed([(c['amount'], c['status']) for c in candidates])
+        security_log.record_many(
+            SecurityLog(
+                user_id=c['user_id'],
+                action='PAYMENT_CONFIRMED',
+                detail=(
+                    f"order={c['order_id']} utr={c['event'].utr or '-'} "
+                    f"amount={c['event'].amount or c['amount']}"
+                )[:255],
+                at=now,
+            )
+            for c in candidates
+        )
+
+    matched = {c['event'].order_id for c in candidates}
+    processed = [e.id for e in events if e.order_id in matched]
+    ignored = [e.id for e in events if e.order_id not in matched]
+    if processed:
+        WebhookEvent.objects.filter(id__in=processed).update(status='Processed', processed_at=now)
+    if ignored:
+        WebhookEvent.objects.filter(id__in=ignored).update(status='Ignored', processed_at=now)
+    return len(candidates)
+
+
+def drain_inbox(batch_size=DRAIN_BATCH_SIZE, max_batches=None):
+    """Process pending inbox events oldest-first. Returns (events, confirmed)."""
+    seen = confirmed = batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            events = list(
+                WebhookEvent.objects.select_for_update(skip_locked=True)
+                .filter(status='Pending')
+                .order_by('received_at', 'id')[:batch_size]
+            )
+            if not events:
+                break
+            confirmed += process_batch(events)
+        seen += len(events)
+        batches += 1
+    return seen, confirmed
+
+
+def inbox_lag():
+    pending = WebhookEvent.objects.filter(status='Pending')
+    oldest = pending.order_by('received_at').values_list('received_at', flat=True).first()
+    return {
+        'pending': pending.count(),
+        'oldestAgeSeconds': (timezone.now() - oldest).total_seconds() if oldest else 0,
+    }
@@ -0,0 +1,109 @@
+# app/services/idempotency.py
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+KEY_PREFIX = 'idem'
+COUNTERS = ('hits', 'misses', 'stale')
+
+
+def _ttl():
+    return getattr(settings, 'CASHFREE_WEBHOOK_DEDUP_TTL', 24 * 60 * 60)
+
+
+def _key(namespace, *parts):
+    digest = hashlib.sha256('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return f'{KEY_PREFIX}:{namespace}:{digest}'
+
+
+def signature_key(signature, timestamp):
+    if not signature or not timestamp:
+        return None
+    return _key('sig', signature, timestamp)
+
+
+def event_key(dedup_key):
+    return _key('event', dedup_key)
+
+
+def _counter_key(counter):
+    return f'{KEY_PREFIX}:count:{counter}'
+
+
+def bump(counter):
+    # one round trip once the counter exists; add() only seeds it the first time
+    key = _counter_key(counter)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+async def abump(counter):
+    key = _counter_key(counter)
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, timeout=None):
+            await cache.aincr(key)
+
+
+def seen(*keys):
+    """True (and counts a hit) when any key was already processed."""
+    keys = [k for k in keys if k]
+    if keys and cache.get_many(keys):
+        bump('hits')
+        return True
+    return False
+
+
+async def aseen(*keys):
+    keys = [k for k in keys if k]
+    if keys and await cache.aget_many(keys):
+        await abump('hits')
+        return True
+    return False
+
+
+def remember(*keys):
+    cache.set_many({k: 1 for k in keys if k}, timeout=_ttl())
+
+
+async def aremember(*keys):
+    await cache.aset_many({k: 1 for k in keys if k}, timeout=_ttl())
+
+
+def _fresh(timestamp, now=None):
+    tolerance = getattr(settings, 'CASHFREE_WEBHOOK_TOLERANCE_SECONDS', 300)
+    if not timestamp or not tolerance:
+        return True
+    try:
+        ts = float(timestamp)
+    except (TypeError, ValueError):
+        return False
+    if ts > 1e12:
+        ts /= 1000.0
+    return abs((now or time.time()) - ts) <= tolerance
+
+
+def timestamp_is_fresh(timestamp, now=None):
+    """Reject webhook timestamps (epoch seconds or ms) outside the tolerance window."""
+    if _fresh(timestamp, now):
+        return True
+    bump('stale')
+    return False
+
+
+async def atimestamp_is_fresh(timestamp, now=None):
+    if _fresh(timestamp, now):
+        return True
+    await abump('stale')
+    return False
+
+
+def stats():
+    values = cache.get_many([_counter_key(c) for c in COUNTERS])
+    return {c: values.get(_counter_key(c), 0) for c in COUNTERS}
@@ -0,0 +1,274 @@
+# app/services/ledger.py
+"""Append-only double-entry ledger of money movements.
+
+Every movement is one ``txn`` of LedgerEntry legs summing to zero:
+
+    investment confirmed   principal +A            house:deposits -A
+    returns accrued        returns +R              house:returns -R
+    withdrawal requested   withdrawal_pending +W   house:payables -W
+    cancelled / rejected   withdrawal_pending -W   house:payables +W
+    withdrawal completed   withdrawal_pending -W   house:payables +W
+                           withdrawn +W            house:bank -W
+
+The user accounts are the PortfolioBalance fields, so
+
+    available = principal + returns - withdrawal_pending - withdrawn
+
+``take_snapshots`` periodically stores each active user's balances with
+the last entry id they include; ``balance`` is then the latest snapshot
+plus the user's entries after it (the ``ledger_user_id_idx`` range scan)
+instead of a sum over the whole history. Writers must call these helpers
+inside the transaction that moves the money.
+
+A snapshot only covers ids every writer below has committed: on PostgreSQL
+each posting transaction holds a shared advisory lock that the snapshot
+run briefly takes exclusively to read max(id) (ids are drawn in nextval
+order, not commit order); SQLite runs one writer at a time, so its max(id)
+is already committed.
+"""
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Max, OuterRef, Subquery, Sum
+
+from app.models import LedgerEntry, LedgerSnapshot
+
+ZERO = Decimal('0.00')
+ACCOUNTS = ('principal', 'returns', 'withdrawal_pending', 'withdrawn')
+SNAPSHOT_CHUNK = 1000
+INSERT_BATCH = 2000
+POSTING_LOCK = 0x1ed6e7  # pg advisory lock id: shared by writers, exclusive for the high-water read
+
+
+def money(value):
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+def available(balances):
+    return (
+        balances['principal'] + balances['returns']
+        - balances['withdrawal_pending'] - balances['withdrawn']
+    )
+
+
+def _txn(kind, reference, legs):
+    """LedgerEntry objects for one balanced movement; legs are (user_id, account, amount)."""
+    txn = uuid.uuid4().hex
+    entries = [
+        LedgerEntry(
+            txn=txn, user_id=user_id, account=account, amount=money(amount),
+            kind=kind, reference=str(reference)[:64],
+        )
+        for user_id, account, amount in legs
+        if money(amount)
+    ]
+    if sum(e.amount for e in entries) != ZERO:
+        raise ValueError(f'unbalanced {kind} transaction {reference}')
+    return entries
+
+
+def _post(entries):
+    if connection.vendor == 'postgresql':
+        # held to commit, so the snapshot run waits for these ids to be visible
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock_shared(%s)', [POSTING_LOCK])
+    LedgerEntry.objects.bulk_create(entries, batch_size=INSERT_BATCH)
+
+
+def investments_confirmed(rows):
+    """rows: iterable of (user_id, amount, order_id)."""
+    _post([
+        e for user_id, amount, order_id in rows
+        for e in _txn('investment_confirmed', order_id, [
+            (user_id, 'principal', amount),
+            (None, 'house:deposits', -money(amount)),
+        ])
+    ])
+
+
+def returns_accrued(deltas, as_of):
+    """deltas: {user_id: change in accrued returns} from one accrual chunk."""
+    _post([
+        e for user_id, change in deltas.items()
+        for e in _txn('returns_accrued', as_of.isoformat(), [
+            (user_id, 'returns', change),
+            (None, 'house:returns', -money(change)),
+        ])
+    ])
+
+
+def withdrawal_requested(user_id, amount, withdrawal_id):
+    _post(_txn('withdrawal_requested', withdrawal_id, [
+        (user_id, 'withdrawal_pending', amount),
+        (None, 'house:payables', -money(amount)),
+    ]))
+
+
+def _released(kind, rows):
+    _post([
+        e for user_id, amount, withdrawal_id in rows
+        for e in _txn(kind, withdrawal_id, [
+            (user_id, 'withdrawal_pending', -money(amount)),
+            (None, 'house:payables', amount),
+        ])
+    ])
+
+
+def withdrawals_cancelled(rows):
+    """rows: iterable of (user_id, amount, withdrawal_id)."""
+    _released('withdrawal_cancelled', rows)
+
+
+def withdrawals_rejected(rows):
+    _released('withdrawal_rejected', rows)
+
+
+def withdrawals_completed(rows):
+    _post([
+        e for user_id, amount, withdrawal_id in rows
+        for e in _txn('withdrawal_completed', withdrawal_id, [
+            (user_id, 'withdrawal_pending', -money(amount)),
+            (None, 'house:payables', amount),
+            (user_id, 'withdrawn', amount),
+            (None, 'house:bank', -money(amount)),
+        ])
+    ])
+
+
+def balance(user_id):
+    """{account: amount, 'available': amount} from the latest snapshot plus the tail."""
+    snapshot = (
+        LedgerSnapshot.objects.filter(user_id=user_id)
+        .order_by('-through_entry_id').first()
+    )
+    result = {a: money(getattr(snapshot, a)) if snapshot else ZERO for a in ACCOUNTS}
+    tail = LedgerEntry.objects.filter(
+        user_id=user_id, id__gt=snapshot.through_entry_id if snapshot else 0,
+    ).values('account').annotate(total=Sum('amount')).order_by()
+    for row in tail:
+        result[row['account']] += money(row['total'])
+    result['available'] = available(result)
+    return result
+
+
+def committed_high_water():
+    """Highest entry id below which no posting transaction is still open."""
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [POSTING_LOCK])
+        return LedgerEntry.objects.aggregate(high=Max('id'))['high']
+
+
+def take_snapshots():
+    """Snapshot every user with entries since the previous run. Returns rows written.
+
+    Entries are covered up to ``committed_high_water()``, so a transaction
+    that took its id earlier but commits later cannot slip in below a
+    snapshot's ``through_entry_id``.
+    """
+    high = committed_high_water()
+    low = LedgerSnapshot.objects.aggregate(low=Max('through_entry_id'))['low'] or 0
+    if not high or high <= low:
+        return 0
+    user_ids = (
+        LedgerEntry.objects.filter(id__gt=low, id__lte=high, user__isnull=False)
+        .values_list('user_id', flat=True).distinct().order_by('user_id')
+    )
+    written = 0
+    for start in range(0, len(user_ids), SNAPSHOT_CHUNK):
+        chunk = list(user_ids[start:start + SNAPSHOT_CHUNK])
+        latest_through = (
+            LedgerSnapshot.objects.filter(user_id=OuterRef('user_id'))
+            .order_by('-through_entry_id').values('through_entry_id')[:1]
+        )
+        latest = {
+            snap.user_id: snap
+            for snap in LedgerSnapshot.objects.filter(
+                user_id__in=chunk, through_entry_id=Subquery(latest_through),
+            )
+        }
+        balances = {
+            uid: {a: money(getattr(latest[uid], a)) if uid in latest else ZERO for a in ACCOUNTS}
+            for uid in chunk
+        }
+        # each user's tail since their own snapshot; users without one start at 0
+        floor = min((s.through_entry_id for s in latest.values()), default=0) if len(latest) == len(chunk) else 0
+        for user_id, account, entry_id, amount in (
+            LedgerEntry.objects.filter(user_id__in=chunk, id__gt=floor, id__lte=high)
+            .values_list('user_id', 'account', 'id', 'amount').order_by().iterator(chunk_size=INSERT_BATCH)
+        ):
+            snap = latest.get(user_id)
+            if snap is None or entry_id > snap.through_entry_id:
+                balances[user_id][account] += money(amount)
+        LedgerSnapshot.objects.bulk_create([
+            LedgerSnapshot(user_id=uid, through_entry_id=high, **balances[uid]) for uid in chunk
+        ], batch_size=INSERT_BATCH, ignore_conflicts=True)
+        written += len(chunk)
+    return written
+
+
+class Replay:
+    """Stream the ledger in id order and report every inconsistency.
+
+    Running per-user balances are compared with each snapshot when the
+    stream passes its ``through_entry_id``; afterwards ``balances`` holds
+    every user's full-history balances.
+    """
+
+    def __init__(self, chunk_size=5000):
+        self.chunk_size = chunk_size
+        self.balances = defaultdict(lambda: dict.fromkeys(ACCOUNTS, ZERO))
+        self.entries = 0
+        self.snapshots = 0
+
+    def _snapshot_problems(self, snapshot):
+        user_id, through, *stored = snapshot
+        self.snapshots += 1
+        replayed = self.balances[user_id]
+        for account, value in zip(ACCOUNTS, stored):
+            if money(value) != replayed[account]:
+                yield 'snapshot', (
+                    f'user={user_id} through={through} {account}: '
+                    f'stored={money(value)} replayed={replayed[account]}'
+                )
+
+    def problems(self):
+        """Yield (kind, detail) for bad snapshots, unknown accounts and unbalanced txns."""
+        snapshots = (
+            LedgerSnapshot.objects.order_by('through_entry_id', 'user_id')
+            .values_list('user_id', 'through_entry_id', *ACCOUNTS).iterator(chunk_size=self.chunk_size)
+        )
+        snapshot = next(snapshots, None)
+        last_id = 0
+        while True:
+            rows = list(
+                LedgerEntry.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'user_id', 'account', 'amount')[:self.chunk_size]
+            )
+            if not rows:
+                break
+            for entry_id, user_id, account, amount in rows:
+                while snapshot is not None and snapshot[1] < entry_id:
+                    yield from self._snapshot_problems(snapshot)
+                    snapshot = next(snapshots, None)
+                self.entries += 1
+                if user_id is None:
+                    continue
+                if account not in ACCOUNTS:
+                    yield 'account', f'entry={entry_id} user={user_id} unknown account {account}'
+                    continue
+                self.balances[user_id][account] += money(amount)
+            last_id = rows[-1][0]
+        while snapshot is not None:
+            yield from self._snapshot_problems(snapshot)
+            snapshot = next(snapshots, None)
+
+        for row in (
+            LedgerEntry.objects.values('txn').annotate(total=Sum('amount'))
+            .exclude(total=0).order_by().iterator(chunk_size=self.chunk_size)
+        ):
+            if money(row['total']):  # SQLite sums decimals as floats: 1e-10 is zero
+                yield 'unbalanced', f"txn={row['txn']} sums to {money(row['total'])}"
@@ -0,0 +1,219 @@
+# app/services/mailer.py
+import atexit
+import os
+import queue
+import random
+import smtplib
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+RETRYABLE = (smtplib.SMTPException, OSError)
+LATENCY_SAMPLES = 1000
+_STOP = object()
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _permanent(error):
+    # 5xx replies will not succeed on retry; drop that message only
+    return 500 <= error.smtp_code < 600
+
+
+class Mailer:
+    """Per-process delivery thread with one long-lived email connection.
+
+    Messages queued with ``send`` are grouped into micro-batches (up to
+    ``batch_size`` or whatever arrives within ``batch_wait`` seconds) and
+    written over the same SMTP session. A dropped connection is reopened
+    and the unsent remainder retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, batch_size=None, batch_wait=None, max_retries=None,
+                 backoff=None, max_idle=None, max_queue=None):
+        self.batch_size = batch_size or _setting('EMAIL_BATCH_SIZE', 50)
+        self.batch_wait = batch_wait if batch_wait is not None else _setting('EMAIL_BATCH_WAIT_MS', 50) / 1000
+        self.max_retries = max_retries if max_retries is not None else _setting('EMAIL_MAX_RETRIES', 4)
+        self.backoff = backoff if backoff is not None else _setting('EMAIL_RETRY_BACKOFF_SECONDS', 0.5)
+        self.max_idle = max_idle or _setting('EMAIL_CONNECTION_MAX_IDLE', 30)
+        self.max_queue = max_queue or _setting('EMAIL_QUEUE_SIZE', 10000)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # also runs in a forked child, where the parent's thread is gone
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = None
+        self._connection = None
+        self._last_used = 0.0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.counters = {
+            'sent': 0, 'failed': 0, 'retries': 0, 'batches': 0, 'connections': 0,
+        }
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='mailer', daemon=True)
+                self._thread.start()
+
+    def send(self, message):
+        """Queue an EmailMessage for delivery. Raises QueueFull."""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((time.monotonic(), message))
+        except queue.Full:
+            raise QueueFull(f'{self.max_queue} emails already queued')
+
+    # -- delivery thread -------------------------------------------------
+
+    def _run(self):
+        while True:
+            batch, stop = self._next_batch()
+            if batch:
+                try:
+                    self._deliver(batch)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+            if stop:
+                self._close()
+                return
+
+    def _next_batch(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.max_idle)
+                break
+            except queue.Empty:
+                self._close()
+        if item is _STOP:
+            self._queue.task_done()
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.task_done()
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _open(self):
+        if self._connection is not None and time.monotonic() - self._last_used > self.max_idle:
+            self._close()
+        if self._connection is None:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            self._connection = connection
+            self.counters['connections'] += 1
+        return self._connection
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    def _deliver(self, batch):
+        self.counters['batches'] += 1
+        pending = list(batch)
+        attempt = 0
+        while pending:
+            try:
+                connection = self._open()
+                while pending:
+                    queued_at, message = pending[0]
+                    try:
+                        connection.send_messages([message])
+                    except smtplib.SMTPResponseException as e:
+                        if not _permanent(e):
+                            raise
+                        self.counters['failed'] += 1
+                        print(f'[Mailer] rejected {message.to}: {e.smtp_code} {e.smtp_error!r}')
+                    except smtplib.SMTPRecipientsRefused as e:
+                        self.counters['failed'] += 1
+                        print(f'[Mailer] rejected {message.to}: {e.recipients}')
+                    else:
+                        self._last_used = time.monotonic()
+                        with self._lock:
+                            self._latencies.append((self._last_used - queued_at) * 1000)
+                        self.counters['sent'] += 1
+                    pending.pop(0)
+            except RETRYABLE as e:
+                self._close()
+                if attempt >= self.max_retries:
+                    self.counters['failed'] += len(pending)
+                    print(f'[Mailer] giving up on {len(pending)} emails: {e}')
+                    return
+                self.counters['retries'] += 1
+                time.sleep(self.backoff * (2 ** attempt) * (1 + random.random()))
+                attempt += 1
+
+    # -- control / metrics -----------------------------------------------
+
+    def flush(self, timeout=10):
+        """Wait until every queued message has been attempted."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def shutdown(self, timeout=10):
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+
+        def pct(p):
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2)
+
+        return dict(
+            self.counters,
+            queueDepth=self._queue.qsize(),
+            latencyMs={'p50': pct(0.50), 'p95': pct(0.95), 'p99': pct(0.99)},
+        )
+
+
+_mailer = None
+_mailer_lock = threading.Lock()
+
+
+def get_mailer():
+    global _mailer
+    if _mailer is None:
+        with _mailer_lock:
+            if _mailer is None:
+                _mailer = Mailer()
+                atexit.register(shutdown)
+    return _mailer
+
+
+def shutdown():
+    if _mailer is not None:
+        _mailer.shutdown()
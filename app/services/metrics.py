@@ -0,0 +1,329 @@
+# app/services/metrics.py
+"""Request/task histograms in the Prometheus text format.
+
+``observe`` adds to a per-thread shard (a plain dict owned by one thread),
+so the hot path takes no lock; ``collect`` sums the shards. With
+METRICS_DIR set every process (gunicorn worker, Celery child) also dumps
+its totals to ``<METRICS_DIR>/metrics-<pid>.json`` every
+METRICS_FLUSH_SECONDS and at exit, and ``render`` merges every file so a
+scrape of any worker sees the whole deployment. Files of exited
+processes are kept: their counts are part of the running totals.
+
+DB queries are counted by an execute wrapper installed on every
+connection. It adds to the stats of the request in the ``_request``
+context variable, which asgiref carries into ``sync_to_async`` threads,
+so async views are measured as well.
+"""
+import atexit
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+
+HISTOGRAMS = {
+    'ankuon_http_request_duration_seconds': ('Request latency by route.', LATENCY_BUCKETS),
+    'ankuon_http_db_queries': ('Database queries per request.', QUERY_BUCKETS),
+    'ankuon_http_db_duration_seconds': ('Time spent in database queries per request.', LATENCY_BUCKETS),
+    'ankuon_http_response_size_bytes': ('Response body size.', SIZE_BUCKETS),
+    'ankuon_celery_task_duration_seconds': ('Celery task run time.', TASK_BUCKETS),
+}
+COUNTERS = {
+    'ankuon_security_log_rows_total': 'SecurityLog rows by outcome of the buffered writer.',
+    'ankuon_mailer_messages_total': 'OTP mails by outcome of the pooled SMTP sender.',
+    'ankuon_db_replica_reads_total': 'Reads that asked for the replica, by where they were sent.',
+}
+
+_request = ContextVar('ankuon_metrics_request', default=None)
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+_task_started = {}
+_flusher = None
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enabled():
+    return _setting('METRICS_ENABLED', True)
+
+
+# -- recording -----------------------------------------------------------------
+
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = _local.shard = {}
+        with _shards_lock:
+            _shards.append(shard)
+        _ensure_flusher()
+    return shard
+
+
+def observe(name, labels, value):
+    """Add ``value`` to histogram ``name``; ``labels`` is a tuple of (key, value) pairs."""
+    buckets = HISTOGRAMS[name][1]
+    shard = _shard()
+    entry = shard.get((name, labels))
+    if entry is None:
+        # one slot per bucket, +Inf, then the sum
+        entry = shard[(name, labels)] = [0] * (len(buckets) + 2)
+    entry[bisect_left(buckets, value)] += 1
+    entry[-1] += value
+
+
+def _observe_query(execute, sql, params, many, context):
+    stats = _request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - start
+
+
+def _install_wrapper(sender=None, connection=None, **kwargs):
+    if _observe_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_observe_query)
+
+
+def install():
+    """Count queries on this thread's open connections and every new one."""
+    connection_created.connect(_install_wrapper, dispatch_uid='ankuon-metrics')
+    for connection in connections.all(initialized_only=True):
+        _install_wrapper(connection=connection)
+
+
+def start_request():
+    """Begin counting this request's queries; returns its [count, seconds]."""
+    stats = [0, 0.0]
+    _request.set(stats)
+    return stats
+
+
+def discard_request():
+    _request.set(None)
+
+
+def finish_request(route, method, status, started, db, size=None):
+    _request.set(None)
+    labels = (('route', route), ('method', method), ('status', str(status)))
+    observe('ankuon_http_request_duration_seconds', labels, time.perf_counter() - started)
+    observe('ankuon_http_db_queries', labels, db[0])
+    observe('ankuon_http_db_duration_seconds', labels, db[1])
+    if size is not None:
+        observe('ankuon_http_response_size_bytes', labels, size)
+
+
+def task_started(task_id):
+    _task_started[task_id] = time.perf_counter()
+
+
+def task_finished(task_id, name, state):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        observe(
+            'ankuon_celery_task_duration_seconds',
+            (('task', name), ('state', state or 'UNKNOWN')),
+            time.perf_counter() - started,
+        )
+
+
+def _reset_after_fork():
+    global _flusher
+    # the child starts from zero; the parent's totals are in the parent's file
+    _local.__dict__.clear()
+    _shards.clear()
+    _task_started.clear()
+    _flusher = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# -- aggregation -------------------------------------------------------------------
+
+def _service_counters():
+    """Counters kept by this process's background writers, if it started any."""
+    from app.services import mailer, replica, security_log
+
+    values = {}
+    writer = security_log._writer
+    if writer is not None and writer._pid == os.getpid():
+        for outcome in ('written', 'overflow', 'failed', 'dropped'):
+            values[('ankuon_security_log_rows_total', (('outcome', outcome),))] = writer.counters[outcome]
+    sender = mailer._mailer
+    if sender is not None and sender._pid == os.getpid():
+        for outcome in ('sent', 'failed', 'retries'):
+            values[('ankuon_mailer_messages_total', (('outcome', outcome),))] = sender.counters[outcome]
+    if replica.configured():
+        for route, count in replica.counters.items():
+            values[('ankuon_db_replica_reads_total', (('route', route),))] = count
+    return values
+
+
+def collect():
+    """({(name, labels): slots}, {(name, labels): value}) for this process."""
+    histograms = {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        for key, entry in list(shard.items()):
+            total = histograms.get(key)
+            if total is None:
+                histograms[key] = list(entry)
+            else:
+                for i, value in enumerate(entry):
+                    total[i] += value
+    return histograms, _service_counters()
+
+
+def _path(pid=None):
+    return Path(_setting('METRICS_DIR', '')) / f'metrics-{pid or os.getpid()}.json'
+
+
+def flush():
+    """Write this process's totals to METRICS_DIR (no-op without it)."""
+    if not _setting('METRICS_DIR', ''):
+        return
+    histograms, counters = collect()
+    if not histograms and not counters:
+        return
+    path = _path()
+    tmp = path.with_suffix('.tmp')
+    tmp.write_text(json.dumps({
+        'histograms': [[name, labels, entry] for (name, labels), entry in histograms.items()],
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+    }))
+    os.replace(tmp, path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(_setting('METRICS_FLUSH_SECONDS', 5))
+        try:
+            flush()
+        except OSError as e:
+            print(f'[Metrics] flush failed: {e}')
+
+
+def _ensure_flusher():
+    global _flusher
+    if _flusher is None and _setting('METRICS_DIR', ''):
+        _flusher = threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True)
+        _flusher.start()
+        atexit.register(flush)
+
+
+def merged():
+    """Totals over every process that wrote to METRICS_DIR, or this process alone."""
+    if not _setting('METRICS_DIR', ''):
+        return collect()
+    flush()
+    histograms, counters = {}, {}
+    for path in Path(_setting('METRICS_DIR', '')).glob('metrics-*.json'):
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # replaced or removed mid-read
+        for name, labels, entry in data['histograms']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            total = histograms.setdefault(key, [0] * len(entry))
+            for i, value in enumerate(entry):
+                total[i] += value
+        for name, labels, value in data['counters']:
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+    return histograms, counters
+
+
+# -- exposition ----------------------------------------------------------------
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _gauges():
+    """Deployment-wide state read from the database and cache at scrape time."""
+    from app.services import cashfree_webhook, idempotency, replica, va_pool
+
+    lag = cashfree_webhook.inbox_lag()
+    pool = va_pool.metrics()
+    dedup = idempotency.stats()
+    replica_lag = replica.lag() if replica.configured() else None
+    return [
+        ('ankuon_webhook_inbox_pending', 'gauge', 'Webhook events waiting to be applied.',
+         [((), lag['pending'])]),
+        ('ankuon_webhook_inbox_oldest_age_seconds', 'gauge', 'Age of the oldest pending webhook event.',
+         [((), lag['oldestAgeSeconds'])]),
+        ('ankuon_webhook_dedup_total', 'counter', 'Webhook deduplication lookups by result.',
+         [((('result', k),), v) for k, v in dedup.items()]),
+        ('ankuon_va_pool_accounts', 'gauge', 'Pooled virtual accounts by status.',
+         [((('status', 'available'),), pool['available']), ((('status', 'claimed'),), pool['claimed'])]),
+        ('ankuon_va_pool_claims_total', 'counter', 'VA pool claims by result.',
+         [((('result', k),), v) for k, v in pool['claims'].items()]),
+    ] + ([
+        ('ankuon_db_replica_lag_seconds', 'gauge', 'Replication lag of the read replica.',
+         [((), replica_lag)]),
+    ] if replica_lag is not None else [])
+
+
+def render():
+    histograms, counters = merged()
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        series = sorted((labels, entry) for (n, labels), entry in histograms.items() if n == name)
+        if not series:
+            continue
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for labels, entry in series:
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), entry):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels((*labels, ("le", bound)))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(entry[-1])}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    for name, help_text in COUNTERS.items():
+        series = sorted((labels, value) for (n, labels), value in counters.items() if n == name)
+        if series:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f'{name}{_labels(labels)} {value}' for labels, value in series]
+    for name, kind, help_text, series in _gauges():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        lines += [f'{name}{_labels(labels)} {_number(value)}' for labels, value in series]
+    return '\n'.join(lines) + '\n'
+
+
+def token_ok(request):
+    """``Authorization: Bearer <METRICS_TOKEN>`` for scrapers."""
+    token = _setting('METRICS_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode())
@@ -0,0 +1,256 @@
+# app/services/order_ids.py
+"""Monotonic, collision-free order ids.
+
+    AO2-20261018-0DQ3ZJ8W1K7G2
+
+The tail is a Snowflake-style 63-bit number -- 41 bits of milliseconds
+since EPOCH_MS, ORDER_ID_NODE_BITS of node id and the rest a per-millisecond
+sequence -- written as 13 Crockford base32 characters. Ids from one node are
+strictly increasing, and ids from all nodes sort by creation time, so new
+rows land at the right edge of the order_id index instead of at random
+pages. The date part keeps the old ``AO2-YYYYMMDD-`` shape that staff,
+bank remarks and the reconciliation parser already know.
+
+Uniqueness across processes relies on distinct node ids. Each process
+(forked workers included) leases a free node from the OrderIdNode table and
+renews the lease at half its ORDER_ID_LEASE_SECONDS; a node whose lease ran
+out is handed to the next process, whose ids start at the old lease's
+expiry so a restart with a slow clock cannot repeat them. ORDER_ID_NODE
+pins one node instead (then every process must get its own value).
+Callers still retry an insert that hits an existing order_id, the backstop
+for clock skew between hosts.
+"""
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from app.models import OrderIdNode
+
+PREFIX = 'AO2'
+EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+TIMESTAMP_BITS = 41
+TAIL_LENGTH = 13
+LEASE_CANDIDATES = 16  # expired nodes a process picks from, so racing processes rarely collide
+LEASE_ATTEMPTS = 5
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32, no I L O U
+_DECODE = {ch: i for i, ch in enumerate(ALPHABET)}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _encode(number):
+    chars = []
+    for _ in range(TAIL_LENGTH):
+        number, digit = divmod(number, 32)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+@lru_cache(maxsize=4)
+def _day(day_number):
+    return datetime.fromtimestamp(day_number * 86400, tz=dt_timezone.utc).strftime('%Y%m%d')
+
+
+def format_id(number):
+    ms = (number >> (63 - TIMESTAMP_BITS)) + EPOCH_MS
+    return f'{PREFIX}-{_day(ms // 86400000)}-{_encode(number)}'
+
+
+class OrderIdGenerator:
+    """Thread-safe Snowflake generator for one node.
+
+    If the wall clock steps backwards the generator keeps counting from the
+    last millisecond it issued, and a full sequence borrows the next
+    millisecond, so ids never repeat and never go backwards. ``start_ms``
+    is the earliest millisecond it may use.
+    """
+
+    def __init__(self, node, node_bits=10, clock=None, start_ms=None):
+        self.node_bits = node_bits
+        self.sequence_bits = 63 - TIMESTAMP_BITS - node_bits
+        if not 0 <= node < (1 << node_bits):
+            raise ValueError(f'node must be in [0, {1 << node_bits})')
+        self.node = node
+        self.clock = clock or (lambda: int(time.time() * 1000))
+        # (start_ms, -1): the first slot handed out is (start_ms, 0) unless the clock is later
+        self._last_ms, self._sequence = (start_ms, -1) if start_ms is not None else (-1, 0)
+        self._lock = threading.Lock()
+
+    def _pack(self, ms, sequence):
+        return (
+            ((ms - EPOCH_MS) << (self.node_bits + self.sequence_bits))
+            | (self.node << self.sequence_bits)
+            | sequence
+        )
+
+    def _take(self, count):
+        """Reserve ``count`` consecutive (ms, sequence) slots. Caller holds the lock."""
+        slots = []
+        max_sequence = (1 << self.sequence_bits) - 1
+        now = self.clock()
+        if now > self._last_ms:
+            self._last_ms, self._sequence = now, 0
+        else:
+            self._sequence += 1
+        while len(slots) < count:
+            if self._sequence > max_sequence:
+                self._last_ms += 1
+                self._sequence = 0
+            take = min(count - len(slots), max_sequence - self._sequence + 1)
+            slots.extend(self._pack(self._last_ms, s) for s in range(self._sequence, self._sequence + take))
+            self._sequence += take
+        # leave _sequence pointing at the last slot handed out
+        self._sequence -= 1
+        return slots
+
+    def next_number(self):
+        with self._lock:
+            return self._take(1)[0]
+
+    def next_id(self):
+        return format_id(self.next_number())
+
+    def reserve(self, count):
+        """``count`` consecutive ids in one lock acquisition, for bulk imports."""
+        if count <= 0:
+            return []
+        with self._lock:
+            numbers = self._take(count)
+        return [format_id(n) for n in numbers]
+
+
+def decode(order_id):
+    """(created_at, node, sequence) for an id issued by this module, else None."""
+    tail = order_id.rsplit('-', 1)[-1].upper()
+    if len(tail) != TAIL_LENGTH or any(ch not in _DECODE for ch in tail):
+        return None
+    number = 0
+    for ch in tail:
+        number = number * 32 + _DECODE[ch]
+    node_bits = _setting('ORDER_ID_NODE_BITS', 10)
+    sequence_bits = 63 - TIMESTAMP_BITS - node_bits
+    ms = (number >> (node_bits + sequence_bits)) + EPOCH_MS
+    return (
+        datetime.fromtimestamp(ms / 1000, tz=dt_timezone.utc),
+        (number >> sequence_bits) & ((1 << node_bits) - 1),
+        number & ((1 << sequence_bits) - 1),
+    )
+
+
+def _lease_ttl():
+    return timedelta(seconds=_setting('ORDER_ID_LEASE_SECONDS', 600))
+
+
+def acquire_node(node_bits):
+    """Lease a free node: (node, holder, previous lease expiry). Raises RuntimeError when none is free."""
+    size = 1 << node_bits
+    holder = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'[-100:]
+    if OrderIdNode.objects.filter(node__lt=size).count() < size:
+        OrderIdNode.objects.bulk_create(
+            [OrderIdNode(node=n, expires_at=datetime.fromtimestamp(0, tz=dt_timezone.utc)) for n in range(size)],
+            ignore_conflicts=True,
+        )
+    for _ in range(LEASE_ATTEMPTS):
+        now = timezone.now()
+        free = list(
+            OrderIdNode.objects.filter(node__lt=size, expires_at__lt=now)
+            .order_by('expires_at').values_list('node', 'expires_at')[:LEASE_CANDIDATES]
+        )
+        if not free:
+            break
+        node, expired = random.choice(free)
+        # compare-and-swap on the old expiry: exactly one racing process wins the node
+        with transaction.atomic():
+            won = OrderIdNode.objects.filter(node=node, expires_at=expired).update(
+                holder=holder, expires_at=now + _lease_ttl(),
+            )
+        if won:
+            return node, holder, expired
+    raise RuntimeError(f'no free order id node among {size}; raise ORDER_ID_NODE_BITS')
+
+
+def renew_node(node, holder):
+    """Extend our lease; False if it expired and another process took the node."""
+    with transaction.atomic():
+        return bool(OrderIdNode.objects.filter(node=node, holder=holder).update(
+            expires_at=timezone.now() + _lease_ttl(),
+        ))
+
+
+_generator = None
+_generator_pid = None
+_lease = None  # (node, holder, monotonic renew-by) while the node is leased
+_generator_lock = threading.Lock()
+
+
+def _current():
+    """The generator if it can issue without touching the database, else None."""
+    generator, lease = _generator, _lease
+    if generator is None or _generator_pid != os.getpid():
+        return None
+    if lease is not None and time.monotonic() >= lease[2]:
+        return None
+    return generator
+
+
+def _build():
+    global _generator, _generator_pid, _lease
+    node_bits = _setting('ORDER_ID_NODE_BITS', 10)
+    node = _setting('ORDER_ID_NODE', None)
+    if node is not None:
+        _generator, _lease = OrderIdGenerator(int(node), node_bits=node_bits), None
+    else:
+        node, holder, expired = acquire_node(node_bits)
+        _generator = OrderIdGenerator(node, node_bits=node_bits, start_ms=int(expired.timestamp() * 1000))
+        _lease = (node, holder, time.monotonic() + _lease_ttl().total_seconds() / 2)
+    _generator_pid = os.getpid()
+
+
+def get_generator():
+    """Per-process generator on a leased node; a forked worker leases its own."""
+    global _lease
+    generator = _current()
+    if generator is not None:
+        return generator
+    with _generator_lock:
+        if _current() is None:
+            if _generator is not None and _generator_pid == os.getpid() and _lease is not None:
+                node, holder, _ = _lease
+                if renew_node(node, holder):
+                    _lease = (node, holder, time.monotonic() + _lease_ttl().total_seconds() / 2)
+                else:
+                    _build()
+            else:
+                _build()
+        return _generator
+
+
+def reset_generator():
+    global _generator, _lease
+    _generator = _lease = None
+
+
+def new_order_id():
+    return get_generator().next_id()
+
+
+async def anew_order_id():
+    """``new_order_id`` for async views: the lease is only touched on the sync thread."""
+    generator = _current() or await sync_to_async(get_generator)()
+    return generator.next_id()
+
+
+def reserve(count):
+    return get_generator().reserve(count)
@@ -0,0 +1,282 @@
+# app/services/otp.py
+import abc
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is in requirements.txt
+    redis = None
+
+KEY_PREFIX = 'otp'
+MEMORY_PRUNE_AT = 10000
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# verify outcomes
+OK = 'ok'
+INVALID = 'invalid'
+EXPIRED = 'expired'
+LOCKED = 'locked'
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Too many OTP requests, retry in {retry_after}s')
+        self.retry_after = retry_after
+
+
+class StoreUnavailable(Exception):
+    """The shared OTP store could not be reached; no code was issued or checked."""
+
+
+def _setting(name, default):
+    return int(getattr(settings, name, default))
+
+
+def _digest(email, code):
+    # only a keyed hash of the code is stored
+    message = f'{email}:{code}'.encode('utf-8')
+    return hmac.new(settings.SECRET_KEY.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def generate_code():
+    return f'{secrets.randbelow(900000) + 100000}'
+
+
+class OtpStore(abc.ABC):
+    """Expiring one-time codes with attempt counting and per-email send limits."""
+
+    def __init__(self):
+        self.ttl = _setting('OTP_TTL_SECONDS', 300)
+        self.max_attempts = _setting('OTP_MAX_ATTEMPTS', 5)
+        self.send_limit = _setting('OTP_SEND_LIMIT', 5)
+        self.send_window = _setting('OTP_SEND_WINDOW_SECONDS', 3600)
+
+    def issue(self, email, name=''):
+        """Create a fresh code for ``email``. Raises RateLimited."""
+        code = generate_code()
+        self._issue(email, _digest(email, code), name)
+        return code
+
+    def verify(self, email, code):
+        """Return (outcome, name stored at issue time)."""
+        return self._verify(email, _digest(email, code))
+
+    @abc.abstractmethod
+    def _issue(self, email, digest, name):
+        """Store ``digest`` as the current code for ``email``. Raises RateLimited."""
+
+    @abc.abstractmethod
+    def _verify(self, email, digest):
+        """Return (outcome, name), consuming the code on OK and on LOCKED."""
+
+
+class MemoryOtpStore(OtpStore):
+    """In-process store for development; codes are only visible to the issuing worker."""
+
+    def __init__(self):
+        super().__init__()
+        self._codes = {}
+        self._sends = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        for table in (self._codes, self._sends):
+            if len(table) > MEMORY_PRUNE_AT:
+                for key in [k for k, v in table.items() if v['expires'] <= now]:
+                    del table[key]
+
+    def _issue(self, email, digest, name):
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            window = self._sends.get(email)
+            if not window or window['expires'] <= now:
+                window = self._sends[email] = {'expires': now + self.send_window, 'count': 0}
+            if window['count'] >= self.send_limit:
+                raise RateLimited(int(window['expires'] - now) + 1)
+            window['count'] += 1
+            self._codes[email] = {
+                'digest': digest, 'name': name, 'attempts': 0,
+                'expires': now + self.ttl,
+            }
+
+    def _verify(self, email, digest):
+        now = time.monotonic()
+        with self._lock:
+            record = self._codes.get(email)
+            if not record or record['expires'] <= now:
+                self._codes.pop(email, None)
+                return EXPIRED, ''
+            if hmac.compare_digest(record['digest'], digest):
+                del self._codes[email]
+                return OK, record['name']
+            record['attempts'] += 1
+            if record['attempts'] >= self.max_attempts:
+                del self._codes[email]
+                return LOCKED, ''
+            return INVALID, ''
+
+
+VERIFY_SCRIPT = """
+local record = redis.call('HMGET', KEYS[1], 'digest', 'name')
+if not record[1] then
+    return {'expired', ''}
+end
+if record[1] == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return {'ok', record[2] or ''}
+end
+local attempts = redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+if attempts >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+    return {'locked', ''}
+end
+return {'invalid', ''}
+"""
+
+
+class RedisOtpStore(OtpStore):
+    """Shared across workers; verification runs as one Lua script."""
+
+    def __init__(self, url):
+        super().__init__()
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self._verify_script = self.client.register_script(VERIFY_SCRIPT)
+
+    def _issue(self, email, digest, name):
+        try:
+            self._issue_redis(email, digest, name)
+        except redis.exceptions.RedisError as e:
+            raise StoreUnavailable(str(e)) from e
+
+    def _verify(self, email, digest):
+        try:
+            outcome, name = self._verify_script(
+                keys=[f'{KEY_PREFIX}:code:{email}'], args=[digest, self.max_attempts],
+            )
+        except redis.exceptions.RedisError as e:
+            raise StoreUnavailable(str(e)) from e
+        return outcome, name
+
+    def _issue_redis(self, email, digest, name):
+        sends_key = f'{KEY_PREFIX}:sends:{email}'
+        pipe = self.client.pipeline()
+        pipe.set(sends_key, 0, ex=self.send_window, nx=True)
+        pipe.incr(sends_key)
+        pipe.ttl(sends_key)
+        _, count, ttl = pipe.execute()
+        if count > self.send_limit:
+            raise RateLimited(max(ttl, 1))
+        code_key = f'{KEY_PREFIX}:code:{email}'
+        pipe = self.client.pipeline()
+        pipe.delete(code_key)
+        pipe.hset(code_key, mapping={'digest': digest, 'name': name, 'attempts': 0})
+        pipe.expire(code_key, self.ttl)
+        pipe.execute()
+
+
+class CacheOtpStore(OtpStore):
+    """Codes in the Django cache, for deployments whose cache is shared but not Redis.
+
+    Counters use ``add`` + ``incr`` and a code is consumed by whichever
+    request's ``delete`` removes it, so each code still logs in once.
+    """
+
+    def _key(self, kind, email):
+        return f'{KEY_PREFIX}:{kind}:{email}'
+
+    def _incr(self, key, timeout):
+        try:
+            return cache.incr(key)
+        except ValueError:
+            if cache.add(key, 1, timeout=timeout):
+                return 1
+            return cache.incr(key)
+
+    def _issue(self, email, digest, name):
+        now = time.time()
+        cache.add(self._key('sends_until', email), now + self.send_window, timeout=self.send_window)
+        if self._incr(self._key('sends', email), self.send_window) > self.send_limit:
+            until = cache.get(self._key('sends_until', email)) or now + self.send_window
+            raise RateLimited(max(int(until - now), 1))
+        cache.delete(self._key('attempts', email))
+        cache.set(self._key('code', email), {'digest': digest, 'name': name}, timeout=self.ttl)
+
+    def _verify(self, email, digest):
+        code_key = self._key('code', email)
+        record = cache.get(code_key)
+        if not record:
+            return EXPIRED, ''
+        if hmac.compare_digest(record['digest'], digest):
+            return (OK, record['name']) if cache.delete(code_key) else (EXPIRED, '')
+        if self._incr(self._key('attempts', email), self.ttl) >= self.max_attempts:
+            cache.delete(code_key)
+            return LOCKED, ''
+        return INVALID, ''
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _redis_url():
+    url = getattr(settings, 'REDIS_URL', '') or getattr(settings, 'CELERY_BROKER_URL', '') or ''
+    return url if url.startswith(('redis://', 'rediss://', 'unix://')) else ''
+
+
+def _build_store():
+    """The store named by OTP_STORE, or the first shared one available.
+
+    Redis (REDIS_URL, else a Redis CELERY_BROKER_URL), then the Django
+    cache when it is not process-local. Without either, codes issued by
+    one worker could not be verified by another, so that is an error
+    outside DEBUG.
+    """
+    kind = getattr(settings, 'OTP_STORE', '')
+    if not kind:
+        if _redis_url() and redis is not None:
+            kind = 'redis'
+        elif settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+            kind = 'cache'
+        elif settings.DEBUG:
+            print('[OTP] no shared store (set REDIS_URL): codes only verify on the issuing worker')
+            kind = 'memory'
+        else:
+            raise ImproperlyConfigured(
+                'OTP codes need a shared store: set REDIS_URL, a Redis CELERY_BROKER_URL, '
+                'a shared CACHES backend, or OTP_STORE'
+            )
+    if kind == 'redis':
+        if not _redis_url() or redis is None:
+            raise ImproperlyConfigured('OTP_STORE=redis needs the redis package and REDIS_URL')
+        return RedisOtpStore(_redis_url())
+    if kind == 'cache':
+        return CacheOtpStore()
+    if kind == 'memory':
+        return MemoryOtpStore()
+    raise ImproperlyConfigured(f'Unknown OTP_STORE {kind!r}')
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = _build_store()
+    return _store
+
+
+def reset_store():
+    global _store
+    _store = None
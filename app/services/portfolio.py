@@ -0,0 +1,204 @@
+# app/services/portfolio.py
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import F, Sum, Case, When, Value
+
+from app.models import UserProfile, Investment, Withdrawal, PortfolioBalance
+from app.services import bulk_sql
+
+ZERO = Decimal('0.00')
+BALANCE_FIELDS = (
+    'confirmed_principal',
+    'accrued_returns',
+    'pending_withdrawals',
+    'completed_withdrawals',
+)
+UPDATE_CHUNK = 500
+
+
+def _dec(value):
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+def _available(delta):
+    return (
+        delta['confirmed_principal'] + delta['accrued_returns']
+        - delta['pending_withdrawals'] - delta['completed_withdrawals']
+    )
+
+
+def _ensure_rows(user_ids):
+    PortfolioBalance.objects.bulk_create(
+        [PortfolioBalance(user_id=uid) for uid in user_ids],
+        ignore_conflicts=True,
+    )
+
+
+def apply_deltas(deltas):
+    """Add per-user deltas ({user_id: {field: amount}}) to the balance table.
+
+    Must run inside the transaction that performs the money movement.
+    """
+    deltas = {
+        uid: {f: _dec(d.get(f)) for f in BALANCE_FIELDS}
+        for uid, d in deltas.items()
+    }
+    deltas = {uid: d for uid, d in deltas.items() if any(d.values())}
+    if not deltas:
+        return
+    user_ids = list(deltas)
+    _ensure_rows(user_ids)
+    for start in range(0, len(user_ids), UPDATE_CHUNK):
+        chunk = user_ids[start:start + UPDATE_CHUNK]
+        updates = {}
+        for field in BALANCE_FIELDS + ('available_balance',):
+            whens = []
+            for uid in chunk:
+                d = deltas[uid]
+                value = _available(d) if field == 'available_balance' else d[field]
+                if value:
+                    whens.append(When(user_id=uid, then=Value(value)))
+            if whens:
+                updates[field] = F(field) + Case(
+                    *whens,
+                    default=Value(ZERO),
+                    output_field=models.DecimalField(max_digits=14, decimal_places=2),
+                )
+        PortfolioBalance.objects.filter(user_id__in=chunk).update(**updates)
+
+
+def add_accrued_returns(deltas):
+    """Add {user_id: change} to accrued_returns (and available_balance) in one join per chunk."""
+    deltas = {uid: _dec(d) for uid, d in deltas.items() if _dec(d)}
+    if not bulk_sql.supported():
+        return apply_deltas({uid: {'accrued_returns': d} for uid, d in deltas.items()})
+    user_ids = list(deltas)
+    for start in range(0, len(user_ids), UPDATE_CHUNK * 4):
+        chunk = user_ids[start:start + UPDATE_CHUNK * 4]
+        # nearly every user already has a row; only insert the missing ones
+        existing = set(PortfolioBalance.objects.filter(user_id__in=chunk).values_list('user_id', flat=True))
+        _ensure_rows([uid for uid in chunk if uid not in existing])
+        bulk_sql.update_from_values(
+            PortfolioBalance, 'user', ('delta',), [(uid, deltas[uid]) for uid in chunk],
+            'accrued_returns = accrued_returns + v.delta, '
+            'available_balance = available_balance + v.delta',
+        )
+
+
+def _grouped(rows, field, sign=1):
+    deltas = defaultdict(lambda: defaultdict(Decimal))
+    for user_id, amount in rows:
+        deltas[user_id][field] += sign * _dec(amount)
+    return deltas
+
+
+def investments_confirmed(rows):
+    """rows: iterable of (user_id, amount) for investments that just became Confirmed."""
+    apply_deltas(_grouped(rows, 'confirmed_principal'))
+
+
+def withdrawal_requested(user_id, amount):
+    amount = Decimal(str(amount))
+    # a negative (or NaN) request would raise available_balance instead of holding it
+    if not amount.is_finite() or _dec(amount) <= 0:
+        raise ValueError(f'invalid withdrawal amount {amount}')
+    apply_deltas({user_id: {'pending_withdrawals': amount}})
+
+
+def withdrawal_cancelled(user_id, amount):
+    apply_deltas({user_id: {'pending_withdrawals': -_dec(amount)}})
+
+
+def withdrawals_completed(rows):
+    rows = list(rows)
+    deltas = _grouped(rows, 'pending_withdrawals', sign=-1)
+    for user_id, amount in rows:
+        deltas[user_id]['completed_withdrawals'] += _dec(amount)
+    apply_deltas(deltas)
+
+
+def withdrawals_rejected(rows):
+    apply_deltas(_grouped(rows, 'pending_withdrawals', sign=-1))
+
+
+def locked_balance(user_id):
+    """Fetch the user's balance row with a row lock for a balance check."""
+    _ensure_rows([user_id])
+    return PortfolioBalance.objects.select_for_update().get(user_id=user_id)
+
+
+def _user_id_chunks(user_ids=None):
+    if user_ids is None:
+        user_ids = UserProfile.objects.order_by('id').values_list('id', flat=True).iterator(
+            chunk_size=UPDATE_CHUNK,
+        )
+    chunk = []
+    for user_id in user_ids:
+        chunk.append(user_id)
+        if len(chunk) == UPDATE_CHUNK:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def compute_from_ledger(user_ids):
+    """Recompute balances from investments and withdrawals: {user_id: {field: amount}}."""
+    result = {
+        uid: {f: ZERO for f in BALANCE_FIELDS}
+        for uid in user_ids
+    }
+    for row in Investment.objects.filter(
+        status='Confirmed', user_id__in=user_ids,
+    ).values('user_id').annotate(
+        principal=Sum('amount'), returns=Sum('returns'),
+    ).order_by():
+        result[row['user_id']]['confirmed_principal'] = _dec(row['principal'])
+        result[row['user_id']]['accrued_returns'] = _dec(row['returns'])
+    for row in Withdrawal.objects.filter(
+        status__in=['Pending', 'Completed'], user_id__in=user_ids,
+    ).values('user_id', 'status').annotate(
+        total=Sum('amount'),
+    ).order_by():
+        field = 'pending_withdrawals' if row['status'] == 'Pending' else 'completed_withdrawals'
+        result[row['user_id']][field] = _dec(row['total'])
+    for values in result.values():
+        values['available_balance'] = _available(values)
+    return result
+
+
+def verify(user_ids=None):
+    """Return [(user_id, field, stored, expected)] for every drifted balance."""
+    mismatches = []
+    for chunk in _user_id_chunks(user_ids):
+        expected = compute_from_ledger(chunk)
+        stored = {
+            b.user_id: b
+            for b in PortfolioBalance.objects.filter(user_id__in=chunk)
+        }
+        for user_id in chunk:
+            row = stored.get(user_id)
+            for field, value in expected[user_id].items():
+                current = _dec(getattr(row, field)) if row else ZERO
+                if current != value:
+                    mismatches.append((user_id, field, current, value))
+    return mismatches
+
+
+def rebuild(user_ids=None):
+    """Overwrite balance rows with values recomputed from the ledger."""
+    count = 0
+    for chunk in _user_id_chunks(user_ids):
+        expected = compute_from_ledger(chunk)
+        _ensure_rows(chunk)
+        rows = list(PortfolioBalance.objects.filter(user_id__in=chunk))
+        for row in rows:
+            for field, value in expected[row.user_id].items():
+                setattr(row, field, value)
+        PortfolioBalance.objects.bulk_update(
+            rows, BALANCE_FIELDS + ('available_balance',), batch_size=UPDATE_CHUNK,
+        )
+        count += len(rows)
+    return count
@@ -0,0 +1,125 @@
+# app/services/profile_cache.py
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from app.models import UserProfile
+
+VERSION_KEY = 'profile:v:{id}'
+
+
+class ProfileCache:
+    """Per-process LRU of UserProfile rows (with kyc) keyed by profile id.
+
+    Entries are stored pickled so every caller gets its own instance to
+    mutate. Each entry remembers the profile's version token from the
+    shared Django cache and is only served while that token is unchanged,
+    so an invalidation in one worker reaches every other; the TTL is a
+    backstop for a lost token.
+    """
+
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, profile_id, version):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(profile_id)
+            if entry and entry[0] > now and entry[1] == version:
+                self._data.move_to_end(profile_id)
+                self.hits += 1
+                return pickle.loads(entry[2])
+            if entry:
+                del self._data[profile_id]
+            self.misses += 1
+        return None
+
+    def put(self, profile, version):
+        blob = pickle.dumps(profile, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data[profile.id] = (time.monotonic() + self.ttl, version, blob)
+            self._data.move_to_end(profile.id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, profile_id):
+        with self._lock:
+            self._data.pop(profile_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+profiles = ProfileCache(
+    maxsize=getattr(settings, 'PROFILE_CACHE_SIZE', 1024),
+    ttl=getattr(settings, 'PROFILE_CACHE_TTL', 30),
+)
+
+
+def current_version(profile_id):
+    """The profile's shared version token, minting one if the cache has none.
+
+    Anything derived from the profile (cached rows, token claims) is valid
+    only while this is unchanged.
+    """
+    key = VERSION_KEY.format(id=profile_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def acurrent_version(profile_id):
+    key = VERSION_KEY.format(id=profile_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, uuid.uuid4().hex, timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def get_profile(profile_id, fresh=False):
+    """Cached profile; ``fresh`` reads the row (for views that move money on it)."""
+    # the token is read before the row, so a concurrent change leaves the entry stale-tagged
+    version = current_version(profile_id)
+    profile = None if fresh else profiles.get(profile_id, version)
+    if profile is not None:
+        return profile
+    try:
+        profile = UserProfile.objects.select_related('kyc').get(id=profile_id)
+    except UserProfile.DoesNotExist:
+        return None
+    profiles.put(profile, version)
+    return profile
+
+
+async def aget_profile(profile_id, fresh=False):
+    version = await acurrent_version(profile_id)
+    profile = None if fresh else profiles.get(profile_id, version)
+    if profile is not None:
+        return profile
+    try:
+        profile = await UserProfile.objects.select_related('kyc').aget(id=profile_id)
+    except UserProfile.DoesNotExist:
+        return None
+    profiles.put(profile, version)
+    return profile
+
+
+def invalidate(profile):
+    """Drop the local entry now and retire the shared version once the change commits."""
+    profiles.invalidate(profile.id)
+    transaction.on_commit(lambda: cache.set(VERSION_KEY.format(id=profile.id), uuid.uuid4().hex, timeout=None))
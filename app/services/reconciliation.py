@@ -0,0 +1,306 @@
+# app/services/reconciliation.py
+import csv
+import re
+from collections import namedtuple, defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from app.models import Investment
+from app.services import bulk_admin
+
+StatementEntry = namedtuple('StatementEntry', 'line amount date reference account narrative')
+Candidate = namedtuple('Candidate', 'id amount date order_id accounts')
+
+ORDER_ID_RE = re.compile(r'AO2-[0-9A-Z]+(?:-[0-9A-Z]+)*', re.IGNORECASE)
+ACCOUNT_TOKEN_RE = re.compile(r'\b[A-Z0-9]{8,}\b', re.IGNORECASE)
+MT940_LINE_RE = re.compile(
+    r'^:61:(?P<value_date>\d{6})(?:\d{4})?(?P<mark>R?[CD])[A-Z]?'
+    r'(?P<amount>[\d,]+)(?:[NFS][A-Z0-9]{3})?(?P<reference>[^/]*)(?://(?P<bank_ref>.*))?$'
+)
+DATE_FORMATS = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%d-%b-%Y', '%d %b %Y', '%Y%m%d')
+
+CSV_COLUMNS = {
+    'amount': ('amount', 'credit', 'credit_amount', 'cr'),
+    'date': ('date', 'value_date', 'txn_date', 'transaction_date'),
+    'reference': ('utr', 'reference', 'ref', 'bank_reference', 'cheque_no'),
+    'account': ('account', 'virtual_account', 'va', 'beneficiary_account', 'vaccount_id'),
+    'narrative': ('narrative', 'description', 'remarks', 'particulars'),
+    'type': ('type', 'dr_cr', 'cr_dr'),
+}
+
+CONFIRMED = 'confirmed'
+MATCHED = 'matched'  # confident, but not applied (dry run)
+AMBIGUOUS = 'ambiguous'
+UNMATCHED = 'unmatched'
+SKIPPED = 'skipped'
+DUPLICATE = 'duplicate'  # reference already applied, or repeated in this statement
+UNPARSEABLE = 'unparseable'
+
+
+def _money(value):
+    try:
+        text = str(value).replace(',', '').replace('₹', '').strip()
+        return Decimal(text).quantize(Decimal('0.01')) if text else None
+    except InvalidOperation:
+        return None
+
+
+def _unparseable(line, narrative):
+    """A statement line the parsers could not read; reported, never matched."""
+    return StatementEntry(line=line, amount=None, date=None, reference='', account='', narrative=narrative)
+
+
+def _date(value):
+    value = (value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _column(row, key):
+    for name in CSV_COLUMNS[key]:
+        value = row.get(name)
+        if value not in (None, ''):
+            return value.strip()
+    return ''
+
+
+def iter_csv(stream):
+    """Yield credit StatementEntry rows from a CSV bank statement."""
+    reader = csv.DictReader(stream)
+    reader.fieldnames = [(f or '').strip().lower() for f in reader.fieldnames or []]
+    for row in reader:
+        kind = _column(row, 'type').upper()
+        if kind.startswith('D'):
+            continue
+        text = _column(row, 'amount')
+        amount = _money(text)
+        if amount is None and text:
+            yield _unparseable(reader.line_num, text)
+            continue
+        if amount is None or amount <= 0:
+            continue
+        yield StatementEntry(
+            line=reader.line_num,
+            amount=amount,
+            date=_date(_column(row, 'date')),
+            reference=_column(row, 'reference'),
+            account=_column(row, 'account'),
+            narrative=_column(row, 'narrative'),
+        )
+
+
+def iter_mt940(stream):
+    """Yield credit StatementEntry rows from an MT940 statement, one :61: at a time."""
+    pending = None
+    narrative = []
+    in_86 = False
+
+    def flush():
+        if pending and pending['mark'] == 'C':
+            text = ' '.join(narrative)
+            return StatementEntry(
+                line=pending['line'],
+                amount=pending['amount'],
+                date=pending['date'],
+                reference=pending['reference'],
+                account='',
+                narrative=text,
+            )
+        return None
+
+    for line_no, raw in enumerate(stream, start=1):
+        line = raw.rstrip('\r\n')
+        if line.startswith(':61:'):
+            entry = flush()
+            if entry:
+                yield entry
+            narrative, in_86 = [], False
+            pending = None
+            match = MT940_LINE_RE.match(line)
+            try:
+                day = datetime.strptime(match['value_date'], '%y%m%d').date() if match else None
+            except ValueError:
+                day = None
+            if day is None:
+                yield _unparseable(line_no, line)
+                continue
+            reference = (match['reference'] or '').strip()
+            if not reference or reference.upper() == 'NONREF':
+                reference = (match['bank_ref'] or '').strip()
+            pending = {
+                'line': line_no,
+                'mark': match['mark'],
+                'amount': _money(match['amount'].replace(',', '.')),
+                'date': day,
+                'reference': reference,
+            }
+        elif line.startswith(':86:'):
+            narrative.append(line[4:].strip())
+            in_86 = True
+        elif line.startswith(':'):
+            in_86 = False
+            if line.startswith(':62') or line.startswith(':20:'):
+                entry = flush()
+                if entry:
+                    yield entry
+                pending, narrative = None, []
+        elif in_86:
+            narrative.append(line.strip())
+    entry = flush()
+    if entry:
+        yield entry
+
+
+PARSERS = {'csv': iter_csv, 'mt940': iter_mt940}
+
+
+def _va_accounts(va):
+    if not isinstance(va, dict):
+        return ()
+    keys = ('accountNumber', 'account_number', 'vAccountId', 'vaccount_id')
+    return tuple(str(va[k]).upper() for k in keys if va.get(k))
+
+
+class PendingIndex:
+    """In-memory index of Pending Bank Transfer investments by amount and account."""
+
+    def __init__(self, window_days=7):
+        self.window = timedelta(days=window_days)
+        self.by_amount = defaultdict(list)
+        self.by_account = {}
+        self.consumed = set()
+        rows = (
+            Investment.objects.filter(status='Pending Bank Transfer')
+            .values_list('id', 'amount', 'date', 'order_id', 'virtual_account')
+            .iterator(chunk_size=5000)
+        )
+        for pk, amount, date, order_id, va in rows:
+            cand = Candidate(pk, Decimal(amount).quantize(Decimal('0.01')), date.date(), order_id, _va_accounts(va))
+            self.by_amount[cand.amount].append(cand)
+            for key in cand.accounts + (order_id.upper(),):
+                self.by_account[key] = cand
+
+    def __len__(self):
+        return sum(len(v) for v in self.by_amount.values())
+
+    def _in_window(self, cand, day):
+        return day is None or cand.date - timedelta(days=1) <= day <= cand.date + self.window
+
+    def match(self, entry, amount_only=False):
+        """Return (outcome, candidates, rule)."""
+        keys = [entry.account.upper()] if entry.account else []
+        keys += [m.upper() for m in ORDER_ID_RE.findall(entry.narrative or '')]
+        keys += [t.upper() for t in ACCOUNT_TOKEN_RE.findall(entry.narrative or '')]
+        for key in keys:
+            cand = self.by_account.get(key)
+            if (
+                cand and cand.id not in self.consumed and cand.amount == entry.amount
+                and self._in_window(cand, entry.date)
+            ):
+                return MATCHED, [cand], 'account'
+
+        candidates = [
+            c for c in self.by_amount.get(entry.amount, ())
+            if c.id not in self.consumed and self._in_window(c, entry.date)
+        ]
+        if len(candidates) == 1 and amount_only:
+            return MATCHED, candidates, 'amount'
+        if candidates:
+            return AMBIGUOUS, candidates, 'amount'
+        return UNMATCHED, [], ''
+
+    def consume(self, cand):
+        self.consumed.add(cand.id)
+
+
+REPORT_FIELDS = ['line', 'date', 'amount', 'reference', 'outcome', 'rule', 'investment_ids', 'order_ids']
+
+
+def reconcile(stream, fmt='csv', report=None, dry_run=False, window_days=7,
+              amount_only=False, batch_size=1000):
+    """Match a statement against pending bank transfers.
+
+    Confident matches are confirmed through bulk_admin in batches; every
+    non-confirmed entry (and each confirmation) is written to ``report``,
+    a text stream, as CSV. A reference already stored on an investment, or
+    seen earlier in the statement, is reported as a duplicate instead of
+    matched again, so re-running a statement confirms nothing twice.
+    Returns outcome counts.
+    """
+    index = PendingIndex(window_days=window_days)
+    writer = csv.DictWriter(report, fieldnames=REPORT_FIELDS) if report else None
+    if writer:
+        writer.writeheader()
+    counts = defaultdict(int)
+    batch = []
+    seen = set()
+
+    def write(entry, outcome, rule, cands):
+        counts[outcome] += 1
+        if writer:
+            writer.writerow({
+                'line': entry.line,
+                'date': entry.date.isoformat() if entry.date else '',
+                'amount': entry.amount,
+                'reference': entry.reference,
+                'outcome': outcome,
+                'rule': rule,
+                'investment_ids': ' '.join(str(c.id) for c in cands),
+                'order_ids': ' '.join(c.order_id for c in cands),
+            })
+
+    def flush():
+        if not batch:
+            return
+        if dry_run:
+            for entry, rule, cand in batch:
+                write(entry, MATCHED, rule, [cand])
+        else:
+            result = bulk_admin.confirm_bank_transfers([
+                {'id': cand.id, 'utr': entry.reference or f'STMT-L{entry.line}', 'notes': 'auto-reconciled'}
+                for entry, rule, cand in batch
+            ])
+            for (entry, rule, cand), row in zip(batch, result['results']):
+                write(entry, CONFIRMED if row['status'] == 'ok' else SKIPPED, rule, [cand])
+        batch.clear()
+
+    def handle(entries):
+        refs = {e.reference[:64] for e in entries if e.reference}
+        applied = set()
+        for start in range(0, len(refs), bulk_admin.ID_CHUNK):
+            applied.update(
+                Investment.objects.filter(utr__in=list(refs)[start:start + bulk_admin.ID_CHUNK])
+                .values_list('utr', flat=True)
+            )
+        for entry in entries:
+            counts['entries'] += 1
+            if entry.amount is None:
+                write(entry, UNPARSEABLE, '', [])
+                continue
+            reference = entry.reference[:64]  # Investment.utr length
+            if reference and (reference in applied or reference in seen):
+                write(entry, DUPLICATE, 'reference', [])
+                continue
+            if reference:
+                seen.add(reference)
+            outcome, cands, rule = index.match(entry, amount_only=amount_only)
+            if outcome == MATCHED:
+                index.consume(cands[0])
+                batch.append((entry, rule, cands[0]))
+            else:
+                write(entry, outcome, rule, cands)
+        flush()
+
+    entries = []
+    for entry in PARSERS[fmt](stream):
+        entries.append(entry)
+        if len(entries) >= batch_size:
+            handle(entries)
+            entries = []
+    handle(entries)
+    counts['indexed'] = len(index)
+    return dict(counts)
@@ -0,0 +1,206 @@
+# app/services/replica.py
+"""Read-replica routing for admin and reporting reads.
+
+Only active when DATABASE_REPLICA_URL adds a ``replica`` alias (settings
+then installs ``ReplicaRouter`` and ``ReplicaMiddleware`` stops raising
+MiddlewareNotUsed). Reads go to the replica only inside ``use_replica()``,
+used as a decorator on view methods or as a context manager in commands.
+Everything else, and every write, stays on ``default``.
+
+A replica read falls back to the primary when:
+
+* the code runs under ``use_primary()``, which overrides an outer
+  ``use_replica()``;
+* this request already wrote, or is inside a transaction on the primary;
+* the same principal (token subject or session email) wrote within the
+  last REPLICA_PIN_SECONDS, so an admin sees the withdrawal they just
+  processed. The pin is kept in the cache, so it is shared by every
+  worker when REDIS_URL is set;
+* the replica is more than REPLICA_MAX_LAG_SECONDS behind, or does not
+  answer. Lag is measured at most every REPLICA_LAG_CHECK_SECONDS per
+  process (``pg_last_xact_replay_timestamp`` on PostgreSQL; other
+  backends cannot report it and count as current).
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+REPLICA = 'replica'
+PIN_KEY = 'replica:pin:{}'
+
+_LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+_state = ContextVar('ankuon_replica', default=None)
+_lag_lock = threading.Lock()
+_lag = [None, 0.0]  # seconds behind (None: unreachable), monotonic time measured
+counters = {'replica': 0, 'pinned': 0, 'lagging': 0}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def configured():
+    return REPLICA in settings.DATABASES
+
+
+class _State:
+    """Routing state of one request (or one ``use_replica()`` block outside a request)."""
+    __slots__ = ('mode', 'wrote', 'request', 'pinned')
+
+    def __init__(self, request=None):
+        self.mode = None
+        self.wrote = False
+        self.request = request
+        self.pinned = None  # looked up on the first replica-eligible read
+
+
+# -- per-view overrides ------------------------------------------------------------
+
+@contextmanager
+def _mode(mode):
+    state = _state.get()
+    token = None
+    if state is None:
+        state = _State()
+        token = _state.set(state)
+    previous, state.mode = state.mode, mode
+    try:
+        yield
+    finally:
+        state.mode = previous
+        if token is not None:
+            _state.reset(token)
+
+
+def use_replica():
+    """Send this block's reads to the replica (``@use_replica()`` on a view method)."""
+    return _mode(REPLICA)
+
+
+def use_primary():
+    """Keep this block's reads on the primary, even inside ``use_replica()``."""
+    return _mode(DEFAULT_DB_ALIAS)
+
+
+# -- read-your-writes --------------------------------------------------------------
+
+def principal(request):
+    """Who the request acts for: token subject, else the session's email, else None."""
+    from app.api.authentication import read_token
+
+    parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(parts) == 2 and parts[0] == 'Bearer':
+        try:
+            payload = read_token(parts[1])
+        except signing.BadSignature:
+            payload = {}
+        if payload.get('adm') or payload.get('pid'):
+            return f"adm:{payload['adm']}" if payload.get('adm') else f"pid:{payload['pid']}"
+    session = getattr(request, 'session', None)
+    if session is not None:
+        email = session.get('admin_email') or session.get('user_email')
+        if email:
+            return f'email:{email}'
+    return None
+
+
+def start_request(request):
+    return _state.set(_State(request))
+
+
+def finish_request(token):
+    """Pin the request's principal to the primary if it wrote; ends its state."""
+    state = _state.get()
+    _state.reset(token)
+    if state is None or not state.wrote or state.request is None:
+        return
+    who = principal(state.request)
+    if who:
+        cache.set(PIN_KEY.format(who), 1, timeout=_setting('REPLICA_PIN_SECONDS', 5))
+
+
+def _pinned(state):
+    if state.pinned is None:
+        who = principal(state.request) if state.request is not None else None
+        state.pinned = bool(who and cache.get(PIN_KEY.format(who)))
+    return state.pinned
+
+
+# -- lag ---------------------------------------------------------------------------
+
+def measure_lag():
+    """Seconds the replica is behind; None when it cannot be queried."""
+    connection = connections[REPLICA]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(_LAG_SQL)
+            lag = cursor.fetchone()[0]
+    except DatabaseError as e:
+        print(f'[Replica] lag check failed: {e}')
+        return None
+    return float(lag or 0)
+
+
+def lag():
+    """Cached ``measure_lag()``; refreshed by one thread at a time."""
+    now = time.monotonic()
+    if now - _lag[1] < _setting('REPLICA_LAG_CHECK_SECONDS', 5):
+        return _lag[0]
+    if not _lag_lock.acquire(blocking=False):
+        return _lag[0]  # another thread is measuring; use the last value
+    try:
+        _lag[0], _lag[1] = measure_lag(), time.monotonic()
+    finally:
+        _lag_lock.release()
+    return _lag[0]
+
+
+def reset_lag():
+    _lag[0], _lag[1] = None, 0.0
+
+
+def healthy():
+    current = lag()
+    return current is not None and current <= _setting('REPLICA_MAX_LAG_SECONDS', 10)
+
+
+# -- router --------------------------------------------------------------------------
+
+class ReplicaRouter:
+    """DATABASE_ROUTERS entry; installed by settings only when the replica is configured."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.mode != REPLICA:
+            return DEFAULT_DB_ALIAS
+        if state.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block or _pinned(state):
+            counters['pinned'] += 1
+            return DEFAULT_DB_ALIAS
+        if not healthy():
+            counters['lagging'] += 1
+            return DEFAULT_DB_ALIAS
+        counters['replica'] += 1
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the same rows, whichever copy they were read from
+        return True
@@ -0,0 +1,356 @@
+# app/services/security_log.py
+"""Buffered SecurityLog writes and monthly partition maintenance.
+
+``record``/``record_many`` queue rows once the surrounding transaction
+commits (a rolled-back confirmation leaves no audit row behind). A daemon
+thread per process drains the queue with ``bulk_create`` every
+SECURITY_LOG_BATCH_SIZE rows or SECURITY_LOG_FLUSH_MS, whichever comes
+first; ``shutdown`` (atexit, Celery worker shutdown) writes whatever is
+left. While the database is unreachable the thread keeps its batch and
+retries it with backoff as new rows queue up behind it; when the queue is
+full the caller writes its row itself, so the error surfaces where it
+happened. A batch the database rejects outright (a constraint, bad data)
+would fail forever, so it is split until the offending rows are isolated,
+and those are logged and counted as dropped.
+
+On PostgreSQL app_securitylog is range-partitioned by month on ``at``
+(migration 0013). ``ensure_partitions`` creates the upcoming months and
+``archive`` exports whole months to gzipped JSONL before detaching and
+dropping their partitions. Months without a partition (elsewhere: every
+month, on PostgreSQL: rows that landed in the DEFAULT partition) are
+exported and deleted in id-ordered chunks.
+"""
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, InterfaceError, OperationalError, connection, transaction
+from django.utils import timezone
+
+from app.models import SecurityLog
+
+TABLE = 'app_securitylog'
+DELETE_CHUNK = 5000
+MAX_RETRY_DELAY = 30  # seconds between background retries while the database is away
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)  # worth retrying the same rows
+_STOP = object()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class SecurityLogWriter:
+    def __init__(self, batch_size=None, flush_interval=None, max_queue=None, max_retries=3):
+        self.batch_size = batch_size or _setting('SECURITY_LOG_BATCH_SIZE', 500)
+        self.flush_interval = (
+            flush_interval if flush_interval is not None
+            else _setting('SECURITY_LOG_FLUSH_MS', 1000) / 1000
+        )
+        self.max_queue = max_queue or _setting('SECURITY_LOG_QUEUE_SIZE', 50000)
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # also runs in a forked child, where the parent's thread is gone
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._thread = None
+        self.counters = {'written': 0, 'batches': 0, 'overflow': 0, 'failed': 0, 'dropped': 0}
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='security-log', daemon=True)
+                self._thread.start()
+
+    def put(self, rows):
+        """Queue unsaved SecurityLog instances."""
+        self._ensure_thread()
+        for i, row in enumerate(rows):
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                self.counters['overflow'] += len(rows) - i
+                self._write(rows[i:])
+                return
+
+    def _run(self):
+        try:
+            while True:
+                batch, stop = self._next_batch()
+                if batch:
+                    self._write_until_done(batch)
+                if stop:
+                    return
+        finally:
+            # this thread's database connection
+            connection.close()
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _write(self, batch):
+        """bulk_create ``batch``, retrying transient errors a few times; raises the last DatabaseError."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._write_lock, transaction.atomic():
+                    SecurityLog.objects.bulk_create(batch, batch_size=self.batch_size)
+                self.counters['written'] += len(batch)
+                self.counters['batches'] += 1
+                return
+            except TRANSIENT_ERRORS:
+                if attempt == self.max_retries:
+                    raise
+                connection.close()
+                time.sleep(0.2 * (2 ** attempt))
+
+    def _write_until_done(self, batch, wait=True):
+        """Write ``batch``; with ``wait`` an unreachable database is waited out."""
+        delay = 1
+        while True:
+            try:
+                self._write(batch)
+                return
+            except TRANSIENT_ERRORS as e:
+                if not wait:
+                    raise
+                self.counters['failed'] += len(batch)
+                print(f'[SecurityLog] {len(batch)} rows not written, retrying in {delay}s: {e}')
+                connection.close()
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+            except DatabaseError as e:
+                self._write_apart(batch, e, wait)
+                return
+
+    def _write_apart(self, batch, error, wait):
+        """Halve a rejected batch until only the rows the database refuses are left out."""
+        if len(batch) == 1:
+            row = batch[0]
+            self.counters['dropped'] += 1
+            print(
+                f'[SecurityLog] dropped user={row.user_id} action={row.action} '
+                f'at={row.at.isoformat()} detail={row.detail!r}: {error}'
+            )
+            return
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            self._write_until_done(half, wait)
+
+    def drain(self):
+        """Write everything queued so far from the calling thread."""
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                batch.append(item)
+        for start in range(0, len(batch), self.batch_size):
+            self._write_until_done(batch[start:start + self.batch_size], wait=False)
+        return len(batch)
+
+    def shutdown(self, timeout=10):
+        if self._pid != os.getpid():
+            return
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        self.drain()
+
+    def stats(self):
+        return dict(self.counters, queueDepth=self._queue.qsize())
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = SecurityLogWriter()
+                atexit.register(shutdown)
+    return _writer
+
+
+def shutdown():
+    if _writer is not None:
+        _writer.shutdown()
+
+
+def record_many(rows):
+    """Log unsaved SecurityLog rows after the current transaction commits."""
+    rows = list(rows)
+    if not rows:
+        return
+    if not _setting('SECURITY_LOG_ASYNC', True):
+        transaction.on_commit(lambda: SecurityLog.objects.bulk_create(rows, batch_size=1000))
+        return
+    transaction.on_commit(lambda: get_writer().put(rows))
+
+
+def record(user, action, detail=''):
+    record_many([SecurityLog(
+        user_id=getattr(user, 'id', user), action=action, detail=detail[:255], at=timezone.now(),
+    )])
+
+
+# -- partitions (PostgreSQL) -------------------------------------------------
+
+def _month_start(day):
+    return datetime(day.year, day.month, 1, tzinfo=dt_timezone.utc)
+
+
+def _add_months(start, months):
+    index = start.year * 12 + start.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(start):
+    return f'{TABLE}_y{start.year}m{start.month:02d}'
+
+
+def partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def ensure_partitions(months_ahead=None):
+    """Create this month's partition and the next ``months_ahead``. Returns their names."""
+    if not partitioned():
+        return []
+    months_ahead = months_ahead if months_ahead is not None else _setting('SECURITY_LOG_PARTITIONS_AHEAD', 3)
+    month = _month_start(timezone.now())
+    created = []
+    with connection.cursor() as cursor:
+        for _ in range(months_ahead + 1):
+            name = partition_name(month)
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [month, _add_months(month, 1)],
+            )
+            created.append(name)
+            month = _add_months(month, 1)
+    return created
+
+
+def _partitions():
+    """[(name, lower, upper)] of the monthly partitions, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s ORDER BY c.relname",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    result = []
+    for name in names:
+        suffix = name[len(TABLE) + 2:]  # '_y2026m10' -> '2026m10'
+        try:
+            year, month = suffix.split('m')
+            lower = datetime(int(year), int(month), 1, tzinfo=dt_timezone.utc)
+        except ValueError:
+            continue  # the default partition
+        result.append((name, lower, _add_months(lower, 1)))
+    return result
+
+
+# -- retention -----------------------------------------------------------------
+
+def _export(queryset, path):
+    count = 0
+    with gzip.open(path, 'wt', encoding='utf-8') as out:
+        for row in queryset.values('id', 'user_id', 'action', 'detail', 'at').iterator(chunk_size=DELETE_CHUNK):
+            row['at'] = row['at'].isoformat()
+            out.write(json.dumps(row, separators=(',', ':')) + '\n')
+            count += 1
+    return count
+
+
+def archive(older_than_months, out_dir, dry_run=False):
+    """Export and remove every whole month older than the cutoff.
+
+    Returns [(month, rows, path)]. Files are written before anything is
+    removed; an existing file for a month is never overwritten.
+    """
+    cutoff = _add_months(_month_start(timezone.now()), -older_than_months)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    archived = []
+
+    partitions = {}
+    if partitioned():
+        partitions = {lower: name for name, lower, upper in _partitions() if upper <= cutoff}
+    # months with rows but no partition of their own sit in the DEFAULT partition
+    first = SecurityLog.objects.filter(at__lt=cutoff).order_by('at').values_list('at', flat=True).first()
+    months = set(partitions)
+    month = _month_start(first) if first else cutoff
+    while month < cutoff:
+        months.add(month)
+        month = _add_months(month, 1)
+
+    for lower in sorted(months):
+        name, upper = partitions.get(lower), _add_months(lower, 1)
+        label = f'{lower.year}-{lower.month:02d}'
+        path = out_dir / f'security_log-{label}.jsonl.gz'
+        rows = SecurityLog.objects.filter(at__gte=lower, at__lt=upper)
+        if not name and not rows.exists():
+            continue  # nothing to export; a partition is dropped even when empty
+        if dry_run:
+            archived.append((label, rows.count(), str(path)))
+            continue
+        if path.exists():
+            raise FileExistsError(f'{path} already exists; move it away before archiving {label}')
+        count = _export(rows.order_by('id'), path)
+        if name:
+            # metadata-only: no row-by-row delete, no table bloat
+            with connection.cursor() as cursor:
+                cursor.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {name}')
+                cursor.execute(f'DROP TABLE {name}')
+        else:
+            while True:
+                ids = list(rows.order_by('id').values_list('id', flat=True)[:DELETE_CHUNK])
+                if not ids:
+                    break
+                SecurityLog.objects.filter(id__in=ids).delete()
+        archived.append((label, count, str(path)))
+    return archived
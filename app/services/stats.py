@@ -0,0 +1,245 @@
+# app/services/stats.py
+"""Admin dashboard counters kept up to date by the writers.
+
+Each counter (and each day of the inflow/outflow series) is spread over
+ADMIN_STATS_SHARDS rows and a bump adds to a random one, so two money
+movements only wait on each other's counter lock when they pick the same
+shard. Reads sum the shards. ``reconcile`` locks every shard before
+recomputing, so a bump committed meanwhile is either counted or applied
+after the overwrite, never lost.
+"""
+import random
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import F, Sum, Case, When, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from app.models import UserProfile, Investment, Withdrawal, StatCounter, DailyStat
+
+COUNTERS = (
+    'total_users',
+    'total_invested',
+    'pending_bank_transfers',
+    'pending_withdrawals',
+)
+CACHE_KEY = 'admin:stats'
+# every window is cached under the current version; a daily write retires them all
+SERIES_CACHE_KEY = 'admin:stats:series:{version}:{days}'
+SERIES_VERSION_KEY = 'admin:stats:series:v'
+RECONCILE_DAYS = 90
+MONEY = models.DecimalField(max_digits=16, decimal_places=2)
+
+
+def _ttl():
+    return getattr(settings, 'ADMIN_STATS_CACHE_TTL', 60)
+
+
+def _shards():
+    return max(1, getattr(settings, 'ADMIN_STATS_SHARDS', 8))
+
+
+def _shard_name(name, shard):
+    return f'{name}:{shard}' if shard else name
+
+
+def _counter(shard_name):
+    return shard_name.split(':', 1)[0]
+
+
+def _all_shard_names(names=COUNTERS):
+    return [_shard_name(name, shard) for name in names for shard in range(_shards())]
+
+
+def _invalidate():
+    cache.delete(CACHE_KEY)
+
+
+def _series_version():
+    version = cache.get(SERIES_VERSION_KEY)
+    if version is None:
+        cache.add(SERIES_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        version = cache.get(SERIES_VERSION_KEY)
+    return version
+
+
+def _invalidate_series():
+    cache.set(SERIES_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def _add(deltas):
+    return StatCounter.objects.filter(name__in=list(deltas)).update(
+        value=F('value') + Case(
+            *[When(name=name, then=Value(delta)) for name, delta in deltas.items()],
+            default=Value(Decimal('0')),
+            output_field=MONEY,
+        )
+    )
+
+
+def bump(**deltas):
+    """Add deltas to one random shard of the named counters, inside the caller's transaction."""
+    shard = random.randrange(_shards())
+    deltas = {_shard_name(k, shard): Decimal(str(v)) for k, v in deltas.items() if v}
+    if not deltas:
+        return
+    if _add(deltas) < len(deltas):
+        # first bump of this shard: create the missing rows, then add to those
+        existing = set(StatCounter.objects.filter(name__in=list(deltas)).values_list('name', flat=True))
+        missing = {name: delta for name, delta in deltas.items() if name not in existing}
+        StatCounter.objects.bulk_create([StatCounter(name=name) for name in missing], ignore_conflicts=True)
+        _add(missing)
+    transaction.on_commit(_invalidate)
+
+
+def bump_daily(inflow=0, outflow=0, day=None):
+    if not inflow and not outflow:
+        return
+    day = day or timezone.localdate()
+    shard = random.randrange(_shards())
+    add = {'inflow': F('inflow') + Decimal(str(inflow)), 'outflow': F('outflow') + Decimal(str(outflow))}
+    if not DailyStat.objects.filter(day=day, shard=shard).update(**add):
+        DailyStat.objects.bulk_create([DailyStat(day=day, shard=shard)], ignore_conflicts=True)
+        DailyStat.objects.filter(day=day, shard=shard).update(**add)
+    transaction.on_commit(_invalidate_series)
+
+
+# ---- state transitions ------------------------------------------------
+
+def user_created():
+    bump(total_users=1)
+
+
+def investment_created(status):
+    if status == 'Pending Bank Transfer':
+        bump(pending_bank_transfers=1)
+
+
+def investments_confirmed(rows):
+    """rows: iterable of (amount, previous_status)."""
+    total = Decimal('0')
+    from_bank = 0
+    for amount, previous_status in rows:
+        total += Decimal(str(amount))
+        from_bank += previous_status == 'Pending Bank Transfer'
+    bump(total_invested=total, pending_bank_transfers=-from_bank)
+    bump_daily(inflow=total)
+
+
+def withdrawal_requested():
+    bump(pending_withdrawals=1)
+
+
+def withdrawals_closed(amounts, completed):
+    """Pending withdrawals that were completed (paid out) or rejected/cancelled."""
+    amounts = list(amounts)
+    bump(pending_withdrawals=-len(amounts))
+    if completed:
+        bump_daily(outflow=sum((Decimal(str(a)) for a in amounts), Decimal('0')))
+
+
+# ---- reads ------------------------------------------------------------
+
+def snapshot():
+    data = cache.get(CACHE_KEY)
+    if data is None:
+        values = defaultdict(Decimal)
+        for name, value in StatCounter.objects.filter(name__in=_all_shard_names()).values_list('name', 'value'):
+            values[_counter(name)] += value
+        data = {
+            'totalUsers': int(values['total_users']),
+            'totalInvested': float(values['total_invested']),
+            'pendingBankTransfers': int(values['pending_bank_transfers']),
+            'pendingWithdrawals': int(values['pending_withdrawals']),
+        }
+        cache.set(CACHE_KEY, data, timeout=_ttl())
+    return data
+
+
+def series(days=30):
+    key = SERIES_CACHE_KEY.format(version=_series_version(), days=days)
+    data = cache.get(key)
+    if data is None:
+        since = timezone.localdate() - timedelta(days=days - 1)
+        rows = {
+            row['day']: row
+            for row in DailyStat.objects.filter(day__gte=since).values('day')
+            .annotate(inflow=Sum('inflow'), outflow=Sum('outflow')).order_by()
+        }
+        data = []
+        for offset in range(days):
+            day = since + timedelta(days=offset)
+            row = rows.get(day)
+            data.append({
+                'day': day.isoformat(),
+                'inflow': float(row['inflow']) if row else 0.0,
+                'outflow': float(row['outflow']) if row else 0.0,
+            })
+        cache.set(key, data, timeout=_ttl())
+    return data
+
+
+# ---- reconcile --------------------------------------------------------
+
+def compute_counters():
+    return {
+        'total_users': UserProfile.objects.count(),
+        'total_invested': Investment.objects.filter(status='Confirmed').aggregate(
+            s=Sum('amount')
+        )['s'] or 0,
+        'pending_bank_transfers': Investment.objects.filter(status='Pending Bank Transfer').count(),
+        'pending_withdrawals': Withdrawal.objects.filter(status='Pending').count(),
+    }
+
+
+def reconcile(days=RECONCILE_DAYS):
+    """Overwrite counters and the last ``days`` of the daily series from source tables.
+
+    The rows that will hold the totals (shard 0) are created, then every
+    existing shard row is locked before the recount: a writer that bumped
+    a locked row commits before the source tables are read, one that bumps
+    later waits for the overwrite, and a shard row created meanwhile holds
+    only deltas the recount cannot see yet.
+    """
+    since = timezone.localdate() - timedelta(days=days - 1)
+    names = _all_shard_names()
+    with transaction.atomic():
+        StatCounter.objects.bulk_create([StatCounter(name=name) for name in COUNTERS], ignore_conflicts=True)
+        DailyStat.objects.bulk_create(
+            [DailyStat(day=since + timedelta(days=offset)) for offset in range(days)],
+            ignore_conflicts=True,
+        )
+        list(StatCounter.objects.select_for_update().filter(name__in=names).order_by('name'))
+        daily = list(DailyStat.objects.select_for_update().filter(day__gte=since).order_by('day', 'shard'))
+
+        counters = compute_counters()
+        inflow = dict(
+            Investment.objects.filter(status='Confirmed', confirmed_at__date__gte=since)
+            .annotate(day=TruncDate('confirmed_at'))
+            .values('day').annotate(total=Sum('amount')).order_by()
+            .values_list('day', 'total')
+        )
+        outflow = dict(
+            Withdrawal.objects.filter(status='Completed', completed_at__date__gte=since)
+            .annotate(day=TruncDate('completed_at'))
+            .values('day').annotate(total=Sum('amount')).order_by()
+            .values_list('day', 'total')
+        )
+        StatCounter.objects.filter(name__in=names).update(value=Case(
+            *[When(name=name, then=Value(Decimal(str(value)))) for name, value in counters.items()],
+            default=Value(Decimal('0')),
+            output_field=MONEY,
+        ))
+        for row in daily:
+            row.inflow = (inflow.get(row.day) or 0) if row.shard == 0 else 0
+            row.outflow = (outflow.get(row.day) or 0) if row.shard == 0 else 0
+        DailyStat.objects.bulk_update(daily, ['inflow', 'outflow'], batch_size=500)
+    cache.delete(CACHE_KEY)
+    _invalidate_series()
+    return counters
@@ -0,0 +1,336 @@
+# app/services/synthetic.py
+"""Production-sized synthetic data for local load and query-plan work.
+
+Rows are generated in id-range chunks, each written in its own
+transaction by one of ``workers`` processes: ``executemany`` of one
+prepared INSERT on SQLite, ``COPY ... FROM STDIN`` on PostgreSQL. Users
+and investments get explicit ids (reserved above the current maximum and
+the sequences reset afterwards) so a chunk can reference rows written by
+another worker without reading them back. Phases run in dependency
+order:
+
+    1. users (+ Kyc for the verified ones)
+    2. investments (+ withdrawals against them), security logs
+    3. PortfolioBalance rows and one opening ledger txn per user
+
+Time runs forward with the id: user k of N joins at k/N through the
+window and investment i of M is made at i/M by a verified user who had
+already joined, so id order, date order and the indexes agree the way
+they do in production.
+"""
+import io
+import json
+import multiprocessing
+import random
+import uuid
+from datetime import timedelta
+
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from app.models import (
+    Investment, Kyc, LedgerEntry, PortfolioBalance, SecurityLog, UserProfile, Withdrawal,
+)
+from app.services import portfolio, stats
+
+FIRST_NAMES = (
+    'Aarav', 'Vivaan', 'Aditya', 'Vihaan', 'Arjun', 'Sai', 'Reyansh', 'Krishna', 'Ishaan', 'Rohan',
+    'Ananya', 'Diya', 'Aadhya', 'Saanvi', 'Pari', 'Anika', 'Navya', 'Myra', 'Sara', 'Kavya',
+)
+LAST_NAMES = (
+    'Sharma', 'Verma', 'Gupta', 'Patel', 'Reddy', 'Iyer', 'Nair', 'Singh', 'Kumar', 'Das',
+    'Mehta', 'Joshi', 'Rao', 'Menon', 'Shah', 'Bose', 'Chopra', 'Kapoor', 'Pillai', 'Yadav',
+)
+BANKS = ('HDFC', 'ICIC', 'SBIN', 'UTIB', 'KKBK', 'PUNB')
+SECURITY_ACTIONS = (('LOGIN', 80), ('KYC_VERIFIED', 8), ('PAYMENT_CONFIRMED', 8), ('WITHDRAWAL_PROCESSED', 4))
+DEFAULT_INVESTMENT_STATUSES = 'Confirmed=70,Pending Bank Transfer=12,Pending=10,Failed=8'
+DEFAULT_WITHDRAWAL_STATUSES = 'Completed=70,Pending=10,Rejected=10,Cancelled=10'
+DERIVED_CHUNK = 5000
+
+
+def parse_distribution(spec, model):
+    """'Confirmed=70,Pending=30' -> ([statuses], [cumulative weights]); ValueError on bad input."""
+    allowed = {value for value, _ in model._meta.get_field('status').choices}
+    statuses, weights = [], []
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in allowed:
+            raise ValueError(f'Unknown {model.__name__} status {name!r}; choose from {sorted(allowed)}')
+        statuses.append(name)
+        weights.append(float(weight or 0))
+    if sum(weights) <= 0:
+        raise ValueError(f'{model.__name__} status weights must add up to more than 0')
+    return statuses, weights
+
+
+class Plan:
+    """What to generate; picklable, so worker processes get their own copy."""
+
+    def __init__(self, users, investments, security_logs=0, withdrawal_rate=0.3, kyc_rate=0.8,
+                 days=730, investment_statuses=DEFAULT_INVESTMENT_STATUSES,
+                 withdrawal_statuses=DEFAULT_WITHDRAWAL_STATUSES, chunk_size=50000, seed=0):
+        self.users = users
+        self.investments = investments
+        self.security_logs = security_logs
+        self.withdrawal_rate = withdrawal_rate
+        self.kyc_rate = kyc_rate
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.investment_statuses = parse_distribution(investment_statuses, Investment)
+        self.withdrawal_statuses = parse_distribution(withdrawal_statuses, Withdrawal)
+        self.end = timezone.now().replace(tzinfo=None)  # naive UTC throughout
+        self.start = self.end - timedelta(days=days)
+        self.user_start = (UserProfile.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+        self.investment_start = (Investment.objects.aggregate(m=Max('id'))['m'] or 0) + 1
+
+    def at(self, position, total):
+        return self.start + (self.end - self.start) * (position / max(total, 1))
+
+    def verified(self, user_id):
+        # decided by the id alone, so investment chunks agree with user chunks
+        return (user_id * 2654435761) % 4294967296 < self.kyc_rate * 4294967296
+
+    def tasks(self, phase):
+        if phase == 1:
+            return [('users', a, min(a + self.chunk_size, self.users)) for a in range(0, self.users, self.chunk_size)]
+        if phase == 2:
+            return [
+                ('investments', a, min(a + self.chunk_size, self.investments))
+                for a in range(0, self.investments, self.chunk_size)
+            ] + [
+                ('security_logs', a, min(a + self.chunk_size, self.security_logs))
+                for a in range(0, self.security_logs, self.chunk_size)
+            ]
+        return [('derived', a, min(a + self.chunk_size, self.users)) for a in range(0, self.users, self.chunk_size)]
+
+
+# -- writing ---------------------------------------------------------------------
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat(' ') + '+00'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def write(model, columns, rows):
+    """Insert ``rows`` (tuples in ``columns`` order) into ``model``'s table."""
+    if not rows:
+        return 0
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    column_list = ', '.join(qn(c) for c in columns)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            data = ''.join('\t'.join(map(_copy_value, row)) + '\n' for row in rows)
+            sql = f'COPY {table} ({column_list}) FROM STDIN'
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):  # psycopg2
+                raw.copy_expert(sql, io.StringIO(data))
+            else:
+                with raw.copy(sql) as copy:
+                    copy.write(data)
+        else:
+            marks = ', '.join(['%s'] * len(columns))
+            cursor.executemany(f'INSERT INTO {table} ({column_list}) VALUES ({marks})', rows)
+    return len(rows)
+
+
+def _money(paise):
+    return f'{paise // 100}.{paise % 100:02d}'
+
+
+# -- generators ------------------------------------------------------------------
+
+def _users(plan, rng, a, b):
+    users, kycs = [], []
+    for k in range(a, b):
+        uid = plan.user_start + k
+        joined = plan.at(k, plan.users) + timedelta(seconds=rng.randrange(3600))
+        name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        mobile = f'{rng.choice("6789")}{rng.randrange(10 ** 9):09d}'
+        verified = plan.verified(uid)
+        last_login = joined + (plan.end - joined) * rng.random()
+        users.append((
+            uid, f'seed{uid}@example.com', name, '', mobile,
+            'Verified' if verified else 'Not Verified', True, False, joined, last_login,
+        ))
+        if verified:
+            bank_account = f'{rng.randrange(10 ** 11, 10 ** 12)}'
+            ifsc = f'{rng.choice(BANKS)}0{rng.randrange(10 ** 6):06d}'
+            kycs.append((
+                uid, f'{"".join(rng.choices("ABCDEFGHJKLMNPQRSTUVWXYZ", k=5))}{rng.randrange(10 ** 4):04d}P',
+                f'{rng.randrange(10 ** 11, 10 ** 12)}', mobile, name, bank_account, ifsc,
+                json.dumps([{
+                    'id': 1, 'bankAccount': bank_account, 'ifsc': ifsc, 'accountName': name, 'isPrimary': True,
+                }]),
+                True, joined + timedelta(minutes=rng.randrange(1, 60 * 24)),
+            ))
+    return [(UserProfile, (
+        'id', 'email', 'name', 'upi_id', 'mobile', 'kyc_status', 'verified', 'two_factor_enabled',
+        'created_at', 'last_login',
+    ), users), (Kyc, (
+        'user_id', 'pan', 'aadhaar', 'mobile', 'account_name', 'bank_account', 'ifsc', 'banks',
+        'aadhaar_mobile_linked', 'verified_at',
+    ), kycs)]
+
+
+def _investments(plan, rng, a, b):
+    statuses, weights = plan.investment_statuses
+    wd_statuses, wd_weights = plan.withdrawal_statuses
+    investments, withdrawals = [], []
+    for i in range(a, b):
+        made = plan.at(i, plan.investments)
+        joined_before = max(1, int(plan.users * i / plan.investments))
+        for _ in range(8):
+            uid = plan.user_start + rng.randrange(joined_before)
+            if plan.verified(uid):
+                break
+        paise = int(1000000 * 10 ** (3 * rng.random() ** 3)) // 100 * 100  # ₹10k .. ₹1Cr, mostly small
+        status = rng.choices(statuses, weights)[0]
+        confirmed = made + timedelta(minutes=rng.randrange(5, 60 * 48)) if status == 'Confirmed' else None
+        if confirmed and confirmed > plan.end:
+            confirmed = plan.end
+        iid = plan.investment_start + i
+        investments.append((
+            iid, uid, _money(paise), made, '0.00', f'AO2-{made:%Y%m%d}-S{iid:012d}', status,
+            rng.choice(('bank', 'bank', 'upi')), confirmed, f'UTR{iid:012d}' if confirmed else '',
+        ))
+        if confirmed is None or rng.random() >= plan.withdrawal_rate:
+            continue
+        wd_status = rng.choices(wd_statuses, wd_weights)[0]
+        if wd_status == 'Pending':
+            requested = max(confirmed, plan.end - timedelta(hours=rng.randrange(1, 72)))
+        else:
+            requested = confirmed + (plan.end - confirmed) * rng.random()
+        completed = requested + timedelta(hours=rng.randrange(2, 72)) if wd_status == 'Completed' else None
+        withdrawals.append((
+            uid, iid, _money(paise * rng.randrange(5, 101) // 100), requested, wd_status,
+            requested + timedelta(days=3), f'{rng.randrange(10 ** 11, 10 ** 12)}',
+            f'{rng.choice(BANKS)}0{rng.randrange(10 ** 6):06d}', '', 'NEFT/RTGS/IMPS',
+            f'UTR{rng.randrange(10 ** 12):012d}' if completed else '',
+            {'Rejected': 'Rejected by admin', 'Cancelled': 'Cancelled by user'}.get(wd_status, ''), completed,
+        ))
+    return [(Investment, (
+        'id', 'user_id', 'amount', 'date', 'returns', 'order_id', 'status', 'payment_method', 'confirmed_at', 'utr',
+    ), investments), (Withdrawal, (
+        'user_id', 'investment_id', 'amount', 'requested', 'status', 'processing_end', 'bank_account',
+        'ifsc', 'account_name', 'method', 'utr', 'notes', 'completed_at',
+    ), withdrawals)]
+
+
+def _security_logs(plan, rng, a, b):
+    actions = [name for name, _ in SECURITY_ACTIONS]
+    weights = [weight for _, weight in SECURITY_ACTIONS]
+    rows = []
+    for j in range(a, b):
+        joined_before = max(1, int(plan.users * j / plan.security_logs))
+        rows.append((
+            plan.user_start + rng.randrange(joined_before), rng.choices(actions, weights)[0], '',
+            plan.at(j, plan.security_logs),
+        ))
+    return [(SecurityLog, ('user_id', 'action', 'detail', 'at'), rows)]
+
+
+def _derived(plan, rng, a, b):
+    """Balance rows and opening ledger txns for users a..b, from what phase 2 wrote."""
+    now = plan.end
+    batches = []
+    for lo in range(plan.user_start + a, plan.user_start + b, DERIVED_CHUNK):
+        user_ids = list(range(lo, min(lo + DERIVED_CHUNK, plan.user_start + b)))
+        expected = portfolio.compute_from_ledger(user_ids)
+        balances, entries = [], []
+        for uid in user_ids:
+            values = expected[uid]
+            balances.append((uid, *(values[f] for f in portfolio.BALANCE_FIELDS), values['available_balance'], now))
+            legs = [
+                (account, values[field])
+                for account, field in (
+                    ('principal', 'confirmed_principal'), ('returns', 'accrued_returns'),
+                    ('withdrawal_pending', 'pending_withdrawals'), ('withdrawn', 'completed_withdrawals'),
+                )
+                if values[field]
+            ]
+            if not legs:
+                continue
+            txn = uuid.uuid4().hex
+            entries += [(txn, uid, account, amount, 'opening_balance', 'seed', now) for account, amount in legs]
+            entries.append((txn, None, 'house:opening', -sum(amount for _, amount in legs), 'opening_balance', 'seed', now))
+        batches += [
+            (PortfolioBalance, ('user_id', *portfolio.BALANCE_FIELDS, 'available_balance', 'updated_at'), balances),
+            (LedgerEntry, ('txn', 'user_id', 'account', 'amount', 'kind', 'reference', 'created_at'), entries),
+        ]
+    return batches
+
+
+GENERATORS = {
+    'users': _users,
+    'investments': _investments,
+    'security_logs': _security_logs,
+    'derived': _derived,
+}
+
+
+# -- running ---------------------------------------------------------------------
+
+def _worker_init():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:  # spawn/forkserver start methods
+        django.setup()
+
+
+def run_task(args):
+    plan, kind, a, b = args
+    # rows are built before the transaction, so workers only queue for the inserts
+    batches = GENERATORS[kind](plan, random.Random(f'{plan.seed}:{kind}:{a}'), a, b)
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic():
+            return kind, sum(write(*batch) for batch in batches)
+    with connection.cursor() as cursor:
+        # other workers hold the write lock while they insert; durability is not needed here
+        cursor.execute('PRAGMA busy_timeout = 600000')
+        cursor.execute('PRAGMA synchronous = OFF')
+    # a deferred BEGIN that later upgrades to a write lock gets SQLITE_BUSY
+    # at once, without waiting, when another worker is committing
+    mode, connection.transaction_mode = connection.transaction_mode, 'IMMEDIATE'
+    try:
+        with transaction.atomic():
+            return kind, sum(write(*batch) for batch in batches)
+    finally:
+        connection.transaction_mode = mode
+
+
+def run(plan, workers=1, progress=None):
+    """Generate every phase; returns {kind: rows written}. ``progress(kind, rows)`` per chunk."""
+    totals = {}
+    for phase in (1, 2, 3):
+        tasks = [(plan, kind, a, b) for kind, a, b in plan.tasks(phase)]
+        if workers > 1 and len(tasks) > 1:
+            connections.close_all()  # children must not share the parent's connection
+            with multiprocessing.get_context().Pool(min(workers, len(tasks)), initializer=_worker_init) as pool:
+                results = pool.imap_unordered(run_task, tasks)
+                for kind, rows in results:
+                    totals[kind] = totals.get(kind, 0) + rows
+                    if progress:
+                        progress(kind, rows)
+        else:
+            for task in tasks:
+                kind, rows = run_task(task)
+                totals[kind] = totals.get(kind, 0) + rows
+                if progress:
+                    progress(kind, rows)
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [UserProfile, Investment]):
+            cursor.execute(sql)
+    stats.reconcile()
+    return totals
@@ -0,0 +1,219 @@
+# app/services/user_search.py
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.db import connection, models
+
+from app.models import UserProfile
+
+FTS_TABLE = 'app_userprofile_fts'
+MIN_TRIGRAM = 3
+PREFIX_FIELDS = ('email', 'mobile')
+_fts_tables = {}  # database NAME -> whether the FTS5 table exists
+
+
+def encode_cursor(*parts):
+    raw = json.dumps(parts, separators=(',', ':')).encode('utf-8')
+    return urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    parts = json.loads(urlsafe_b64decode(padded.encode('ascii')))
+    if not isinstance(parts, list) or not parts:
+        raise ValueError('Invalid cursor')
+    return parts
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_rank(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _checked(parts, field):
+    """(mode, after) from a decoded cursor; ValueError unless it fits the mode and query.
+
+    ``after`` is empty for a cursor pointing at the start of the substring
+    pages that follow the prefix ones.
+    """
+    mode, *after = parts
+    if mode == 'prefix':
+        ok = (
+            len(after) == 3 and after[0] in PREFIX_FIELDS and after[0] == field
+            and isinstance(after[1], str) and _is_id(after[2])
+        )
+        after = after[1:]
+    elif mode == 'rank':
+        ok = not after or (len(after) == 2 and _is_rank(after[0]) and _is_id(after[1]))
+    elif mode == 'id':
+        ok = not after or (len(after) == 1 and _is_id(after[0]))
+    else:
+        ok = False
+    if not ok:
+        raise ValueError('Invalid cursor')
+    return mode, after
+
+
+def _fts_available():
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts_tables:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE],
+            )
+            _fts_tables[name] = cursor.fetchone() is not None
+    return _fts_tables[name]
+
+
+def _prefix_field(q):
+    if '@' in q:
+        return 'email'
+    if q.isdigit():
+        return 'mobile'
+    return None
+
+
+def _prefix_value(field, q):
+    return q.lower() if field == 'email' else q
+
+
+def _like_escape(value):
+    """``value`` as a literal inside a LIKE pattern with ESCAPE '\\' (as ``icontains`` does)."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _like_prefix(value):
+    return _like_escape(value) + '%'
+
+
+def _prefix_page(field, q, after, limit):
+    """Exact/prefix lookup served by the ``profile_<field>_prefix`` index."""
+    qs = UserProfile.objects.filter(**{f'{field}__startswith': _prefix_value(field, q)})
+    if after:
+        last_value, last_id = after
+        qs = qs.filter(
+            models.Q(**{f'{field}__gt': last_value})
+            | models.Q(**{field: last_value, 'id__gt': last_id})
+        )
+    rows = list(qs.order_by(field, 'id').values_list(field, 'id')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor('prefix', field, rows[-1][0], rows[-1][1])
+    return [pk for _, pk in rows], next_cursor
+
+
+def _ranked_sql(q, after, limit, exclude=None):
+    """(sql, params) returning (id, rank) best-first; lower rank sorts first.
+
+    ``exclude`` names a prefix field whose prefix matches were already served.
+    """
+    if connection.vendor == 'postgresql':
+        # a user's % or _ must not turn the search into a full scan
+        pattern = f'%{_like_escape(q)}%'
+        inner = (
+            'SELECT id, -GREATEST(similarity(email, %s), similarity(name, %s), '
+            'similarity(mobile, %s)) AS rank FROM app_userprofile '
+            "WHERE (email ILIKE %s ESCAPE '\\' OR name ILIKE %s ESCAPE '\\' OR mobile ILIKE %s ESCAPE '\\')"
+        )
+        params = [q, q, q, pattern, pattern, pattern]
+    else:
+        phrase = '"' + q.replace('"', '""') + '"'
+        inner = f'SELECT rowid AS id, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+        params = [phrase]
+    if exclude:
+        inner += f" AND {exclude} NOT LIKE %s ESCAPE '\\'"
+        params.append(_like_prefix(_prefix_value(exclude, q)))
+    sql = f'SELECT id, rank FROM ({inner}) ranked'
+    if after:
+        sql += ' WHERE rank > %s OR (rank = %s AND id > %s)'
+        params += [after[0], after[0], after[1]]
+    sql += ' ORDER BY rank, id LIMIT %s'
+    params.append(limit + 1)
+    return sql, params
+
+
+def _ranked_page(q, after, limit, exclude=None):
+    sql, params = _ranked_sql(q, after, limit, exclude)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor('rank', rows[-1][1], rows[-1][0])
+    return [pk for pk, _ in rows], next_cursor
+
+
+def _scan_page(q, after, limit, exclude=None):
+    qs = UserProfile.objects.all()
+    if q:
+        qs = qs.filter(
+            models.Q(email__icontains=q)
+            | models.Q(name__icontains=q)
+            | models.Q(mobile__icontains=q)
+        )
+    if exclude:
+        qs = qs.exclude(**{f'{exclude}__startswith': _prefix_value(exclude, q)})
+    if after:
+        qs = qs.filter(id__gt=after[0])
+    ids = list(qs.order_by('id').values_list('id', flat=True)[:limit + 1])
+    next_cursor = None
+    if len(ids) > limit:
+        ids = ids[:limit]
+        next_cursor = encode_cursor('id', ids[-1])
+    return ids, next_cursor
+
+
+def _ranked_supported(q):
+    if len(q) < MIN_TRIGRAM:
+        return False
+    return connection.vendor == 'postgresql' or _fts_available()
+
+
+def _substring_mode(q):
+    return 'rank' if q and _ranked_supported(q) else 'id'
+
+
+def _substring_page(q, mode, after, limit, exclude):
+    if mode == 'rank':
+        return _ranked_page(q, after, limit, exclude)
+    return _scan_page(q, after, limit, exclude)
+
+
+def search_ids(q, cursor=None, limit=50):
+    """Return (profile ids in rank order, next cursor). Raises ValueError on a bad cursor.
+
+    An email-like or numeric query lists its prefix matches first, then
+    the remaining substring matches.
+    """
+    q = (q or '').strip()
+    field = _prefix_field(q) if q else None
+    if cursor:
+        mode, after = _checked(decode_cursor(cursor), field)
+        if mode == 'rank' and not _ranked_supported(q):
+            raise ValueError('Invalid cursor')
+    else:
+        mode, after = ('prefix' if field else _substring_mode(q)), []
+    if mode != 'prefix':
+        return _substring_page(q, mode, after, limit, field)
+
+    ids, next_cursor = _prefix_page(field, q, after, limit)
+    if next_cursor:
+        return ids, next_cursor
+    mode = _substring_mode(q)
+    if len(ids) == limit:
+        return ids, encode_cursor(mode)
+    more, next_cursor = _substring_page(q, mode, [], limit - len(ids), field)
+    return ids + more, next_cursor
+
+
+def search(q, cursor=None, limit=50):
+    ids, next_cursor = search_ids(q, cursor, limit)
+    profiles = UserProfile.objects.select_related('portfolio').in_bulk(ids)
+    return [profiles[pk] for pk in ids if pk in profiles], next_cursor
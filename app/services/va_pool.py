@@ -0,0 +1,201 @@
+# app/services/va_pool.py
+"""Pool of pre-created virtual accounts so invest never waits on Cashfree.
+
+``claim`` binds the oldest available VA to an order (SELECT ... FOR UPDATE
+SKIP LOCKED on Postgres; the status-guarded UPDATE keeps SQLite correct).
+``refill`` tops the pool back up to VA_POOL_SIZE whenever it has dropped
+below VA_POOL_LOW_WATER; claims that cross the mark enqueue it.
+"""
+import secrets
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from app.models import Investment, PooledVirtualAccount
+from app.services import cashfree_va
+
+CLAIM_ATTEMPTS = 3
+LATENCY_SAMPLES = 1000
+REFILL_LOCK_KEY = 'va_pool:refill'
+COUNTER_PREFIX = 'va_pool:count'
+ORPHAN_AFTER = timedelta(minutes=10)
+ORPHAN_LOOKBACK = timedelta(days=1)
+
+_latencies = deque(maxlen=LATENCY_SAMPLES)
+_latency_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _environment():
+    return _setting('CASHFREE_ENV', 'sandbox')
+
+
+def _bump(counter):
+    key = f'{COUNTER_PREFIX}:{counter}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def _available():
+    return PooledVirtualAccount.objects.filter(environment=_environment(), status='Available')
+
+
+def details(va):
+    return {
+        'vAccountId': va.va_id,
+        'accountNumber': va.account_number,
+        'ifsc': va.ifsc,
+        'accountName': _setting('CASHFREE_VA_ACCOUNT_NAME', 'AnkuOn2'),
+        'bankName': va.bank_name,
+    }
+
+
+def claim(order_id):
+    """Bind an available pooled VA to ``order_id``; VA details or None if the pool is dry."""
+    if not _setting('VA_POOL_SIZE', 0):
+        return None
+    started = time.perf_counter()
+    va = None
+    for _ in range(CLAIM_ATTEMPTS):
+        with transaction.atomic():
+            candidate = (
+                _available().select_for_update(skip_locked=True)
+                .order_by('id').first()
+            )
+            if candidate is None:
+                break
+            claimed = PooledVirtualAccount.objects.filter(
+                id=candidate.id, status='Available',
+            ).update(status='Claimed', order_id=order_id, claimed_at=timezone.now())
+            if claimed:
+                va = candidate
+                break
+    with _latency_lock:
+        _latencies.append((time.perf_counter() - started) * 1000)
+    _bump('hits' if va else 'misses')
+    if va is None or below_low_water():
+        schedule_refill()
+    return details(va) if va else None
+
+
+def release(va_id):
+    """Return a claimed VA whose investment was never created."""
+    return PooledVirtualAccount.objects.filter(va_id=va_id, status='Claimed').update(
+        status='Available', order_id='', claimed_at=None,
+    )
+
+
+def below_low_water():
+    low_water = _setting('VA_POOL_LOW_WATER', 50)
+    # reads at most ``low_water`` entries of the partial index
+    return not _available().order_by('id')[low_water - 1:low_water].exists() if low_water else False
+
+
+def schedule_refill():
+    if not cashfree_va.configured() or not _setting('VA_POOL_SIZE', 0):
+        return
+    # debounce: one refill enqueue per minute however many claims cross the mark
+    if not cache.add(f'{REFILL_LOCK_KEY}:scheduled', 1, timeout=60):
+        return
+    from app.tasks import refill_va_pool
+
+    def enqueue():
+        try:
+            # without a broker CELERY_TASK_ALWAYS_EAGER makes this refill inline
+            getattr(refill_va_pool, 'delay', refill_va_pool)()
+        except Exception as e:
+            print(f'[VA pool] refill enqueue skipped: {e}')
+    transaction.on_commit(enqueue)
+
+
+def release_orphans(older_than=ORPHAN_AFTER):
+    """Release VAs claimed by requests that died before saving the investment."""
+    now = timezone.now()
+    claimed = list(
+        PooledVirtualAccount.objects.filter(
+            status='Claimed',
+            claimed_at__lt=now - older_than,
+            claimed_at__gte=now - ORPHAN_LOOKBACK,
+        ).values_list('va_id', flat=True)
+    )
+    if not claimed:
+        return 0
+    bound = set(Investment.objects.filter(va_id__in=claimed).values_list('va_id', flat=True))
+    return sum(release(va_id) for va_id in claimed if va_id not in bound)
+
+
+def refill(batch=None):
+    """Create VAs until the pool is back at VA_POOL_SIZE. Returns the number created."""
+    target = _setting('VA_POOL_SIZE', 0)
+    if not target or not cashfree_va.configured():
+        return 0
+    # one refiller at a time across workers
+    if not cache.add(REFILL_LOCK_KEY, 1, timeout=300):
+        return 0
+    created = 0
+    try:
+        missing = target - _available().count()
+        limit = min(missing, batch or _setting('VA_POOL_REFILL_BATCH', 100))
+        client = cashfree_va.get_client()
+        name = _setting('CASHFREE_VA_ACCOUNT_NAME', 'AnkuOn2')
+        email = _setting('EMAIL_HOST_USER', '') or 'payments@ankuon2.com'
+        for _ in range(max(limit, 0)):
+            pool_id = f'AO2P{secrets.token_hex(8).upper()}'
+            try:
+                va = client.create_virtual_account(pool_id, name, email, '')
+            except cashfree_va.CashfreeError as e:
+                print(f'[VA pool] refill stopped after {created}: {e}')
+                break
+            PooledVirtualAccount.objects.create(
+                va_id=va['vAccountId'],
+                environment=_environment(),
+                account_number=va['accountNumber'] or '',
+                ifsc=va['ifsc'] or '',
+                bank_name=va.get('bankName') or '',
+            )
+            created += 1
+    finally:
+        cache.delete(REFILL_LOCK_KEY)
+    if created:
+        _bump('refilled')
+    return created
+
+
+def metrics():
+    env = _environment()
+    counts = dict(
+        PooledVirtualAccount.objects.filter(environment=env)
+        .values('status').annotate(n=Count('id')).values_list('status', 'n')
+    )
+    with _latency_lock:
+        latencies = sorted(_latencies)
+
+    def pct(p):
+        if not latencies:
+            return 0.0
+        return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 2)
+
+    counters = cache.get_many([f'{COUNTER_PREFIX}:{c}' for c in ('hits', 'misses', 'refilled')])
+    return {
+        'environment': env,
+        'available': counts.get('Available', 0),
+        'claimed': counts.get('Claimed', 0),
+        'target': _setting('VA_POOL_SIZE', 0),
+        'lowWater': _setting('VA_POOL_LOW_WATER', 50),
+        'claims': {c: counters.get(f'{COUNTER_PREFIX}:{c}', 0) for c in ('hits', 'misses')},
+        'refills': counters.get(f'{COUNTER_PREFIX}:refilled', 0),
+        'claimLatencyMs': {'p50': pct(0.50), 'p95': pct(0.95), 'p99': pct(0.99)},
+    }
@@ -1,14 +1,136 @@
 # app/tasks.py
 from celery import shared_task
-from django.core.mail import send_mail
+from celery.signals import task_postrun, task_prerun, worker_process_shutdown
+from django.core.mail import EmailMessage
 from django.conf import settings
 
-@shared_task
+from datetime import timedelta
+
+from django.utils import timezone
+
+from app.models import Investment
+from app.services import (
+    accrual, cashfree_va, cashfree_webhook, ledger, mailer, metrics, reconciliation, security_log, stats,
+    va_pool,
+)
+
+@shared_task(autoretry_for=(mailer.QueueFull,), retry_backoff=True, max_retries=5)
 def send_otp_email(email, otp):
-    send_mail(
+    # handed to the worker's pooled SMTP connection; see app.services.mailer
+    mailer.get_mailer().send(EmailMessage(
         subject='AnkuOn OTP Verification',
-        message=f'Your OTP is {otp}. Valid for 5 minutes.',
+        body=f'Your OTP is {otp}. Valid for {settings.OTP_TTL_SECONDS // 60} minutes.',
         from_email=settings.EMAIL_HOST_USER,
-        recipient_list=[email],
-        fail_silently=False,
+        to=[email],
+    ))
+
+
+@worker_process_shutdown.connect
+def flush_mailer(**kwargs):
+    mailer.shutdown()
+
+
+@worker_process_shutdown.connect
+def flush_security_log(**kwargs):
+    security_log.shutdown()
+
+
+@worker_process_shutdown.connect
+def flush_metrics(**kwargs):
+    metrics.flush()
+
+
+@task_prerun.connect
+def start_task_timer(task_id=None, **kwargs):
+    metrics.task_started(task_id)
+
+
+@task_postrun.connect
+def record_task_duration(task_id=None, task=None, state=None, **kwargs):
+    metrics.task_finished(task_id, task.name, state)
+
+
+@shared_task
+def process_webhook_inbox(batch_size=cashfree_webhook.DRAIN_BATCH_SIZE):
+    events, confirmed = cashfree_webhook.drain_inbox(batch_size=batch_size)
+    if events:
+        lag = cashfree_webhook.inbox_lag()
+        print(
+            f'[Webhook inbox] events={events} confirmed={confirmed} '
+            f"pending={lag['pending']} lag={lag['oldestAgeSeconds']:.1f}s"
+        )
+    return {'events': events, 'confirmed': confirmed}
+
+
+@shared_task
+def reconcile_statement(path, fmt='csv', report_path=None, window_days=7):
+    with open(path, newline='', encoding='utf-8-sig') as stream:
+        if report_path:
+            with open(report_path, 'w', newline='') as report:
+                return reconciliation.reconcile(stream, fmt=fmt, report=report, window_days=window_days)
+        return reconciliation.reconcile(stream, fmt=fmt, window_days=window_days)
+
+
+@shared_task
+def reconcile_admin_stats():
+    return {k: float(v) for k, v in stats.reconcile().items()}
+
+
+@shared_task(bind=True, max_retries=8)
+def open_virtual_account(self, order_id):
+    try:
+        details = cashfree_va.complete_pending(order_id)
+    except cashfree_va.CashfreeRejected as e:
+        print(f'[Cashfree VA] {order_id} rejected: {e}')
+        return None
+    except cashfree_va.CashfreeError as e:
+        raise self.retry(exc=e, countdown=cashfree_va.retry_delay(self.request.retries))
+    return details and details['vAccountId']
+
+
+@shared_task
+def retry_pending_virtual_accounts(max_age_hours=48, limit=500):
+    """Backstop for pending VAs whose open_virtual_account task was lost."""
+    since = timezone.now() - timedelta(hours=max_age_hours)
+    order_ids = list(
+        Investment.objects.filter(
+            status='Pending Bank Transfer', date__gte=since,
+            va_id__isnull=True, virtual_account__isnull=False,
+        ).values_list('order_id', flat=True)[:limit]
     )
+    opened = 0
+    for order_id in order_ids:
+        try:
+            opened += cashfree_va.complete_pending(order_id) is not None
+        except cashfree_va.CircuitOpen:
+            break
+        except cashfree_va.CashfreeError as e:
+            print(f'[Cashfree VA] {order_id}: {e}')
+    return {'pending': len(order_ids), 'opened': opened}
+
+
+@shared_task
+def refill_va_pool():
+    released = va_pool.release_orphans()
+    created = va_pool.refill()
+    if created or released:
+        print(f'[VA pool] created={created} released={released}')
+    return {'created': created, 'released': released}
+
+
+@shared_task
+def accrue_returns():
+    summary = accrual.run()
+    if summary['updated']:
+        print(f"[Accrual] {summary['asOf']}: updated={summary['updated']} scanned={summary['scanned']}")
+    return summary
+
+
+@shared_task
+def snapshot_ledger():
+    return {'snapshots': ledger.take_snapshots()}
+
+
+@shared_task
+def maintain_security_log_partitions():
+    return {'partitions': security_log.ensure_partitions()}
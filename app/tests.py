@@ -1,3 +1,1817 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import hashlib
+import hmac
+import json
+import re
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-#
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+
+from app.models import (
+    UserProfile, Kyc, Investment, Withdrawal, PooledVirtualAccount, AccrualCheckpoint, PortfolioBalance,
+    LedgerEntry, LedgerSnapshot, SecurityLog, WebhookEvent, StatCounter, DailyStat, OrderIdNode,
+)
+from ankuon import celery_app
+from app.api import urls as api_urls, views as api_views
+from app.api.authentication import TokenUser, issue_token, read_token
+from app.services import (
+    accrual, bulk_sql, cashfree_va, cashfree_webhook, idempotency, ledger, mailer, metrics, order_ids, otp,
+    portfolio, profile_cache, reconciliation, replica, security_log, stats, user_search, va_pool,
+)
+from app.services.reconciliation import ORDER_ID_RE
+from benchmarks.fake_cashfree import FakeCashfree
+from benchmarks.smtp_stub import SMTPStub
+
+
+HOT_TABLES = ('app_investment', 'app_withdrawal')
+
+
+@contextmanager
+def eager_tasks():
+    """Run ``.delay()`` inline even when CELERY_BROKER_URL (e.g. from .env) names a broker."""
+    # the app reads Django settings under the CELERY_ namespace, so patch those keys
+    keys = ('CELERY_TASK_ALWAYS_EAGER', 'CELERY_TASK_EAGER_PROPAGATES')
+    previous = [celery_app.conf.get(key) for key in keys]
+    celery_app.conf.update(dict.fromkeys(keys, True))
+    try:
+        yield
+    finally:
+        celery_app.conf.update(zip(keys, previous))
+
+
+def explain(sql, params):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}', params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def sequential_scans(plan):
+    scans = []
+    for line in plan:
+        for table in HOT_TABLES:
+            if connection.vendor == 'sqlite':
+                if line.strip() == f'SCAN {table}':
+                    scans.append(line)
+            elif f'Seq Scan on {table}' in line:
+                scans.append(line)
+    return scans
+
+
+class QueryPlanTests(TestCase):
+    """Every API view must reach investments/withdrawals through an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profile = UserProfile.objects.create(
+            email='investor@example.com', name='Investor',
+            kyc_status='Verified', mobile='9876543210',
+        )
+        Kyc.objects.create(
+            user=cls.profile, pan='ABCDE1234F', aadhaar='123412341234',
+            mobile='9876543210', account_name='Investor',
+            bank_account='123456789012', ifsc='HDFC0001234',
+        )
+        statuses = ['Pending', 'Pending Bank Transfer', 'Confirmed', 'Failed']
+        for i in range(20):
+            inv = Investment.objects.create(
+                user=cls.profile, amount=10000 + i, order_id=f'AO2-TEST-{i:05d}',
+                status=statuses[i % len(statuses)], payment_method='bank',
+            )
+            Withdrawal.objects.create(
+                user=cls.profile, investment=inv, amount=100 + i,
+                status=['Pending', 'Completed', 'Rejected'][i % 3],
+                processing_end=timezone.now() + timedelta(days=3),
+            )
+        ledger.investments_confirmed([
+            (inv.user_id, inv.amount, inv.order_id) for inv in Investment.objects.filter(status='Confirmed')
+        ])
+        portfolio.rebuild()
+        cls.confirmed = Investment.objects.filter(status='Confirmed').first()
+        cls.pending_banks = list(Investment.objects.filter(status='Pending Bank Transfer'))
+        cls.pending_wds = list(Withdrawal.objects.filter(status='Pending'))
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def login(self, admin=False):
+        self.client.cookies.clear()
+        session = self.client.session
+        if admin:
+            session['admin_email'] = 'admin@ankuon2.com'
+        else:
+            session['user_email'] = self.profile.email
+        session.save()
+
+    def cases(self):
+        """(admin?, method, url, payload) for every route, in an order whose writes do not collide."""
+        user_id = self.profile.id
+        return [
+            (False, 'post', '/api/send-otp/', {'email': 'new@example.com', 'name': 'New'}),
+            (False, 'post', '/api/verify-otp/', {
+                'email': 'otp@example.com', 'otp': otp.get_store().issue('otp@example.com', 'Otp'),
+            }),
+            (False, 'get', '/api/profile/', None),
+            (False, 'get', '/api/profile/?include=history', None),
+            (False, 'get', '/api/investments/?limit=5', None),
+            (False, 'get', '/api/withdrawals/?limit=5', None),
+            (False, 'post', '/api/invest/', {'amount': 25000, 'payment_method': 'bank'}),
+            (False, 'get', f'/api/check-transaction/{self.confirmed.order_id}/', None),
+            (False, 'post', '/api/withdraw/', {'investment_id': self.confirmed.id, 'amount': 10}),
+            (False, 'post', '/api/cancel-withdrawal/', {'withdrawal_id': self.pending_wds[0].id}),
+            (False, 'post', '/api/update-profile/', {'name': 'Investor'}),
+            (False, 'post', '/api/kyc-verification/', {}),
+            (False, 'post', '/api/webhooks/cashfree/', {'order_id': self.pending_banks[0].order_id, 'utr': 'UTR1'}),
+            (False, 'get', '/api/async/profile/?include=history', None),
+            (False, 'post', '/api/async/invest/', {'amount': 25000, 'payment_method': 'upi'}),
+            (False, 'get', f'/api/async/check-transaction/{self.confirmed.order_id}/', None),
+            (False, 'post', '/api/async/webhooks/cashfree/', {
+                'order_id': self.pending_banks[1].order_id, 'utr': 'UTR2',
+            }),
+            (False, 'post', '/api/admin/login/', {'email': 'admin@ankuon2.com', 'password': 'plan-admin'}),
+            (True, 'get', '/api/admin/stats/', None),
+            (True, 'get', '/api/admin/stats/series/?days=30', None),
+            (True, 'get', '/api/admin/webhooks/inbox/', None),
+            (True, 'get', '/api/admin/va-pool/', None),
+            (True, 'get', '/api/metrics/', None),
+            (True, 'get', '/api/admin/users/?q=investor', None),
+            (True, 'get', f'/api/admin/users/{user_id}/', None),
+            (True, 'get', f'/api/admin/users/{user_id}/investments/', None),
+            (True, 'get', f'/api/admin/users/{user_id}/withdrawals/', None),
+            (True, 'get', '/api/admin/exports/withdrawals.csv?status=Pending', None),
+            (True, 'get', '/api/admin/withdrawals/', None),
+            (True, 'get', '/api/admin/investments/', None),
+            (True, 'post', f'/api/admin/withdrawals/{self.pending_wds[1].id}/process/', {'utr': 'UTR3'}),
+            (True, 'post', f'/api/admin/withdrawals/{self.pending_wds[2].id}/reject/', {}),
+            (True, 'post', '/api/admin/withdrawals/bulk-process/', {
+                'items': [{'id': self.pending_wds[3].id, 'utr': 'UTR4'}],
+            }),
+            (True, 'post', '/api/admin/withdrawals/bulk-reject/', {'items': [{'id': self.pending_wds[4].id}]}),
+            (True, 'post', f'/api/admin/investments/{self.pending_banks[2].id}/confirm/', {'utr': 'UTR5'}),
+            (True, 'post', '/api/admin/investments/bulk-confirm/', {
+                'items': [{'id': self.pending_banks[3].id, 'utr': 'UTR6'}],
+            }),
+        ]
+
+    def assertIndexed(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, content_type='application/json')
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+        self.assertLess(response.status_code, 400, f'{url}: {body[:200]}')
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            if not any(table in sql for table in HOT_TABLES):
+                continue
+            # captured SQL is already interpolated, so explain it verbatim
+            plan = explain(sql, ())
+            self.assertEqual(
+                sequential_scans(plan), [],
+                f'{url} scans a hot table:\n{sql}\n' + '\n'.join(plan),
+            )
+
+    @override_settings(
+        ADMIN_PASSWORD='plan-admin', CASHFREE_SECRET_KEY='', DEBUG=True, OTP_STORE='cache', VA_POOL_SIZE=0,
+    )
+    def test_every_route_reads_hot_tables_through_an_index(self):
+        cache.clear()
+        otp.reset_store()
+        self.addCleanup(otp.reset_store)
+        covered = set()
+        for admin, method, url, data in self.cases():
+            with self.subTest(url=url):
+                self.login(admin)
+                self.assertIndexed(method, url, data)
+            covered.add(resolve(url.split('?')[0]).route.removeprefix('api/'))
+        routes = {str(p.pattern) for p in api_urls.urlpatterns}
+        self.assertEqual(routes - covered, set(), 'add a query plan case for new routes')
+
+
+class PortfolioBalanceTests(TestCase):
+    """Every money movement keeps PortfolioBalance equal to the recomputed values."""
+
+    def setUp(self):
+        self.profile = UserProfile.objects.create(email='balance@example.com', name='Balance', kyc_status='Verified')
+        Kyc.objects.create(
+            user=self.profile, pan='ABCDE1234F', aadhaar='123412341234', mobile='9876543210',
+            account_name='Balance', bank_account='123456789012', ifsc='HDFC0001234',
+        )
+        self.investment = Investment.objects.create(
+            user=self.profile, amount=Decimal('50000'), order_id='AO2-BALANCE-1',
+            status='Pending Bank Transfer', payment_method='bank',
+        )
+        self.user_auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_token(self.profile)}'}
+        self.admin_auth = {'HTTP_AUTHORIZATION': f"Bearer {issue_token(admin_email='admin@ankuon2.com')}"}
+
+    def post(self, url, data, auth):
+        response = self.client.post(url, data, content_type='application/json', **auth)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def assertBalance(self, available):
+        self.assertEqual(portfolio.verify([self.profile.id]), [])
+        balance = PortfolioBalance.objects.get(user=self.profile)
+        self.assertEqual(balance.available_balance, Decimal(available))
+
+    def withdraw(self, amount):
+        return self.post('/api/withdraw/', {'investment_id': self.investment.id, 'amount': amount}, self.user_auth)
+
+    def test_money_movements_keep_the_balance_exact(self):
+        self.post(f'/api/admin/investments/{self.investment.id}/confirm/', {'utr': 'UTR1'}, self.admin_auth)
+        self.assertBalance('50000.00')
+
+        cancelled = self.withdraw(1000)['withdrawal']['id']
+        self.assertBalance('49000.00')
+        self.post('/api/cancel-withdrawal/', {'withdrawal_id': cancelled}, self.user_auth)
+        self.assertBalance('50000.00')
+
+        processed = self.withdraw(2000)['withdrawal']['id']
+        self.post(f'/api/admin/withdrawals/{processed}/process/', {'utr': 'UTR2'}, self.admin_auth)
+        self.assertBalance('48000.00')
+        self.assertEqual(PortfolioBalance.objects.get(user=self.profile).completed_withdrawals, Decimal('2000'))
+
+        rejected = self.withdraw(3000)['withdrawal']['id']
+        self.assertBalance('45000.00')
+        self.post(f'/api/admin/withdrawals/{rejected}/reject/', {}, self.admin_auth)
+        self.assertBalance('48000.00')
+
+    def test_invalid_withdrawal_amounts_leave_balances_alone(self):
+        self.post(f'/api/admin/investments/{self.investment.id}/confirm/', {'utr': 'UTR1'}, self.admin_auth)
+        before = list(PortfolioBalance.objects.values()), LedgerEntry.objects.count()
+        for amount in (-1000000, 'nan', 'inf', 0, 'abc'):
+            response = self.client.post(
+                '/api/withdraw/', {'investment_id': self.investment.id, 'amount': amount},
+                content_type='application/json', **self.user_auth,
+            )
+            self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid amount'}), amount)
+        self.assertEqual((list(PortfolioBalance.objects.values()), LedgerEntry.objects.count()), before)
+        self.assertFalse(Withdrawal.objects.exists())
+        with self.assertRaises(ValueError):
+            portfolio.withdrawal_requested(self.profile.id, Decimal('-5'))
+
+    def test_verify_command_reports_drift_and_rebuild_repairs_it(self):
+        self.post(f'/api/admin/investments/{self.investment.id}/confirm/', {'utr': 'UTR1'}, self.admin_auth)
+        out = StringIO()
+        call_command('rebuild_portfolio_balances', '--verify', stdout=out)
+        self.assertIn('Balances match the ledger', out.getvalue())
+
+        PortfolioBalance.objects.filter(user=self.profile).update(available_balance=Decimal('1.00'))
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 balance mismatches found'):
+            call_command('rebuild_portfolio_balances', '--verify', '--user', str(self.profile.id), stdout=out)
+        self.assertIn(f'user={self.profile.id} available_balance: stored=1.00 expected=50000.00', out.getvalue())
+
+        call_command('rebuild_portfolio_balances', stdout=StringIO())
+        self.assertBalance('50000.00')
+
+
+class HistoryPageTests(TestCase):
+    """/api/investments/ and /api/withdrawals/ page newest-first by (date, id) cursor."""
+
+    def setUp(self):
+        self.profile = UserProfile.objects.create(email='pages@example.com', name='Pages', kyc_status='Verified')
+        other = UserProfile.objects.create(email='other@example.com', name='Other')
+        now = timezone.now()
+        # two rows share a timestamp, so the id tie-break is exercised across a page boundary
+        dates = [now - timedelta(days=d) for d in (0, 1, 1, 2, 3)]
+        self.investments = []
+        for i, date in enumerate(dates):
+            inv = Investment.objects.create(
+                user=self.profile, amount=10000 + i, order_id=f'AO2-PAGE-{i}', status='Confirmed',
+            )
+            wd = Withdrawal.objects.create(user=self.profile, investment=inv, amount=100 + i, processing_end=now)
+            # date/requested are auto_now_add
+            Investment.objects.filter(id=inv.id).update(date=date)
+            Withdrawal.objects.filter(id=wd.id).update(requested=date)
+            inv.date = date
+            self.investments.append(inv)
+        Investment.objects.create(user=other, amount=10000, order_id='AO2-PAGE-OTHER', status='Confirmed')
+        ledger.investments_confirmed([(self.profile.id, inv.amount, inv.order_id) for inv in self.investments])
+        portfolio.rebuild([self.profile.id])
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_token(self.profile)}'}
+
+    def pages(self, path, limit):
+        pages, cursor = [], None
+        while True:
+            params = {'limit': limit, **({'cursor': cursor} if cursor else {})}
+            response = self.client.get(path, params, **self.auth)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json())
+            cursor = pages[-1]['next']
+            if not cursor:
+                return pages
+
+    def test_pages_are_bounded_and_continue_without_gaps(self):
+        expected = [inv.id for inv in sorted(self.investments, key=lambda inv: (inv.date, inv.id), reverse=True)]
+        pages = self.pages('/api/investments/', 2)
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 1])
+        self.assertEqual([row['id'] for page in pages for row in page['results']], expected)
+        self.assertEqual(pages[0]['totals']['invested'], '50010.00')
+        self.assertTrue(all('totals' not in page for page in pages[1:]))
+
+        withdrawals = self.pages('/api/withdrawals/', 3)
+        self.assertEqual([len(page['results']) for page in withdrawals], [3, 2])
+        self.assertEqual(len({row['id'] for page in withdrawals for row in page['results']}), 5)
+
+    def test_limit_is_clamped(self):
+        response = self.client.get('/api/investments/', {'limit': 0}, **self.auth)
+        self.assertEqual(len(response.json()['results']), 1)
+        response = self.client.get('/api/investments/', {'limit': 10 ** 6}, **self.auth)
+        self.assertEqual(len(response.json()['results']), 5)
+        self.assertIsNone(response.json()['next'])
+
+    def test_tampered_cursors_are_rejected(self):
+        from base64 import urlsafe_b64encode
+
+        for cursor in (
+            'not-a-cursor', 'é', urlsafe_b64encode(b'no separator').decode(),
+            urlsafe_b64encode(b'2026-01-01T00:00:00|one').decode(),
+            urlsafe_b64encode(b'yesterday|1').decode(), urlsafe_b64encode(b'\xff\xfe').decode(),
+        ):
+            for path in ('/api/investments/', '/api/withdrawals/'):
+                with self.subTest(cursor=cursor, path=path):
+                    response = self.client.get(path, {'cursor': cursor}, **self.auth)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+
+class WebhookInboxTests(TestCase):
+    """drain_inbox confirms pending investments set-wise and settles every event."""
+
+    def setUp(self):
+        self.profile = UserProfile.objects.create(email='inbox@example.com', name='Inbox', kyc_status='Verified')
+        self.investments = [
+            Investment.objects.create(
+                user=self.profile, amount=Decimal('20000'), order_id=f'AO2-INBOX-{i}',
+                status='Pending Bank Transfer', payment_method='bank',
+            )
+            for i in range(5)
+        ]
+
+    def deliver(self, order_id, event_id, utr='UTR1'):
+        payload = {'order_id': order_id, 'utr': utr, 'event_id': event_id}
+        return cashfree_webhook.record_event(cashfree_webhook.parse_event(payload), payload)[0]
+
+    def statuses(self):
+        return dict(WebhookEvent.objects.values_list('dedup_key', 'status'))
+
+    def test_drains_in_batches(self):
+        for i, inv in enumerate(self.investments):
+            self.deliver(inv.order_id, f'evt-{i}')
+        self.assertEqual(cashfree_webhook.drain_inbox(batch_size=2, max_batches=1), (2, 2))
+        self.assertEqual(Counter(self.statuses().values()), {'Processed': 2, 'Pending': 3})
+        self.assertEqual(cashfree_webhook.drain_inbox(batch_size=2), (3, 3))
+        self.assertEqual(set(self.statuses().values()), {'Processed'})
+        self.assertEqual(Investment.objects.filter(status='Confirmed').count(), 5)
+        self.assertEqual(portfolio.verify([self.profile.id]), [])
+        self.assertEqual(cashfree_webhook.inbox_lag()['pending'], 0)
+
+    def test_unknown_and_settled_orders_are_ignored(self):
+        Investment.objects.filter(id=self.investments[0].id).update(status='Confirmed')
+        self.deliver('AO2-INBOX-MISSING', 'evt-missing')
+        self.deliver(self.investments[0].order_id, 'evt-settled')
+        self.assertEqual(cashfree_webhook.drain_inbox(), (2, 0))
+        self.assertEqual(self.statuses(), {'event:evt-missing': 'Ignored', 'event:evt-settled': 'Ignored'})
+        self.assertFalse(LedgerEntry.objects.exists())
+
+    def test_virtual_account_credit_matches_on_va_id(self):
+        inv = self.investments[1]
+        Investment.objects.filter(id=inv.id).update(va_id='ANKUONVA0001')
+        self.deliver('ANKUONVA0001', 'evt-va', utr='UTRVA')
+        self.assertEqual(cashfree_webhook.drain_inbox(), (1, 1))
+        inv.refresh_from_db()
+        self.assertEqual(inv.status, 'Confirmed')
+        self.assertIsNotNone(inv.confirmed_at)
+        self.assertEqual(self.statuses(), {'event:evt-va': 'Processed'})
+        self.assertEqual(
+            list(LedgerEntry.objects.filter(user=self.profile).values_list('reference', flat=True)), [inv.order_id],
+        )
+
+    def test_two_events_for_one_order_confirm_it_once(self):
+        inv = self.investments[2]
+        self.deliver(inv.order_id, 'evt-first', utr='UTRA')
+        self.deliver(inv.order_id, 'evt-retry', utr='UTRB')
+        self.assertEqual(cashfree_webhook.drain_inbox(), (2, 1))
+        self.assertEqual(set(self.statuses().values()), {'Processed'})
+        balance = PortfolioBalance.objects.get(user=self.profile)
+        self.assertEqual(balance.confirmed_principal, Decimal('20000'))
+        self.assertEqual(LedgerEntry.objects.filter(user=self.profile).count(), 1)
+
+
+def signed_webhook(body, secret, timestamp=None):
+    """(raw body, headers) for a Cashfree delivery signed like the gateway does."""
+    raw = json.dumps(body)
+    timestamp = str(int(time.time()) if timestamp is None else timestamp)
+    signature = base64.b64encode(
+        hmac.new(secret.encode(), f'{timestamp}{raw}'.encode(), hashlib.sha256).digest()
+    ).decode()
+    return raw, {'HTTP_X_WEBHOOK_TIMESTAMP': timestamp, 'HTTP_X_WEBHOOK_SIGNATURE': signature}
+
+
+@override_settings(CASHFREE_SECRET_KEY='idem-secret', DEBUG=False, CASHFREE_WEBHOOK_TOLERANCE_SECONDS=300)
+class WebhookIdempotencyTests(TestCase):
+    """Stale and replayed deliveries are answered before touching the inbox."""
+
+    def setUp(self):
+        cache.clear()
+        profile = UserProfile.objects.create(email='idem@example.com', name='Idem')
+        self.order = Investment.objects.create(
+            user=profile, amount=Decimal('20000'), order_id='AO2-IDEM-1', status='Pending Bank Transfer',
+        )
+        self.body = {'order_id': self.order.order_id, 'utr': 'UTRIDEM', 'event_id': 'evt-idem'}
+
+    def post(self, path, raw, headers):
+        return self.client.post(path, raw, content_type='application/json', **headers)
+
+    def test_stale_timestamps_are_rejected_and_counted(self):
+        for path in ('/api/webhooks/cashfree/', '/api/async/webhooks/cashfree/'):
+            for timestamp in (int(time.time()) - 3600, int(time.time() + 3600) * 1000, 'yesterday'):
+                with self.subTest(path=path, timestamp=timestamp):
+                    response = self.post(path, *signed_webhook(self.body, 'idem-secret', timestamp))
+                    self.assertEqual(response.status_code, 401)
+                    self.assertEqual(response.json(), {'error': 'Stale timestamp'})
+        self.assertEqual(idempotency.stats()['stale'], 6)
+        self.assertFalse(WebhookEvent.objects.exists())
+        # milliseconds inside the window are accepted
+        raw, headers = signed_webhook(self.body, 'idem-secret', int(time.time() * 1000))
+        self.assertEqual(self.post('/api/webhooks/cashfree/', raw, headers).json()['status'], 'queued')
+
+    def test_replayed_signature_and_event_are_duplicates(self):
+        for path in ('/api/webhooks/cashfree/', '/api/async/webhooks/cashfree/'):
+            with self.subTest(path=path):
+                cache.clear()
+                WebhookEvent.objects.all().delete()
+                raw, headers = signed_webhook(self.body, 'idem-secret')
+                self.assertEqual(self.post(path, raw, headers).json()['status'], 'queued')
+                # the same signed delivery again: answered from the signature key
+                self.assertEqual(self.post(path, raw, headers).json(), {'status': 'duplicate'})
+                # a retry re-signed with a new timestamp: answered from the event key
+                raw, headers = signed_webhook(self.body, 'idem-secret', int(time.time()) - 1)
+                self.assertEqual(self.post(path, raw, headers).json()['status'], 'duplicate')
+                self.assertEqual(WebhookEvent.objects.count(), 1)
+                self.assertEqual(idempotency.stats(), {'hits': 2, 'misses': 1, 'stale': 0})
+
+    def test_bad_signature_is_not_remembered(self):
+        raw, headers = signed_webhook(self.body, 'wrong-secret')
+        self.assertEqual(self.post('/api/webhooks/cashfree/', raw, headers).status_code, 401)
+        self.assertEqual(self.post('/api/webhooks/cashfree/', raw, headers).status_code, 401)
+        self.assertEqual(idempotency.stats()['hits'], 0)
+
+
+@override_settings(SECURITY_LOG_ASYNC=False)
+class BulkAdminTests(TestCase):
+    """Bulk confirm/process/reject apply valid rows and report every other row."""
+
+    def setUp(self):
+        cache.clear()
+        self.profile = UserProfile.objects.create(email='bulk@example.com', name='Bulk', kyc_status='Verified')
+        self.transfers = [
+            Investment.objects.create(
+                user=self.profile, amount=Decimal('10000') * (i + 1), order_id=f'AO2-BULK-{i}',
+                status='Pending Bank Transfer', payment_method='bank',
+            )
+            for i in range(3)
+        ]
+        funded = Investment.objects.create(
+            user=self.profile, amount=Decimal('90000'), order_id='AO2-BULK-FUNDED', status='Confirmed',
+        )
+        self.withdrawals = [
+            Withdrawal.objects.create(
+                user=self.profile, investment=funded, amount=Decimal('1000') * (i + 1),
+                processing_end=timezone.now(),
+            )
+            for i in range(3)
+        ]
+        ledger.investments_confirmed([(self.profile.id, funded.amount, funded.order_id)])
+        for wd in self.withdrawals:
+            ledger.withdrawal_requested(self.profile.id, wd.amount, wd.id)
+        portfolio.rebuild([self.profile.id])
+        stats.reconcile()
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {issue_token(admin_email='admin@ankuon2.com')}"}
+
+    def bulk(self, path, items):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(path, {'items': items}, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def errors(self, result):
+        return {(r['row'], r.get('error')) for r in result['results'] if r['status'] == 'error'}
+
+    def assertConsistent(self):
+        self.assertEqual(portfolio.verify([self.profile.id]), [])
+        self.assertEqual(list(ledger.Replay().problems()), [])
+        counters = stats.compute_counters()
+        self.assertEqual(stats.snapshot(), {
+            'totalUsers': counters['total_users'], 'totalInvested': float(counters['total_invested']),
+            'pendingBankTransfers': counters['pending_bank_transfers'],
+            'pendingWithdrawals': counters['pending_withdrawals'],
+        })
+
+    def test_confirm_applies_valid_rows_and_stores_the_utr(self):
+        first, second, third = self.transfers
+        result = self.bulk('/api/admin/investments/bulk-confirm/', [
+            {'id': first.id, 'utr': 'UTRA'},
+            {'id': 'abc', 'utr': 'UTRX'},
+            {'id': second.id},
+            {'investment_id': third.id, 'reference': 'UTRC'},
+            {'id': third.id, 'utr': 'UTRD'},
+            {'id': 10 ** 9, 'utr': 'UTRE'},
+        ])
+        self.assertEqual(result['summary'], {'total': 6, 'ok': 2, 'failed': 4})
+        self.assertEqual(self.errors(result), {
+            (1, 'Invalid id'), (2, 'UTR required'), (4, 'Duplicate id'), (5, 'Not found'),
+        })
+        self.assertEqual(
+            dict(Investment.objects.filter(id__in=[first.id, second.id, third.id]).values_list('id', 'utr')),
+            {first.id: 'UTRA', second.id: '', third.id: 'UTRC'},
+        )
+        self.assertEqual(Investment.objects.get(id=second.id).status, 'Pending Bank Transfer')
+        self.assertEqual(Investment.objects.filter(id__in=[first.id, third.id], confirmed_at__isnull=False).count(), 2)
+        self.assertEqual(PortfolioBalance.objects.get(user=self.profile).confirmed_principal, Decimal('130000'))
+        self.assertConsistent()
+
+        # already confirmed rows are reported, not confirmed twice
+        again = self.bulk('/api/admin/investments/bulk-confirm/', [{'id': first.id, 'utr': 'UTRZ'}])
+        self.assertEqual(self.errors(again), {(0, 'Not found')})
+        self.assertEqual(Investment.objects.get(id=first.id).utr, 'UTRA')
+        self.assertConsistent()
+
+    def test_process_and_reject_settle_pending_withdrawals_once(self):
+        paid, rejected, untouched = self.withdrawals
+        result = self.bulk('/api/admin/withdrawals/bulk-process/', [
+            {'id': paid.id, 'utr': 'UTRP', 'notes': 'paid'}, {'id': untouched.id},
+        ])
+        self.assertEqual(self.errors(result), {(1, 'UTR required')})
+        result = self.bulk('/api/admin/withdrawals/bulk-reject/', [
+            {'id': rejected.id, 'reason': 'bank closed'}, {'id': paid.id},
+        ])
+        self.assertEqual(self.errors(result), {(1, 'Not found')})
+
+        rows = {wd.id: wd for wd in Withdrawal.objects.all()}
+        self.assertEqual(
+            (rows[paid.id].status, rows[paid.id].utr, rows[paid.id].notes), ('Completed', 'UTRP', 'paid'),
+        )
+        self.assertIsNotNone(rows[paid.id].completed_at)
+        self.assertEqual((rows[rejected.id].status, rows[rejected.id].notes), ('Rejected', 'bank closed'))
+        self.assertIsNone(rows[rejected.id].completed_at)
+        self.assertEqual(rows[untouched.id].status, 'Pending')
+
+        balance = PortfolioBalance.objects.get(user=self.profile)
+        self.assertEqual(balance.completed_withdrawals, Decimal('1000'))
+        self.assertEqual(balance.pending_withdrawals, Decimal('3000'))
+        self.assertEqual(stats.series(days=1)[0]['outflow'], 1000.0)
+        self.assertEqual(
+            set(SecurityLog.objects.filter(user=self.profile).values_list('action', flat=True)),
+            {'WITHDRAWAL_PROCESSED', 'WITHDRAWAL_REJECTED'},
+        )
+        self.assertConsistent()
+
+    def test_old_sqlite_falls_back_to_bulk_update(self):
+        wd = self.withdrawals[0]
+        with mock.patch.object(bulk_sql, 'supported', return_value=False):
+            result = self.bulk('/api/admin/withdrawals/bulk-process/', [{'id': wd.id, 'utr': 'UTROLD'}])
+        self.assertEqual(result['summary']['ok'], 1)
+        wd.refresh_from_db()
+        self.assertEqual((wd.status, wd.utr), ('Completed', 'UTROLD'))
+        self.assertConsistent()
+
+    def test_csv_upload(self):
+        upload = StringIO(f'withdrawal_id,bank_reference\n{self.withdrawals[0].id},UTRCSV\n')
+        upload.name = 'payouts.csv'
+        response = self.client.post('/api/admin/withdrawals/bulk-process/', {'file': upload}, **self.auth)
+        self.assertEqual(response.json()['summary'], {'total': 1, 'ok': 1, 'failed': 0})
+        self.assertEqual(Withdrawal.objects.get(id=self.withdrawals[0].id).utr, 'UTRCSV')
+
+
+class ReconciliationTests(TestCase):
+    """Statement lines confirm at most one transfer each and every other line is reported."""
+
+    def setUp(self):
+        self.profile = UserProfile.objects.create(email='recon@example.com', name='Recon')
+        self.today = timezone.localdate()
+        self.by_account, self.by_order, self.stale = [
+            Investment.objects.create(
+                user=self.profile, amount=Decimal(amount), order_id=order_id,
+                status='Pending Bank Transfer', payment_method='bank', virtual_account=va,
+            )
+            for amount, order_id, va in [
+                ('10000', 'AO2-REC-A', {'accountNumber': 'CFVA00001111'}),
+                ('25000', 'AO2-REC-B', None),
+                ('5000', 'AO2-REC-C', {'accountNumber': 'CFVA00003333'}),
+            ]
+        ]
+        Investment.objects.filter(id=self.stale.id).update(date=timezone.now() - timedelta(days=30))
+
+    def statement(self):
+        day = self.today.isoformat()
+        return StringIO(
+            'Date,Amount,UTR,Virtual_Account,Narrative,Type\n'
+            f'{day},10000.00,UTR1,CFVA00001111,NEFT IN,CR\n'          # account + amount: exact match
+            f'{day},9999.00,UTR2,,NEFT AO2-REC-B,CR\n'                # order id found, amount differs
+            f'{day},25000.00,UTR1,,NEFT AO2-REC-B,CR\n'               # UTR repeated in the statement
+            f'{day},"25,000.00",UTR3,,IMPS AO2-REC-B,CR\n'            # exact match on the order id
+            f'{day},5000.00,UTR4,CFVA00003333,NEFT,CR\n'              # account known, outside the window
+            f'{day},ten thousand,UTR5,,NEFT,CR\n'                     # unparseable amount
+            f'{day},700.00,UTR6,,CHARGES,DR\n'                        # debit, ignored
+        )
+
+    def run_statement(self, stream, fmt='csv', **kwargs):
+        report = StringIO()
+        counts = reconciliation.reconcile(stream, fmt=fmt, report=report, **kwargs)
+        report.seek(0)
+        rows = {int(r['line']): (r['outcome'], r['order_ids']) for r in csv.DictReader(report)}
+        return counts, rows
+
+    def test_csv_statement_outcomes(self):
+        counts, rows = self.run_statement(self.statement())
+        self.assertEqual(rows, {
+            2: ('confirmed', 'AO2-REC-A'),
+            3: ('unmatched', ''),
+            4: ('duplicate', ''),
+            5: ('confirmed', 'AO2-REC-B'),
+            6: ('unmatched', ''),
+            7: ('unparseable', ''),
+        })
+        self.assertEqual(counts['entries'], 6)
+        self.assertEqual(
+            dict(Investment.objects.filter(status='Confirmed').values_list('order_id', 'utr')),
+            {'AO2-REC-A': 'UTR1', 'AO2-REC-B': 'UTR3'},
+        )
+        self.assertEqual(Investment.objects.get(id=self.stale.id).status, 'Pending Bank Transfer')
+
+        # a re-run finds the applied references and confirms nothing else
+        _, rows = self.run_statement(self.statement(), amount_only=True)
+        self.assertEqual({line: outcome for line, (outcome, _) in rows.items() if outcome == 'duplicate'}, {
+            2: 'duplicate', 4: 'duplicate', 5: 'duplicate',
+        })
+        self.assertEqual(Investment.objects.filter(status='Confirmed').count(), 2)
+
+    def test_amount_only_needs_a_unique_candidate_in_the_window(self):
+        day = self.today.isoformat()
+        _, rows = self.run_statement(
+            StringIO(f'date,credit,utr\n{day},25000,UTRX\n{day},5000,UTRY\n'), dry_run=True, amount_only=True,
+        )
+        self.assertEqual(rows, {2: ('matched', 'AO2-REC-B'), 3: ('unmatched', '')})
+        self.assertEqual(Investment.objects.filter(status='Confirmed').count(), 0)
+
+    def test_mt940_reports_bad_lines_and_keeps_going(self):
+        day = self.today.strftime('%y%m%d')
+        stream = StringIO(
+            ':20:STMT\n'
+            ':61:261318C500,00NTRFUTRBAD\n'
+            ':61:not a statement line\n'
+            f':61:{day}D700,00NCHGNONREF\n'
+            f':61:{day}{day[2:]}C10000,00NTRFNONREF//UTRMT\n'
+            ':86:NEFT CREDIT\n'
+            'AO2-REC-A\n'
+            ':62F:C261018INR0,00\n'
+        )
+        entries = list(reconciliation.iter_mt940(stream))
+        self.assertEqual([(e.line, e.amount) for e in entries], [(2, None), (3, None), (5, Decimal('10000.00'))])
+        self.assertEqual((entries[2].reference, entries[2].narrative), ('UTRMT', 'NEFT CREDIT AO2-REC-A'))
+
+        stream.seek(0)
+        counts, rows = self.run_statement(stream, fmt='mt940')
+        self.assertEqual(rows, {2: ('unparseable', ''), 3: ('unparseable', ''), 5: ('confirmed', 'AO2-REC-A')})
+        self.assertEqual(Investment.objects.get(id=self.by_account.id).utr, 'UTRMT')
+
+
+@override_settings(ADMIN_STATS_SHARDS=4)
+class AdminStatsTests(TestCase):
+    """Counter bumps land on one of several shard rows; reads and reconcile cover them all."""
+
+    def setUp(self):
+        cache.clear()
+        self.shards = iter(range(1000))
+
+    def draw(self, n):
+        return next(self.shards) % n
+
+    def test_bumps_spread_over_shards_and_reads_sum_them(self):
+        with mock.patch('app.services.stats.random.randrange', side_effect=self.draw):
+            with self.captureOnCommitCallbacks(execute=True):
+                for _ in range(6):
+                    stats.withdrawal_requested()
+                for _ in range(5):
+                    stats.investments_confirmed([(Decimal('100.50'), 'Confirmed')])
+        self.assertEqual(
+            StatCounter.objects.filter(name__startswith='pending_withdrawals').count(), 4,
+        )
+        snapshot = stats.snapshot()
+        self.assertEqual((snapshot['pendingWithdrawals'], snapshot['totalInvested']), (6, 502.5))
+        self.assertGreater(DailyStat.objects.filter(day=timezone.localdate()).count(), 1)
+        self.assertEqual(stats.series(days=1)[0]['inflow'], 502.5)
+
+    def test_existing_shard_costs_one_update(self):
+        with mock.patch('app.services.stats.random.randrange', return_value=2):
+            stats.user_created()
+            with self.assertNumQueries(1):
+                stats.user_created()
+
+    def test_daily_write_refreshes_every_cached_window(self):
+        for days in (1, 12, 45):
+            self.assertEqual(stats.series(days=days)[-1]['inflow'], 0.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            stats.bump_daily(inflow=250)
+        self.assertEqual([stats.series(days=days)[-1]['inflow'] for days in (1, 12, 45)], [250.0] * 3)
+
+    def test_reconcile_folds_every_shard_into_the_source_counts(self):
+        profile = UserProfile.objects.create(email='stats@example.com', name='Stats')
+        Investment.objects.create(
+            user=profile, amount=Decimal('2500'), order_id='AO2-STATS-1', status='Confirmed',
+            confirmed_at=timezone.now(),
+        )
+        with mock.patch('app.services.stats.random.randrange', side_effect=self.draw):
+            for _ in range(4):
+                stats.bump(total_users=7, total_invested=1)
+                stats.bump_daily(inflow=9)
+        counters = stats.reconcile()
+        self.assertEqual(stats.snapshot(), {
+            'totalUsers': counters['total_users'], 'totalInvested': 2500.0,
+            'pendingBankTransfers': 0, 'pendingWithdrawals': 0,
+        })
+        self.assertEqual(stats.series(days=1)[0]['inflow'], 2500.0)
+        self.assertEqual(
+            set(StatCounter.objects.exclude(name__in=stats.COUNTERS).values_list('value', flat=True)), {0},
+        )
+
+
+class UserSearchTests(TestCase):
+    """Admin user search: prefix matches first, then substring matches, over strict cursors."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice, cls.carol, cls.bob, cls.dave = UserProfile.objects.bulk_create([
+            UserProfile(email='alice@example.com', name='Alice', mobile='9876500001'),
+            UserProfile(email='carol@example.net', name='Carol', mobile='9876500002'),
+            UserProfile(email='bob.alice@example.com', name='Bob', mobile='1119876500'),
+            UserProfile(email='dave@example.com', name='Dave', mobile='5550001111'),
+        ])
+
+    def pages(self, q, limit):
+        ids, cursor = user_search.search_ids(q, limit=limit)
+        pages = [ids]
+        while cursor:
+            ids, cursor = user_search.search_ids(q, cursor=cursor, limit=limit)
+            pages.append(ids)
+        return pages
+
+    def test_prefix_matches_come_first_then_substring_matches(self):
+        expected = [self.alice.id, self.carol.id, self.bob.id]
+        self.assertEqual(self.pages('98765', limit=50), [expected])
+        self.assertEqual(sum(self.pages('98765', limit=1), []), expected)
+        self.assertEqual(self.pages('98765', limit=2), [expected[:2], expected[2:]])
+        self.assertEqual(sum(self.pages('ALICE@', limit=1), []), [self.alice.id, self.bob.id])
+        self.assertEqual(sum(self.pages('', limit=3), []), sorted(p.id for p in UserProfile.objects.all()))
+
+    def test_like_wildcards_in_the_query_are_literal(self):
+        self.assertEqual(self.pages('a_ice@', limit=50), [[]])
+        self.assertEqual(self.pages('%@example', limit=50), [[]])
+        with mock.patch.object(connection, 'vendor', 'postgresql'):
+            _, params = user_search._ranked_sql('5%_a\\', None, 10)
+        self.assertEqual(params[3:6], ['%5\\%\\_a\\\\%'] * 3)
+
+    def test_malformed_cursors_are_rejected(self):
+        bad = [
+            ('prefix', 'name', 'Alice', self.alice.id),
+            ('prefix', 'mobile', '98765', self.alice.id),  # not the field the query searches
+            ('prefix', 'email', 'alice@example.com', str(self.alice.id)),
+            ('prefix', 'email', 'alice@example.com'),
+            ('rank', 'best', self.alice.id),
+            ('rank', 0.5, True),
+            ('id', self.alice.id, 1),
+            ('unknown', 1),
+        ]
+        for parts in bad:
+            with self.subTest(parts=parts), self.assertRaises(ValueError):
+                user_search.search_ids('alice@', cursor=user_search.encode_cursor(*parts))
+        for cursor in ('not-a-cursor!', user_search.encode_cursor()[:-1] + 'x', 'e30'):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                user_search.search_ids('alice@', cursor=cursor)
+
+        response = self.client.get(
+            '/api/admin/users/', {'q': 'alice@', 'cursor': user_search.encode_cursor('prefix', 'name', 'x', 1)},
+            HTTP_AUTHORIZATION=f"Bearer {issue_token(admin_email='admin@ankuon2.com')}",
+        )
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Invalid cursor'}))
+
+    @skipUnless(connection.vendor == 'sqlite', 'index names are SQLite plan output')
+    def test_prefix_lookup_range_scans_an_index(self):
+        for field in user_search.PREFIX_FIELDS:
+            sql, params = UserProfile.objects.filter(**{f'{field}__startswith': '98'}).query.sql_with_params()
+            self.assertTrue(
+                any(f'profile_{field}_prefix' in line for line in explain(sql, params)), explain(sql, params),
+            )
+
+
+@override_settings(OTP_STORE='cache')
+class TokenAuthTests(TestCase):
+    """Bearer-token requests resolve the profile without the session."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profile = UserProfile.objects.create(
+            email='token@example.com', name='Token',
+        )
+
+    def setUp(self):
+        profile_cache.profiles.clear()
+        otp.reset_store()
+        self.addCleanup(otp.reset_store)
+
+    def test_verify_otp_issues_token(self):
+        code = otp.get_store().issue(self.profile.email, 'Token')
+        response = self.client.post('/api/verify-otp/', {
+            'email': self.profile.email, 'otp': code,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['token'])
+
+    def test_cached_profile_skips_database(self):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_token(self.profile)}'}
+        self.assertEqual(self.client.get('/api/profile/', **auth).status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/profile/', **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 0, ctx.captured_queries)
+
+    def test_update_invalidates_cache(self):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_token(self.profile)}'}
+        self.client.get('/api/profile/', **auth)
+        self.client.post('/api/update-profile/', {'name': 'Renamed'},
+                         content_type='application/json', **auth)
+        self.assertEqual(self.client.get('/api/profile/', **auth).json()['name'], 'Renamed')
+
+    def test_bad_token_falls_back_to_session(self):
+        self.assertEqual(self.client.get(
+            '/api/profile/', HTTP_AUTHORIZATION='Bearer admin-session',
+        ).status_code, 401)
+
+    def test_invalidation_in_another_worker_reaches_this_one(self):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_token(self.profile)}'}
+        self.assertEqual(self.client.get('/api/profile/', **auth).json()['kycStatus'], 'Not Verified')
+        UserProfile.objects.filter(id=self.profile.id).update(kyc_status='Verified')
+        # the other worker drops its own local entry, never ours
+        with mock.patch.object(profile_cache.profiles, 'invalidate'), \
+                self.captureOnCommitCallbacks(execute=True):
+            profile_cache.invalidate(self.profile)
+        self.assertEqual(self.client.get('/api/profile/', **auth).json()['kycStatus'], 'Verified')
+
+    def test_money_moving_views_read_a_fresh_profile(self):
+        verified = UserProfile.objects.create(email='fresh@example.com', name='Fresh', kyc_status='Verified')
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_token(verified)}'}
+        self.assertEqual(self.client.get('/api/profile/', **auth).json()['kycStatus'], 'Verified')
+        UserProfile.objects.filter(id=verified.id).update(kyc_status='Rejected')  # no invalidation
+        for path in ('/api/invest/', '/api/async/invest/', '/api/withdraw/'):
+            response = self.client.post(path, {'amount': 10000}, content_type='application/json', **auth)
+            self.assertEqual((path, response.status_code), (path, 403))
+
+    def test_kyc_claim_lapses_when_the_profile_changes(self):
+        token = issue_token(self.profile)
+        self.assertEqual(
+            {k: v for k, v in read_token(token).items() if k != 'kv'},
+            {'pid': self.profile.id, 'kyc': 'Not Verified'},
+        )
+        user = TokenUser(read_token(token))
+        self.assertEqual(user.kyc_status, 'Not Verified')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile_cache.invalidate(self.profile)
+        self.assertIsNone(user.kyc_status)
+        self.assertIsNone(TokenUser({'pid': self.profile.id}).kyc_status)
+
+
+@override_settings(OTP_MAX_ATTEMPTS=3, OTP_SEND_LIMIT=2, OTP_STORE='cache')
+class OtpTests(TestCase):
+    """OTP send/verify only touch the database on a successful login."""
+
+    email = 'new@example.com'
+
+    def setUp(self):
+        cache.clear()
+        otp.reset_store()
+        self.addCleanup(otp.reset_store)
+
+    def post(self, url, data):
+        return self.client.post(url, data, content_type='application/json')
+
+    def test_send_and_verify(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.post('/api/send-otp/', {'email': self.email, 'name': 'New'}).status_code, 200)
+            self.assertEqual(self.post('/api/verify-otp/', {'email': self.email, 'otp': '000000'}).status_code, 400)
+        self.assertEqual(ctx.captured_queries, [])
+        self.assertFalse(UserProfile.objects.filter(email=self.email).exists())
+
+        code = otp.get_store().issue(self.email, 'New')
+        response = self.post('/api/verify-otp/', {'email': self.email, 'otp': code})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(UserProfile.objects.get(email=self.email).name, 'New')
+        # codes are single use
+        self.assertEqual(self.post('/api/verify-otp/', {'email': self.email, 'otp': code}).status_code, 400)
+
+    def test_attempts_and_rate_limit(self):
+        code = otp.get_store().issue(self.email, 'New')
+        for _ in range(2):
+            self.assertEqual(self.post('/api/verify-otp/', {'email': self.email, 'otp': 'nope'}).status_code, 400)
+        self.assertEqual(self.post('/api/verify-otp/', {'email': self.email, 'otp': 'nope'}).status_code, 429)
+        self.assertEqual(self.post('/api/verify-otp/', {'email': self.email, 'otp': code}).status_code, 400)
+
+        self.assertEqual(self.post('/api/send-otp/', {'email': self.email, 'name': 'New'}).status_code, 200)
+        response = self.post('/api/send-otp/', {'email': self.email, 'name': 'New'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_unreachable_store_is_a_503(self):
+        store = otp.get_store()
+        with mock.patch.object(type(store), '_issue', side_effect=otp.StoreUnavailable('down')), \
+                mock.patch.object(type(store), '_verify', side_effect=otp.StoreUnavailable('down')):
+            self.assertEqual(self.post('/api/send-otp/', {'email': self.email, 'name': 'New'}).status_code, 503)
+            self.assertEqual(self.post('/api/verify-otp/', {'email': self.email, 'otp': '123456'}).status_code, 503)
+
+
+@override_settings(OTP_STORE='memory')
+class MemoryOtpTests(OtpTests):
+    pass
+
+
+class OtpStoreSelectionTests(SimpleTestCase):
+    """Codes must be verifiable by any worker, so a process-local store is never picked silently."""
+
+    LOCAL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    SHARED = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'cache'}}
+
+    def build(self, **overrides):
+        overrides = {'OTP_STORE': '', 'REDIS_URL': '', 'CELERY_BROKER_URL': '', 'CACHES': self.LOCAL, **overrides}
+        with self.settings(**overrides):
+            return otp._build_store()
+
+    def test_picks_the_first_shared_store(self):
+        store = self.build(CELERY_BROKER_URL='redis://localhost:6379/3')
+        self.assertIsInstance(store, otp.RedisOtpStore)
+        self.assertEqual(store.client.connection_pool.connection_kwargs['db'], 3)
+        self.assertIsInstance(self.build(REDIS_URL='redis://localhost:6379/1', CELERY_BROKER_URL='amqp://x'),
+                              otp.RedisOtpStore)
+        self.assertIsInstance(self.build(CELERY_BROKER_URL='amqp://guest@localhost//', CACHES=self.SHARED),
+                              otp.CacheOtpStore)
+
+    def test_no_shared_store_fails_loudly(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.build(DEBUG=False)
+        self.assertIsInstance(self.build(DEBUG=True), otp.MemoryOtpStore)
+        self.assertIsInstance(self.build(OTP_STORE='memory'), otp.MemoryOtpStore)
+        with self.assertRaises(ImproperlyConfigured):
+            self.build(OTP_STORE='redis')
+        with self.assertRaises(TypeError):
+            otp.OtpStore()
+
+
+class MailerTests(TestCase):
+    """Pooled delivery against the local SMTP stand-in."""
+
+    def setUp(self):
+        self.stub = SMTPStub(drop_every=7).start()
+        self.addCleanup(self.stub.stop)
+
+    def test_batches_over_one_connection_and_reconnects(self):
+        with self.settings(**self.stub.settings()):
+            outbox = mailer.Mailer(batch_size=10, backoff=0.001)
+            for i in range(20):
+                outbox.send(EmailMessage('OTP', f'code {i}', 'noreply@ankuon2.com', [f'u{i}@example.com']))
+            self.assertTrue(outbox.flush(timeout=10))
+            outbox.shutdown()
+        stats = outbox.stats()
+        self.assertEqual(len(self.stub.messages), 20)
+        self.assertEqual(stats['sent'], 20)
+        self.assertEqual(stats['failed'], 0)
+        # the stub hangs up every 7 messages; each drop costs one reconnect
+        self.assertEqual(self.stub.connections, 3)
+        self.assertEqual(stats['queueDepth'], 0)
+
+
+class AsyncApiTests(TestCase):
+    """The /api/async/ endpoints answer like their sync counterparts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profile = UserProfile.objects.create(
+            email='async@example.com', name='Async', kyc_status='Verified',
+        )
+        cls.auth = {'Authorization': f'Bearer {issue_token(cls.profile)}'}
+
+    def setUp(self):
+        profile_cache.profiles.clear()
+
+    async def test_invest_then_poll(self):
+        response = await self.async_client.post(
+            '/api/async/invest/', {'amount': 25000, 'payment_method': 'upi'},
+            content_type='application/json', headers=self.auth,
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        order_id = response.json()['order_id']
+
+        response = await self.async_client.get(f'/api/async/check-transaction/{order_id}/', headers=self.auth)
+        self.assertEqual(response.json()['status'], 'Pending')
+        response = await self.async_client.get('/api/async/profile/', headers=self.auth)
+        self.assertEqual(response.json()['email'], self.profile.email)
+        response = await self.async_client.get('/api/async/profile/')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_webhook_is_deduplicated(self):
+        payload = {'order_id': 'AO2-ASYNC-00001', 'utr': 'UTRA'}
+        with self.settings(CASHFREE_SECRET_KEY='', DEBUG=True):
+            first = await self.async_client.post('/api/async/webhooks/cashfree/', payload, content_type='application/json')
+            second = await self.async_client.post('/api/async/webhooks/cashfree/', payload, content_type='application/json')
+        self.assertEqual(first.json()['status'], 'queued')
+        self.assertEqual(second.json()['status'], 'duplicate')
+
+
+class CashfreeVATests(TestCase):
+    """VA client against the local fake Cashfree server."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.profile = UserProfile.objects.create(
+            email='va@example.com', name='VA Investor', kyc_status='Verified', mobile='9876543210',
+        )
+        cls.auth = {'HTTP_AUTHORIZATION': f'Bearer {issue_token(cls.profile)}'}
+
+    def setUp(self):
+        self.gateway = FakeCashfree().start()
+        self.addCleanup(self.gateway.stop)
+        cashfree_va.reset_client()
+        self.addCleanup(cashfree_va.reset_client)
+        profile_cache.profiles.clear()
+
+    def test_reuses_one_connection(self):
+        with self.settings(**self.gateway.settings()):
+            first = cashfree_va.create_virtual_account('AO2-20261018-00001', 'A', 'a@example.com')
+            second = cashfree_va.create_virtual_account('AO2-20261018-00002', 'B', 'b@example.com')
+        self.assertTrue(first['accountNumber'])
+        self.assertNotEqual(first['accountNumber'], second['accountNumber'])
+        self.assertEqual([path for path, _ in self.gateway.requests], ['/authorize', '/createVA', '/createVA'])
+        self.assertEqual(self.gateway.connections, 1)
+
+    def test_breaker_degrades_to_pending(self):
+        self.gateway.fail_next(100)
+        with self.settings(**self.gateway.settings(), CASHFREE_VA_RETRIES=1, CASHFREE_VA_BREAKER_THRESHOLD=2):
+            for i in range(2):
+                va = cashfree_va.create_virtual_account(f'AO2-20261018-1000{i}', 'A', 'a@example.com')
+                self.assertTrue(cashfree_va.is_pending(va))
+            calls = len(self.gateway.requests)
+            va = cashfree_va.create_virtual_account('AO2-20261018-10009', 'A', 'a@example.com')
+        self.assertEqual(va['reason'], 'gateway unavailable')
+        self.assertEqual(len(self.gateway.requests), calls)
+
+    def test_deferred_va_is_attached_after_commit(self):
+        with self.settings(**self.gateway.settings(), CASHFREE_VA_DEFER=True), eager_tasks():
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/invest/', {
+                    'amount': 600000, 'payment_method': 'bank',
+                }, content_type='application/json', **self.auth)
+            self.assertEqual(response.json()['virtualAccount']['status'], cashfree_va.PENDING)
+            order_id = response.json()['order_id']
+            response = self.client.get(f'/api/check-transaction/{order_id}/', **self.auth)
+        va = response.json()['virtualAccount']
+        self.assertTrue(va['accountNumber'])
+        self.assertEqual(Investment.objects.get(order_id=order_id).va_id, va['vAccountId'])
+
+    def test_invest_claims_pooled_va_without_gateway_call(self):
+        with self.settings(**self.gateway.settings(), VA_POOL_SIZE=3, VA_POOL_LOW_WATER=1):
+            self.assertEqual(va_pool.refill(), 3)
+            calls = len(self.gateway.requests)
+            orders = []
+            for _ in range(2):
+                response = self.client.post('/api/invest/', {
+                    'amount': 600000, 'payment_method': 'bank',
+                }, content_type='application/json', **self.auth)
+                orders.append(response.json()['order_id'])
+            metrics = va_pool.metrics()
+        self.assertEqual(len(self.gateway.requests), calls)
+        va_ids = set(Investment.objects.filter(order_id__in=orders).values_list('va_id', flat=True))
+        self.assertEqual(len(va_ids), 2)
+        self.assertEqual(
+            set(PooledVirtualAccount.objects.filter(status='Claimed').values_list('va_id', flat=True)), va_ids,
+        )
+        self.assertEqual(metrics['available'], 1)
+        self.assertGreaterEqual(metrics['claims']['hits'], 2)
+
+    def test_claim_below_low_water_refills_without_a_broker(self):
+        cache.clear()  # the refill debounce key
+        with self.settings(**self.gateway.settings(), VA_POOL_SIZE=2, VA_POOL_LOW_WATER=2), eager_tasks():
+            self.assertEqual(va_pool.refill(), 2)
+            calls = len(self.gateway.requests)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertTrue(va_pool.claim('AO2-20261018-66666'))
+            self.assertEqual(va_pool.metrics()['available'], 2)
+        self.assertEqual(len(self.gateway.requests), calls + 1)
+
+    def test_orphaned_claim_is_released(self):
+        with self.settings(**self.gateway.settings(), VA_POOL_SIZE=1):
+            va_pool.refill()
+            va = va_pool.claim('AO2-20261018-77777')
+            PooledVirtualAccount.objects.filter(va_id=va['vAccountId']).update(
+                claimed_at=timezone.now() - timedelta(hours=1),
+            )
+            self.assertEqual(va_pool.release_orphans(), 1)
+            self.assertEqual(va_pool.metrics()['available'], 1)
+
+
+class OrderIdTests(TestCase):
+    def test_ids_are_unique_and_sorted_when_the_clock_stalls_or_steps_back(self):
+        ticks = iter([1760000000000] * 5000 + [1759999999000] * 5000)
+        generator = order_ids.OrderIdGenerator(7, clock=lambda: next(ticks))
+        ids = [generator.next_id() for _ in range(10000)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids, sorted(ids))
+
+    def test_reserve_hands_out_consecutive_ids(self):
+        generator = order_ids.OrderIdGenerator(3, clock=lambda: 1760000000000)
+        first = generator.next_id()
+        batch = generator.reserve(10000)
+        last = generator.next_id()
+        self.assertEqual(len(set(batch)), 10000)
+        self.assertEqual([first, *batch, last], sorted([first, *batch, last]))
+        created_at, node, sequence = order_ids.decode(batch[0])
+        self.assertEqual((node, sequence), (3, 1))
+        self.assertEqual(created_at.strftime('%Y%m%d'), batch[0].split('-')[1])
+
+    def test_ids_fit_reconciliation_and_va_ids(self):
+        order_id = order_ids.new_order_id()
+        self.assertEqual(ORDER_ID_RE.search(f'NEFT {order_id} UTR123').group(0), order_id)
+        self.assertLessEqual(len(cashfree_va.vaccount_id(order_id)), 30)
+
+    def test_processes_lease_distinct_nodes(self):
+        nodes = {order_ids.acquire_node(2)[0] for _ in range(4)}
+        self.assertEqual(nodes, {0, 1, 2, 3})
+        with self.assertRaises(RuntimeError):
+            order_ids.acquire_node(2)
+
+    def test_expired_node_is_retaken_without_going_back_in_time(self):
+        node, _, _ = order_ids.acquire_node(1)
+        expired = timezone.now() - timedelta(seconds=5)
+        OrderIdNode.objects.filter(node=node).update(expires_at=expired)
+        OrderIdNode.objects.exclude(node=node).update(expires_at=timezone.now() + timedelta(hours=1))
+        retaken, _, previous = order_ids.acquire_node(1)
+        self.assertEqual((retaken, previous), (node, expired))
+        # a host whose clock is behind the old holder's still starts after its lease
+        start_ms = int(previous.timestamp() * 1000)
+        generator = order_ids.OrderIdGenerator(retaken, clock=lambda: start_ms - 60000, start_ms=start_ms)
+        created_at, _, sequence = order_ids.decode(generator.next_id())
+        self.assertEqual((int(created_at.timestamp() * 1000), sequence), (start_ms, 0))
+
+    @override_settings(ORDER_ID_NODE=None, ORDER_ID_NODE_BITS=1)
+    def test_lost_lease_is_replaced_on_renewal(self):
+        order_ids.reset_generator()
+        self.addCleanup(order_ids.reset_generator)
+        node = order_ids.get_generator().node
+        OrderIdNode.objects.filter(node=node).update(holder='other:1:x')
+        order_ids._lease = (*order_ids._lease[:2], 0)  # renewal due
+        self.assertEqual(order_ids.get_generator().node, 1 - node)
+        order_ids._lease = (*order_ids._lease[:2], 0)
+        before = OrderIdNode.objects.get(node=1 - node).expires_at
+        self.assertEqual(order_ids.get_generator().node, 1 - node)
+        self.assertGreater(OrderIdNode.objects.get(node=1 - node).expires_at, before)
+
+    def test_colliding_order_id_is_reissued(self):
+        profile = UserProfile.objects.create(email='dup@example.com', name='Dup', kyc_status='Verified')
+        taken = order_ids.new_order_id()
+        Investment.objects.create(user=profile, amount=20000, order_id=taken, payment_method='qr')
+        data = api_views.record_investment(profile, Decimal('25000'), taken, 'qr', None)
+        self.assertNotEqual(data['order_id'], taken)
+        self.assertEqual(Investment.objects.filter(user=profile).count(), 2)
+
+
+class AccrualTests(TestCase):
+    def setUp(self):
+        self.profile = UserProfile.objects.create(email='accrual@example.com', name='Accrual')
+        self.today = timezone.localdate()
+        now = timezone.now()
+        Investment.objects.bulk_create([
+            Investment(
+                user=self.profile, amount=amount, order_id=f'AO2-ACCRUAL-{i}',
+                status=status, confirmed_at=now - timedelta(days=days) if status == 'Confirmed' else None,
+            )
+            for i, (amount, status, days) in enumerate([
+                (100000, 'Confirmed', 45), (30000, 'Confirmed', 10), (50000, 'Pending', 0),
+            ])
+        ])
+        portfolio.rebuild([self.profile.id])
+
+    def test_accrues_simple_monthly_return_and_balance(self):
+        summary = accrual.run(as_of=self.today, chunk_size=1)
+        self.assertEqual((summary['scanned'], summary['updated']), (2, 2))
+        returns = dict(Investment.objects.values_list('order_id', 'returns'))
+        self.assertEqual(returns['AO2-ACCRUAL-0'], Decimal('3000.00'))
+        self.assertEqual(returns['AO2-ACCRUAL-1'], Decimal('200.00'))
+        self.assertEqual(returns['AO2-ACCRUAL-2'], Decimal('0.00'))
+        self.assertEqual(portfolio.verify([self.profile.id]), [])
+        self.assertEqual(PortfolioBalance.objects.get(user=self.profile).accrued_returns, Decimal('3200.00'))
+
+    def test_rerun_is_incremental(self):
+        accrual.run(as_of=self.today)
+        with self.assertNumQueries(1):
+            self.assertEqual(accrual.run(as_of=self.today)['skipped'], 'already complete')
+        # an interrupted run resumes after its last committed chunk
+        AccrualCheckpoint.objects.update(
+            accrued_through=self.today + timedelta(days=1), completed=False,
+            last_id=Investment.objects.get(order_id='AO2-ACCRUAL-0').id,
+        )
+        summary = accrual.run(as_of=self.today + timedelta(days=1))
+        self.assertEqual((summary['scanned'], summary['updated']), (1, 1))
+        self.assertEqual(Investment.objects.get(order_id='AO2-ACCRUAL-1').returns, Decimal('220.00'))
+        self.assertEqual(portfolio.verify([self.profile.id]), [])
+
+    def test_withdrawn_principal_stops_accruing(self):
+        full, partial = Investment.objects.filter(status='Confirmed').order_by('id')
+        for inv, amount, days_ago, status in [
+            (full, Decimal('101000.00'), 15, 'Completed'), (partial, Decimal('10000.00'), 5, 'Pending'),
+            (partial, Decimal('5000.00'), 2, 'Cancelled'), (partial, Decimal('-50000.00'), 8, 'Pending'),
+        ]:
+            wd = Withdrawal.objects.create(
+                user=self.profile, investment=inv, amount=amount, status=status,
+                processing_end=timezone.now(),
+            )
+            Withdrawal.objects.filter(id=wd.id).update(requested=timezone.now() - timedelta(days=days_ago))
+        portfolio.rebuild([self.profile.id])
+        accrual.run(as_of=self.today)
+        accrual.run(as_of=self.today + timedelta(days=30))
+        returns = dict(Investment.objects.values_list('order_id', 'returns'))
+        # 2% a month until the withdrawal 30 days in, nothing on the principal after it
+        self.assertEqual(returns['AO2-ACCRUAL-0'], Decimal('2000.00'))
+        # 30000 for 40 days, less 10000 withdrawn 35 days ago; the cancelled and
+        # the negative withdrawal change nothing
+        self.assertEqual(returns['AO2-ACCRUAL-1'], Decimal('566.67'))
+        self.assertEqual(portfolio.verify([self.profile.id]), [])
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.profile = UserProfile.objects.create(
+            email='ledger@example.com', name='Ledger', kyc_status='Verified',
+        )
+        Kyc.objects.create(
+            user=self.profile, pan='ABCDE1234F', aadhaar='123412341234', mobile='9876543210',
+            bank_account='123456789012', ifsc='HDFC0001234',
+        )
+        self.investment = Investment.objects.create(
+            user=self.profile, amount=50000, order_id='AO2-LEDGER-1',
+            status='Pending Bank Transfer', payment_method='bank',
+        )
+        session = self.client.session
+        session['admin_email'] = 'admin@ankuon2.com'
+        session['user_email'] = self.profile.email
+        session.save()
+        profile_cache.profiles.clear()
+
+    def post(self, url, data):
+        return self.client.post(url, data, content_type='application/json')
+
+    def test_money_movements_post_balanced_entries(self):
+        self.post(f'/api/admin/investments/{self.investment.id}/confirm/', {'utr': 'UTR1'})
+        self.post('/api/withdraw/', {'investment_id': self.investment.id, 'amount': 1000})
+        self.post('/api/withdraw/', {'investment_id': self.investment.id, 'amount': 2000})
+        first, second = Withdrawal.objects.order_by('id')
+        self.post('/api/cancel-withdrawal/', {'withdrawal_id': first.id})
+        self.post(f'/api/admin/withdrawals/{second.id}/process/', {'utr': 'UTR2'})
+
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'Cancelled')
+        self.assertEqual(
+            list(dict.fromkeys(LedgerEntry.objects.order_by('id').values_list('kind', flat=True))),
+            ['investment_confirmed', 'withdrawal_requested', 'withdrawal_cancelled', 'withdrawal_completed'],
+        )
+        balance = ledger.balance(self.profile.id)
+        self.assertEqual(balance['available'], Decimal('48000.00'))
+        self.assertEqual(balance['available'], PortfolioBalance.objects.get(user=self.profile).available_balance)
+        call_command('verify_ledger', '--snapshot', '--balances', stdout=StringIO())
+
+    def test_balance_reads_snapshot_plus_tail(self):
+        ledger.investments_confirmed([(self.profile.id, 50000, 'AO2-LEDGER-1')])
+        self.assertEqual(ledger.take_snapshots(), 1)
+        ledger.withdrawal_requested(self.profile.id, 500, 1)
+        with self.assertNumQueries(2):
+            balance = ledger.balance(self.profile.id)
+        self.assertEqual(balance['available'], Decimal('49500.00'))
+        self.assertEqual(ledger.take_snapshots(), 1)
+        self.assertEqual(LedgerSnapshot.objects.latest('through_entry_id').withdrawal_pending, Decimal('500.00'))
+
+        LedgerSnapshot.objects.filter(user=self.profile).update(principal=1)
+        with self.assertRaises(CommandError):
+            call_command('verify_ledger', stdout=StringIO())
+
+    def test_snapshot_covers_entries_up_to_the_committed_high_water(self):
+        ledger.investments_confirmed([(self.profile.id, 50000, 'AO2-LEDGER-1')])
+        high = LedgerEntry.objects.latest('id').id
+        self.assertEqual(ledger.committed_high_water(), high)
+        ledger.take_snapshots()
+        self.assertEqual(LedgerSnapshot.objects.get(user=self.profile).through_entry_id, high)
+
+    def test_withdrawals_are_limited_by_the_investment_and_the_ledger(self):
+        other = Investment.objects.create(
+            user=self.profile, amount=20000, order_id='AO2-LEDGER-2',
+            status='Pending Bank Transfer', payment_method='bank',
+        )
+        for inv in (self.investment, other):
+            self.post(f'/api/admin/investments/{inv.id}/confirm/', {'utr': f'UTR{inv.id}'})
+        insufficient = (400, {'error': 'Insufficient balance'})
+        # the ledger holds 70000, but only 20000 of it is this investment's
+        response = self.post('/api/withdraw/', {'investment_id': other.id, 'amount': 20000.01})
+        self.assertEqual((response.status_code, response.json()), insufficient)
+        response = self.post('/api/withdraw/', {'investment_id': self.investment.id, 'amount': 30000})
+        self.assertEqual(response.status_code, 200)
+        # no amount: whatever the investment has left
+        response = self.post('/api/withdraw/', {'investment_id': self.investment.id})
+        self.assertEqual(response.json()['withdrawal']['amount'], '20000.00')
+        response = self.post('/api/withdraw/', {'investment_id': self.investment.id, 'amount': 1})
+        self.assertEqual((response.status_code, response.json()), insufficient)
+        self.assertEqual(ledger.balance(self.profile.id)['available'], Decimal('20000.00'))
+
+
+class SecurityLogTests(TestCase):
+    def setUp(self):
+        self.profile = UserProfile.objects.create(email='audit@example.com', name='Audit')
+
+    def rows(self, n, action='LOGIN'):
+        return [SecurityLog(user=self.profile, action=action, detail=str(i)) for i in range(n)]
+
+    def test_writer_batches_and_writes_overflow_inline(self):
+        writer = security_log.SecurityLogWriter(batch_size=2, flush_interval=0, max_queue=3)
+        writer._ensure_thread = lambda: None  # drained by hand below
+        writer.put(self.rows(5))
+        self.assertEqual(SecurityLog.objects.count(), 2)
+        self.assertEqual(writer.stats()['queueDepth'], 3)
+        self.assertEqual(writer.drain(), 3)
+        self.assertEqual(SecurityLog.objects.count(), 5)
+        self.assertEqual(writer.stats(), {'written': 5, 'batches': 3, 'overflow': 2, 'failed': 0, 'dropped': 0, 'queueDepth': 0})
+
+    def test_unreachable_database_is_waited_out(self):
+        writer = security_log.SecurityLogWriter(batch_size=10, flush_interval=0, max_retries=0)
+        real = SecurityLog.objects.bulk_create
+        outcomes = iter([OperationalError('down'), OperationalError('still down'), None])
+
+        def bulk_create(*args, **kwargs):
+            error = next(outcomes)
+            if error:
+                raise error
+            return real(*args, **kwargs)
+
+        with mock.patch.object(SecurityLog.objects, 'bulk_create', side_effect=bulk_create), \
+                mock.patch.object(security_log.time, 'sleep'), mock.patch.object(security_log.connection, 'close'):
+            writer._write_until_done(self.rows(3))
+        self.assertEqual(SecurityLog.objects.count(), 3)
+        self.assertEqual((writer.counters['written'], writer.counters['failed']), (3, 6))
+
+    def test_overflow_write_error_reaches_the_caller(self):
+        writer = security_log.SecurityLogWriter(batch_size=2, flush_interval=0, max_queue=1, max_retries=0)
+        writer._ensure_thread = lambda: None
+        with mock.patch.object(SecurityLog.objects, 'bulk_create', side_effect=OperationalError('down')):
+            with self.assertRaises(OperationalError):
+                writer.put(self.rows(3))
+
+    def test_rejected_rows_are_dropped_without_blocking_the_batch(self):
+        writer = security_log.SecurityLogWriter(batch_size=10, flush_interval=0, max_retries=0)
+        real = SecurityLog.objects.bulk_create
+
+        def bulk_create(rows, *args, **kwargs):
+            if any(row.action == 'BAD' for row in rows):
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            return real(rows, *args, **kwargs)
+
+        rows = self.rows(5)
+        rows[3].action = 'BAD'
+        with mock.patch.object(SecurityLog.objects, 'bulk_create', side_effect=bulk_create), \
+                mock.patch.object(security_log.time, 'sleep') as sleep:
+            writer._write_until_done(rows)
+        sleep.assert_not_called()
+        self.assertEqual(sorted(SecurityLog.objects.values_list('detail', flat=True)), ['0', '1', '2', '4'])
+        self.assertEqual((writer.counters['written'], writer.counters['dropped'], writer.counters['failed']), (4, 1, 0))
+
+    @override_settings(SECURITY_LOG_ASYNC=False)
+    def test_record_waits_for_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    security_log.record(self.profile, 'KYC_VERIFIED', 'Aadhaar + Bank')
+                    raise ValueError
+            except ValueError:
+                pass
+            security_log.record(self.profile, 'LOGIN')
+        self.assertEqual(list(SecurityLog.objects.values_list('action', flat=True)), ['LOGIN'])
+
+    def test_archive_exports_and_removes_old_months(self):
+        now = timezone.now()
+        SecurityLog.objects.bulk_create(self.rows(3, 'OLD'))
+        SecurityLog.objects.filter(action='OLD').update(at=now - timedelta(days=500))
+        SecurityLog.objects.bulk_create(self.rows(2))
+        with tempfile.TemporaryDirectory() as out:
+            call_command('archive_security_logs', '--older-than-months', '12', '--out', out, '--dry-run',
+                         stdout=StringIO())
+            self.assertEqual(SecurityLog.objects.count(), 5)
+
+            call_command('archive_security_logs', '--older-than-months', '12', '--out', out, stdout=StringIO())
+            files = list(Path(out).glob('security_log-*.jsonl.gz'))
+            self.assertEqual(len(files), 1)
+            with gzip.open(files[0], 'rt') as archived:
+                self.assertEqual([json.loads(line)['action'] for line in archived], ['OLD'] * 3)
+        self.assertEqual(set(SecurityLog.objects.values_list('action', flat=True)), {'LOGIN'})
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.profile = UserProfile.objects.create(email='export@example.com', name='Export')
+        Investment.objects.bulk_create([
+            Investment(
+                user=self.profile, amount=1000 + i, order_id=f'AO2-EXPORT-{i}',
+                status='Confirmed' if i % 2 else 'Pending', payment_method='bank',
+            )
+            for i in range(5)
+        ])
+        Investment.objects.filter(order_id='AO2-EXPORT-1').update(date=timezone.now() - timedelta(days=40))
+        session = self.client.session
+        session['admin_email'] = 'admin@ankuon2.com'
+        session.save()
+
+    def test_csv_streams_filtered_rows_in_one_export_query(self):
+        since = (timezone.localdate() - timedelta(days=7)).isoformat()
+        with self.assertNumQueries(2):  # session + export
+            response = self.client.get(f'/api/admin/exports/investments.csv?status=Confirmed&from={since}')
+            body = b''.join(response.streaming_content).decode()
+        self.assertEqual(response.status_code, 200)
+        lines = body.splitlines()
+        self.assertEqual(lines[0].split(',')[:4], ['id', 'orderId', 'userId', 'userEmail'])
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], ['AO2-EXPORT-3'])
+
+        self.assertEqual(self.client.get('/api/admin/exports/investments.xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/admin/exports/users.csv?from=nope').status_code, 400)
+
+    def test_gzip_jsonl_and_command(self):
+        response = self.client.get('/api/admin/exports/investments.jsonl?gzip=1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual([r['orderId'] for r in rows], [f'AO2-EXPORT-{i}' for i in range(5)])
+        self.assertEqual(rows[0]['amount'], '1000.00')
+
+        with tempfile.TemporaryDirectory() as out:
+            path = Path(out) / 'users.csv.gz'
+            call_command('export_data', 'users', '--gzip', '--out', str(path), '--chunk-size', '1', stderr=StringIO())
+            with gzip.open(path, 'rt') as exported:
+                self.assertEqual(len(exported.read().splitlines()), 2)
+
+
+class SeedScaleTests(TestCase):
+    def test_seeded_rows_are_consistent(self):
+        UserProfile.objects.create(email='existing@example.com', name='Existing')
+        out = StringIO()
+        call_command(
+            'seed_scale', '--users', '40', '--investments', '200', '--security-logs', '30',
+            '--chunk-size', '15', '--withdrawal-rate', '0.5', '--seed', '7', stdout=out,
+        )
+        self.assertEqual(UserProfile.objects.count(), 41)
+        self.assertEqual(Investment.objects.count(), 200)
+        self.assertEqual(SecurityLog.objects.count(), 30)
+        self.assertEqual(Kyc.objects.count(), UserProfile.objects.filter(kyc_status='Verified').count())
+        self.assertFalse(Withdrawal.objects.exclude(investment__status='Confirmed').exists())
+        self.assertFalse(Investment.objects.filter(date__gt=timezone.now()).exists())
+        self.assertEqual(portfolio.verify(), [])
+        call_command('verify_ledger', '--balances', stdout=StringIO())
+        # sequences moved past the explicit ids
+        self.assertGreater(UserProfile.objects.create(email='after@example.com', name='After').id, 41)
+
+        with self.assertRaises(CommandError):
+            call_command('seed_scale', '--investment-statuses', 'Confirmed=50,Lost=50', stdout=StringIO())
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.profile = UserProfile.objects.create(email='metrics@example.com', name='Metrics')
+        profile_cache.profiles.clear()
+
+    def series(self, name, **labels):
+        histograms, _ = metrics.collect()
+        for (n, pairs), entry in histograms.items():
+            if n == name and all(dict(pairs).get(k) == v for k, v in labels.items()):
+                return entry
+        return None
+
+    def test_request_and_task_histograms(self):
+        key = dict(route='api/profile/', method='GET', status='200')
+        before = self.series('ankuon_http_db_queries', **key) or [0] * (len(metrics.QUERY_BUCKETS) + 2)
+        session = self.client.session
+        session['user_email'] = self.profile.email
+        session.save()
+        response = self.client.get('/api/profile/')
+        self.assertEqual(response.status_code, 200)
+        after = self.series('ankuon_http_db_queries', **key)
+        self.assertEqual(sum(after[:-1]) - sum(before[:-1]), 1)
+        self.assertGreater(after[-1], before[-1])
+        self.assertIsNotNone(self.series('ankuon_http_response_size_bytes', **key))
+
+        from app.tasks import snapshot_ledger
+        with eager_tasks():
+            snapshot_ledger.delay()
+        self.assertIsNotNone(self.series(
+            'ankuon_celery_task_duration_seconds', task='app.tasks.snapshot_ledger', state='SUCCESS',
+        ))
+
+    def test_endpoint_merges_process_files(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        with tempfile.TemporaryDirectory() as out, override_settings(METRICS_DIR=out, METRICS_TOKEN='scrape'):
+            buckets = len(metrics.TASK_BUCKETS)
+            (Path(out) / 'metrics-1.json').write_text(json.dumps({
+                'histograms': [[
+                    'ankuon_celery_task_duration_seconds', [['task', 'elsewhere'], ['state', 'SUCCESS']],
+                    [1] + [0] * buckets + [0.005],
+                ]],
+                'counters': [['ankuon_security_log_rows_total', [['outcome', 'written']], 7]],
+            }))
+            response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape')
+            self.assertEqual(response.status_code, 200)
+            body = response.content.decode()
+            self.assertIn(
+                'ankuon_celery_task_duration_seconds_count{task="elsewhere",state="SUCCESS"} 1', body,
+            )
+            self.assertIn('ankuon_security_log_rows_total{outcome="written"} 7', body)
+            self.assertIn('ankuon_webhook_inbox_pending 0', body)
+            self.assertTrue(any(p.name != 'metrics-1.json' for p in Path(out).iterdir()))
+
+
+def _budget_cases():
+    """route pattern -> (method, path(f), payload(f)); f is the seeded fixture."""
+    return {
+        'send-otp/': ('post', lambda f: '/api/send-otp/', lambda f: {'email': 'new@example.com', 'name': 'New'}),
+        'verify-otp/': ('post', lambda f: '/api/verify-otp/', lambda f: {'email': 'otp@example.com', 'otp': f.otp}),
+        'profile/': ('get', lambda f: '/api/profile/?include=history', None),
+        'investments/': ('get', lambda f: '/api/investments/?limit=100', None),
+        'withdrawals/': ('get', lambda f: '/api/withdrawals/?limit=100', None),
+        'invest/': ('post', lambda f: '/api/invest/', lambda f: {
+            'amount': 25000, 'payment_method': 'bank', 'requestVirtualAccount': False,
+        }),
+        'check-transaction/<str:order_id>/': ('get', lambda f: f'/api/check-transaction/{f.confirmed.order_id}/', None),
+        'withdraw/': ('post', lambda f: '/api/withdraw/', lambda f: {'investment_id': f.confirmed.id, 'amount': 10}),
+        'cancel-withdrawal/': ('post', lambda f: '/api/cancel-withdrawal/', lambda f: {'withdrawal_id': f.own_wd.id}),
+        'update-profile/': ('post', lambda f: '/api/update-profile/', lambda f: {'name': 'Budget Investor'}),
+        'kyc-verification/': ('post', lambda f: '/api/kyc-verification/', lambda f: {'ifsc': 'HDFC0001234'}),
+        'webhooks/cashfree/': ('post', lambda f: '/api/webhooks/cashfree/', lambda f: {
+            'order_id': f.pending_bank.order_id, 'utr': 'UTRW',
+        }),
+        'async/profile/': ('get', lambda f: '/api/async/profile/?include=history', None),
+        'async/invest/': ('post', lambda f: '/api/async/invest/', lambda f: {'amount': 25000, 'payment_method': 'upi'}),
+        'async/check-transaction/<str:order_id>/': (
+            'get', lambda f: f'/api/async/check-transaction/{f.confirmed.order_id}/', None,
+        ),
+        'async/webhooks/cashfree/': ('post', lambda f: '/api/async/webhooks/cashfree/', lambda f: {
+            'order_id': f.pending_bank.order_id, 'utr': 'UTRA',
+        }),
+        'admin/login/': ('post', lambda f: '/api/admin/login/', lambda f: {
+            'email': 'admin@ankuon2.com', 'password': 'budget-admin',
+        }),
+        'admin/stats/': ('get', lambda f: '/api/admin/stats/', None),
+        'admin/stats/series/': ('get', lambda f: '/api/admin/stats/series/?days=30', None),
+        'admin/webhooks/inbox/': ('get', lambda f: '/api/admin/webhooks/inbox/', None),
+        'admin/va-pool/': ('get', lambda f: '/api/admin/va-pool/', None),
+        'metrics/': ('get', lambda f: '/api/metrics/', None),
+        'admin/users/': ('get', lambda f: '/api/admin/users/?q=budget&limit=100', None),
+        'admin/users/<int:user_id>/': ('get', lambda f: f'/api/admin/users/{f.profile.id}/?include=history', None),
+        'admin/users/<int:user_id>/investments/': ('get', lambda f: f'/api/admin/users/{f.profile.id}/investments/', None),
+        'admin/users/<int:user_id>/withdrawals/': ('get', lambda f: f'/api/admin/users/{f.profile.id}/withdrawals/', None),
+        'admin/exports/<slug:dataset>.<slug:fmt>': ('get', lambda f: '/api/admin/exports/withdrawals.csv', None),
+        'admin/withdrawals/': ('get', lambda f: '/api/admin/withdrawals/', None),
+        'admin/withdrawals/bulk-process/': ('post', lambda f: '/api/admin/withdrawals/bulk-process/', lambda f: {
+            'items': [{'id': f.other_wd.id, 'utr': 'UTRP'}],
+        }),
+        'admin/withdrawals/bulk-reject/': ('post', lambda f: '/api/admin/withdrawals/bulk-reject/', lambda f: {
+            'items': [{'id': f.other_wd.id}],
+        }),
+        'admin/withdrawals/<int:withdrawal_id>/process/': (
+            'post', lambda f: f'/api/admin/withdrawals/{f.other_wd.id}/process/', lambda f: {'utr': 'UTRQ'},
+        ),
+        'admin/withdrawals/<int:withdrawal_id>/reject/': (
+            'post', lambda f: f'/api/admin/withdrawals/{f.other_wd.id}/reject/', lambda f: {},
+        ),
+        'admin/investments/': ('get', lambda f: '/api/admin/investments/', None),
+        'admin/investments/bulk-confirm/': ('post', lambda f: '/api/admin/investments/bulk-confirm/', lambda f: {
+            'items': [{'id': f.pending_bank.id, 'utr': 'UTRB'}],
+        }),
+        'admin/investments/<int:investment_id>/confirm/': (
+            'post', lambda f: f'/api/admin/investments/{f.pending_bank.id}/confirm/', lambda f: {'utr': 'UTRC'},
+        ),
+    }
+
+
+def _sql_shape(sql):
+    """SQL with literals blanked, so the same statement for another row matches."""
+    return re.sub(r"'(?:[^']|'')*'|\d+", '?', sql)
+
+
+# one counter shard: a random shard that does not exist yet costs extra queries to create
+@override_settings(
+    ADMIN_PASSWORD='budget-admin', ADMIN_STATS_SHARDS=1, CASHFREE_SECRET_KEY='', DEBUG=True, OTP_STORE='cache',
+    VA_POOL_SIZE=0,
+)
+class QueryBudgetTests(TestCase):
+    """Every /api/ endpoint issues the same number of queries at both data sizes.
+
+    A count that grows with the seeded rows is an N+1; the failure lists
+    the statements that repeat more often at the larger size.
+    """
+    SCALES = (3, 15)
+
+    def seed(self, n):
+        now = timezone.now()
+        profile = UserProfile.objects.create(
+            email='budget@example.com', name='Budget Investor', kyc_status='Verified', mobile='9876543210',
+        )
+        Kyc.objects.create(
+            user=profile, pan='ABCDE1234F', aadhaar='123412341234', mobile='9876543210',
+            account_name='Budget Investor', bank_account='123456789012', ifsc='HDFC0001234',
+        )
+        statuses = ['Confirmed', 'Pending Bank Transfer', 'Pending']
+        own = Investment.objects.bulk_create([
+            Investment(
+                user=profile, amount=50000 + i, order_id=f'AO2-BUDGET-{i:05d}',
+                status=statuses[i % 3], payment_method='bank',
+                confirmed_at=now if i % 3 == 0 else None,
+            )
+            for i in range(n)
+        ])
+        others = UserProfile.objects.bulk_create([
+            UserProfile(email=f'budget{i}@example.com', name=f'Budget User {i}', kyc_status='Verified')
+            for i in range(n)
+        ])
+        other_invs = Investment.objects.bulk_create([
+            Investment(
+                user=user, amount=20000, order_id=f'AO2-BUDGET-U{i:05d}',
+                status='Pending Bank Transfer', payment_method='bank',
+            )
+            for i, user in enumerate(others)
+        ])
+        Withdrawal.objects.bulk_create([
+            Withdrawal(
+                user=profile, investment=own[0], amount=100 + i,
+                status=['Pending', 'Completed', 'Rejected'][i % 3],
+                processing_end=now + timedelta(days=3),
+            )
+            for i in range(n)
+        ] + [
+            Withdrawal(
+                user=user, investment=inv, amount=500, status='Pending',
+                processing_end=now + timedelta(days=3),
+            )
+            for user, inv in zip(others, other_invs)
+        ])
+        ledger.investments_confirmed([
+            (inv.user_id, inv.amount, inv.order_id) for inv in own if inv.status == 'Confirmed'
+        ])
+        portfolio.rebuild()
+        return SimpleNamespace(
+            profile=profile,
+            confirmed=own[0],
+            pending_bank=other_invs[0],
+            own_wd=Withdrawal.objects.filter(user=profile, status='Pending').first(),
+            other_wd=Withdrawal.objects.filter(user=others[0]).first(),
+            user_auth={'HTTP_AUTHORIZATION': f'Bearer {issue_token(profile)}'},
+            admin_auth={'HTTP_AUTHORIZATION': f"Bearer {issue_token(admin_email='admin@ankuon2.com')}"},
+        )
+
+    def measure(self, n):
+        """{route: captured queries} for one data size; every change is rolled back."""
+        captured = {}
+        with transaction.atomic():
+            f = self.seed(n)
+            order_ids.new_order_id()  # lease the node outside the counted requests
+            for route, (method, path, payload) in _budget_cases().items():
+                self.client.cookies.clear()
+                cache.clear()
+                otp.reset_store()
+                profile_cache.profiles.clear()
+                user_search._fts_tables.clear()
+                f.otp = otp.get_store().issue('otp@example.com', 'Otp')
+                auth = f.admin_auth if route.startswith(('admin/', 'metrics/')) else f.user_auth
+                with transaction.atomic():
+                    with CaptureQueriesContext(connection) as ctx:
+                        response = getattr(self.client, method)(
+                            path(f), payload(f) if payload else None,
+                            content_type='application/json', **auth,
+                        )
+                        body = b''.join(response.streaming_content) if response.streaming else response.content
+                    transaction.set_rollback(True)
+                self.assertLess(response.status_code, 400, f'{route}: {response.status_code} {body[:200]}')
+                captured[route] = [q['sql'] for q in ctx.captured_queries]
+            transaction.set_rollback(True)
+        return captured
+
+    def test_every_endpoint_has_a_case(self):
+        routes = {str(p.pattern) for p in api_urls.urlpatterns}
+        self.assertEqual(routes - set(_budget_cases()), set(), 'add a query budget case for new endpoints')
+
+    def test_query_count_does_not_grow_with_data(self):
+        small, large = (self.measure(n) for n in self.SCALES)
+        failures = []
+        for route in small:
+            if len(small[route]) == len(large[route]):
+                continue
+            grown = Counter(map(_sql_shape, large[route])) - Counter(map(_sql_shape, small[route]))
+            examples = {}
+            for sql in large[route]:
+                examples.setdefault(_sql_shape(sql), sql)
+            failures.append(
+                f'{route}: {len(small[route])} queries with {self.SCALES[0]} rows, '
+                f'{len(large[route])} with {self.SCALES[1]}\n'
+                + '\n'.join(f'  +{count} x {examples[shape]}' for shape, count in grown.items())
+            )
+        self.assertFalse(failures, '\n\n'.join(failures))
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        replica.reset_lag()
+        self.addCleanup(replica.reset_lag)
+        self.router = replica.ReplicaRouter()
+        self.admin = RequestFactory().get(
+            '/', HTTP_AUTHORIZATION=f"Bearer {issue_token(admin_email='admin@ankuon2.com')}",
+        )
+
+    def read(self):
+        return self.router.db_for_read(Investment)
+
+    @mock.patch.object(replica, 'measure_lag', return_value=0.0)
+    def test_reads_follow_overrides_and_writes(self, measure_lag):
+        token = replica.start_request(self.admin)
+        self.assertEqual(self.read(), 'default')
+        with replica.use_replica():
+            self.assertEqual(self.read(), 'replica')
+            with replica.use_primary():
+                self.assertEqual(self.read(), 'default')
+            self.assertEqual(self.read(), 'replica')
+            self.assertEqual(self.router.db_for_write(Investment), 'default')
+            self.assertEqual(self.read(), 'default')  # read-your-writes
+        replica.finish_request(token)
+
+        # the admin stays on the primary for REPLICA_PIN_SECONDS; others do not
+        token = replica.start_request(self.admin)
+        with replica.use_replica():
+            self.assertEqual(self.read(), 'default')
+        replica.finish_request(token)
+        token = replica.start_request(RequestFactory().get('/'))
+        with replica.use_replica():
+            self.assertEqual(self.read(), 'replica')
+        replica.finish_request(token)
+        self.assertEqual(measure_lag.call_count, 1)  # cached between reads
+
+    def test_lagging_or_unreachable_replica_falls_back(self):
+        for lag in (60.0, None):
+            replica.reset_lag()
+            with mock.patch.object(replica, 'measure_lag', return_value=lag), replica.use_replica():
+                self.assertEqual(self.read(), 'default')
+        self.assertGreaterEqual(replica.counters['lagging'], 2)
+
+
+@skipUnless(replica.configured(), 'needs DATABASE_REPLICA_URL')
+class ReplicaRoutingTests(TransactionTestCase):
+    # the runner sets up every class's databases, skipped or not
+    databases = {'default', replica.REPLICA} if replica.configured() else {'default'}
+
+    def test_admin_reads_use_the_replica_until_the_admin_writes(self):
+        cache.clear()
+        replica.reset_lag()
+        profile = UserProfile.objects.create(email='replica@example.com', name='Replica', kyc_status='Verified')
+        inv = Investment.objects.create(user=profile, amount=50000, order_id='AO2-REPLICA-1', status='Confirmed')
+        wd = Withdrawal.objects.create(
+            user=profile, investment=inv, amount=1000, processing_end=timezone.now(),
+        )
+        auth = {'HTTP_AUTHORIZATION': f"Bearer {issue_token(admin_email='admin@ankuon2.com')}"}
+
+        with CaptureQueriesContext(connections['replica']) as on_replica:
+            self.assertEqual(self.client.get(f'/api/admin/users/{profile.id}/', **auth).status_code, 200)
+        self.assertTrue(on_replica.captured_queries)
+
+        self.client.post(f'/api/admin/withdrawals/{wd.id}/process/', {'utr': 'UTR1'}, content_type='application/json', **auth)
+        with CaptureQueriesContext(connections['replica']) as on_replica:
+            self.assertEqual(self.client.get('/api/admin/withdrawals/', **auth).json(), [])
+        self.assertFalse(on_replica.captured_queries)
@@ -0,0 +1,46 @@
+"""Standalone benchmarks. Run as ``python -m benchmarks.<name> --help``.
+
+Each benchmark builds a throwaway SQLite database (or uses DATABASE_URL
+when --use-env-db is given) so it never touches the development data.
+"""
+import os
+import resource
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_django(use_env_db=False):
+    """Point Django at a scratch database, migrate it and return its path."""
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+    db_path = None
+    if not use_env_db:
+        fd, db_path = tempfile.mkstemp(prefix='ankuon-bench-', suffix='.sqlite3')
+        os.close(fd)
+        os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ankuon.settings')
+    os.environ['CELERY_BROKER_URL'] = ''
+
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command('migrate', verbosity=0)
+    return db_path
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+@contextmanager
+def timed(results, name):
+    start = time.perf_counter()
+    yield
+    results[name] = round(time.perf_counter() - start, 3)
@@ -0,0 +1,82 @@
+"""Daily returns accrual over a large book of confirmed investments.
+
+    python -m benchmarks.bench_accrual --investments 1000000 --users 50000
+
+Times the first run (every row changes), a same-day rerun (checkpoint
+says complete) and the next day's run, and checks the balance table
+still matches the ledger afterwards.
+"""
+import argparse
+import json
+import random
+import sys
+from datetime import timedelta
+
+from benchmarks import setup_django, peak_rss_mb, timed
+
+
+def seed(investments, users):
+    from django.utils import timezone
+    from app.models import Investment, UserProfile
+    from app.services import portfolio
+
+    profiles = []
+    for start in range(0, users, 5000):
+        profiles.extend(UserProfile.objects.bulk_create([
+            UserProfile(email=f'accrual{i}@example.com', name=f'Accrual {i}')
+            for i in range(start, min(users, start + 5000))
+        ]))
+    now = timezone.now()
+    batch = []
+    for i in range(investments):
+        batch.append(Investment(
+            user=profiles[i % len(profiles)],
+            amount=10000 + random.randint(0, 990000),
+            order_id=f'AO2-ACCRUAL-{i:08d}',
+            status='Confirmed',
+            payment_method='bank',
+            confirmed_at=now - timedelta(days=random.randint(0, 730), seconds=random.randint(0, 86399)),
+        ))
+        if len(batch) == 10000:
+            Investment.objects.bulk_create(batch)
+            batch = []
+    Investment.objects.bulk_create(batch)
+    portfolio.rebuild()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--investments', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=50_000)
+    parser.add_argument('--chunk-size', type=int, default=None)
+    parser.add_argument('--skip-verify', action='store_true')
+    parser.add_argument('--use-env-db', action='store_true')
+    args = parser.parse_args()
+
+    setup_django(use_env_db=args.use_env_db)
+    from django.utils import timezone
+    from app.services import accrual, portfolio
+
+    results = {'investments': args.investments, 'users': args.users}
+    with timed(results, 'seedSeconds'):
+        seed(args.investments, args.users)
+
+    today = timezone.localdate()
+    with timed(results, 'firstRunSeconds'):
+        results['firstRun'] = accrual.run(as_of=today, chunk_size=args.chunk_size)
+    results['firstRunRowsPerSecond'] = round(args.investments / max(results['firstRunSeconds'], 1e-9))
+    with timed(results, 'sameDayRerunSeconds'):
+        results['sameDayRerun'] = accrual.run(as_of=today, chunk_size=args.chunk_size)
+    with timed(results, 'nextDaySeconds'):
+        results['nextDay'] = accrual.run(as_of=today + timedelta(days=1), chunk_size=args.chunk_size)
+    if not args.skip_verify:
+        with timed(results, 'verifySeconds'):
+            results['balanceMismatches'] = len(portfolio.verify())
+    results['peakRssMb'] = round(peak_rss_mb(), 1)
+
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""gunicorn (sync workers, /api/...) vs uvicorn (ASGI, /api/async/...) with a slow gateway.
+
+    python -m benchmarks.bench_asgi --requests 2000 --concurrency 64 --gateway-delay 0.3
+
+The request mix is invest (VA requested, served by benchmarks.fake_cashfree
+with --gateway-delay per call), check-transaction polling and profile
+reads. Each server gets the same worker count. Servers that are not
+installed are reported as skipped.
+Use --use-env-db to run against Postgres; SQLite serializes the writes.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+from benchmarks import ROOT, setup_django
+from benchmarks.fake_cashfree import FakeCashfree
+from benchmarks.loadgen import Server, free_port, run_load
+
+
+def seed(users):
+    from app.api.authentication import issue_token
+    from app.models import Investment, UserProfile
+
+    profiles = UserProfile.objects.bulk_create([
+        UserProfile(email=f'asgi{i}@example.com', name=f'ASGI {i}', kyc_status='Verified', verified=True)
+        for i in range(users)
+    ])
+    Investment.objects.bulk_create([
+        Investment(user=p, amount=10000, order_id=f'AO2-ASGI-{p.id:08d}', status='Pending', payment_method='upi')
+        for p in profiles
+    ])
+    return [(issue_token(p), f'AO2-ASGI-{p.id:08d}') for p in profiles]
+
+
+def request_mix(accounts, prefix, invest_ratio):
+    def next_request(i):
+        token, order_id = accounts[i % len(accounts)]
+        headers = {'Authorization': f'Bearer {token}'}
+        roll = random.random()
+        if roll < invest_ratio:
+            body = {'amount': 20000, 'payment_method': 'bank', 'requestVirtualAccount': True}
+            return 'invest', 'POST', f'/api/{prefix}invest/', body, headers
+        if roll < invest_ratio + (1 - invest_ratio) / 2:
+            return 'check-transaction', 'GET', f'/api/{prefix}check-transaction/{order_id}/', None, headers
+        return 'profile', 'GET', f'/api/{prefix}profile/', None, headers
+    return next_request
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--gateway-delay', type=float, default=0.3)
+    parser.add_argument('--invest-ratio', type=float, default=0.2)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--use-env-db', action='store_true')
+    args = parser.parse_args()
+
+    setup_django(use_env_db=args.use_env_db)
+    accounts = seed(args.users)
+
+    gateway = FakeCashfree(delay=args.gateway_delay).start()
+    env = dict(
+        os.environ,
+        CASHFREE_VA_BASE_URL=gateway.base_url,
+        CASHFREE_APP_ID=gateway.client_id,
+        CASHFREE_SECRET_KEY='bench-secret',
+        ALLOWED_HOSTS='127.0.0.1,localhost',
+        DEBUG='False',
+        PYTHONPATH=str(ROOT),
+    )
+    servers = [
+        ('gunicorn-sync', 'gunicorn', '', lambda port: [
+            'gunicorn', 'ankuon.wsgi:application', '--workers', str(args.workers),
+            '--worker-class', 'sync', '--bind', f'127.0.0.1:{port}', '--timeout', '120',
+        ]),
+        ('uvicorn-asgi', 'uvicorn', 'async/', lambda port: [
+            'uvicorn', 'ankuon.asgi:application', '--workers', str(args.workers),
+            '--host', '127.0.0.1', '--port', str(port), '--no-access-log',
+        ]),
+    ]
+
+    results = {
+        'requests': args.requests, 'concurrency': args.concurrency,
+        'workers': args.workers, 'gatewayDelay': args.gateway_delay,
+    }
+    for name, executable, prefix, argv in servers:
+        if not Server.available(executable):
+            results[name] = {'skipped': f'{executable} is not installed'}
+            continue
+        port = free_port()
+        with Server(argv(port), port, env=env, cwd=str(ROOT)):
+            results[name] = run_load(
+                f'http://127.0.0.1:{port}',
+                request_mix(accounts, prefix, args.invest_ratio),
+                total=args.requests, concurrency=args.concurrency,
+            )
+    gateway.stop()
+    results['gatewayConnections'] = gateway.connections
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
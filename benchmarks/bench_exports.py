@@ -0,0 +1,67 @@
+"""Streaming investment export over a large table.
+
+    python -m benchmarks.bench_exports --investments 1000000
+
+Streams the whole table as CSV and as gzipped JSONL, counting bytes
+without keeping them, and reports peak RSS before and after each export:
+with a server-side cursor the peak should not grow with the row count.
+"""
+import argparse
+import json
+import sys
+
+from benchmarks import setup_django, peak_rss_mb, timed
+
+
+def seed(investments, users):
+    from django.utils import timezone
+    from app.models import Investment, UserProfile
+
+    profiles = UserProfile.objects.bulk_create([
+        UserProfile(email=f'export{i}@example.com', name=f'Export {i}') for i in range(users)
+    ])
+    now = timezone.now()
+    batch = []
+    for i in range(investments):
+        batch.append(Investment(
+            user=profiles[i % users], amount=10000 + i % 990000, order_id=f'AO2-EXPORT-{i:08d}',
+            status='Confirmed' if i % 3 else 'Pending', payment_method='bank', confirmed_at=now,
+        ))
+        if len(batch) == 10000:
+            Investment.objects.bulk_create(batch)
+            batch = []
+    Investment.objects.bulk_create(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--investments', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--chunk-size', type=int, default=None)
+    parser.add_argument('--use-env-db', action='store_true')
+    args = parser.parse_args()
+
+    setup_django(use_env_db=args.use_env_db)
+    from app.services import exports
+
+    results = {'investments': args.investments}
+    with timed(results, 'seedSeconds'):
+        seed(args.investments, args.users)
+    results['peakRssMbAfterSeed'] = round(peak_rss_mb(), 1)
+
+    for fmt, gzip in (('csv', False), ('jsonl', True)):
+        key = fmt + ('Gzip' if gzip else '')
+        size = 0
+        with timed(results, f'{key}Seconds'):
+            for chunk in exports.stream('investments', fmt, gzip=gzip, chunk_size=args.chunk_size):
+                size += len(chunk)
+        results[f'{key}Bytes'] = size
+        results[f'{key}RowsPerSecond'] = round(args.investments / max(results[f'{key}Seconds'], 1e-9))
+        results[f'peakRssMbAfter{key[0].upper()}{key[1:]}'] = round(peak_rss_mb(), 1)
+
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
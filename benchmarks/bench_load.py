@@ -0,0 +1,453 @@
+"""End-to-end load test of the investor and admin flows against a real server.
+
+    python -m benchmarks.bench_load --users 200 --concurrency 32 --out run.json
+    python -m benchmarks.bench_load --users 200 --concurrency 32 --baseline run.json
+
+Steps run in order, each as its own burst against one server process
+tree, and each reports throughput and p50/p95/p99 per endpoint:
+
+    otp       send-otp for every user, then verify-otp with the code read
+              back from benchmarks.smtp_stub
+    kyc       full KYC submission (-> Verified)
+    invest    bank transfers with a virtual account from benchmarks.fake_cashfree
+              (--gateway-delay per call), every fourth one UPI
+    poll      check-transaction, --polls times per order
+    webhook   signed PAYMENT_SUCCESS deliveries for the bank transfers, with
+              --webhook-retries of them resent as Cashfree retries do
+    withdraw  a partial withdrawal against every confirmed investment
+    admin     pending-withdrawal and bank-transfer queues: list, process,
+              reject and confirm, interleaved
+
+--scenarios runs a subset; missing state (users, KYC, orders) is then
+written directly to the database first. Any 4xx/5xx is counted as an
+error, since every request in the mix is expected to succeed.
+
+With --baseline the run is compared endpoint by endpoint with an earlier
+--out file; the process exits 1 when a percentile grew by more than
+--threshold (and by at least --min-delta-ms) or errors appeared, so it
+can gate a deploy.
+
+The server is gunicorn (gthread), uvicorn or ``manage.py runserver``
+(--server; auto picks the first installed). OTPs live in process memory
+without REDIS_URL, so --workers > 1 needs REDIS_URL. The scratch SQLite
+database is opened with BEGIN IMMEDIATE so concurrent writers queue
+instead of failing; use --use-env-db for Postgres numbers.
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from benchmarks import ROOT, setup_django
+from benchmarks.fake_cashfree import FakeCashfree
+from benchmarks.loadgen import Server, free_port, run_load
+from benchmarks.smtp_stub import SMTPStub
+
+SCENARIOS = ('otp', 'kyc', 'invest', 'poll', 'webhook', 'withdraw', 'admin')
+PERCENTILES = ('p50Ms', 'p95Ms', 'p99Ms')
+WEBHOOK_SECRET = 'bench-webhook-secret'
+ADMIN_EMAIL = 'admin@ankuon2.com'
+OTP_RE = re.compile(rb'^To: (\S+)\r?$.*?Your OTP is (\d+)', re.M | re.S)
+
+
+def email(i):
+    return f'load{i}@example.com'
+
+
+def auth(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def succeeded(status):
+    # every request in the mix is valid, so a 4xx is as much a failure as a 5xx
+    return status < 400
+
+
+# -- state the steps build on; written directly when an earlier step was skipped --
+
+def load_users(count):
+    from app.models import UserProfile
+
+    existing = set(UserProfile.objects.filter(email__startswith='load').values_list('email', flat=True))
+    UserProfile.objects.bulk_create([
+        UserProfile(email=email(i), name=f'Load {i}', verified=True)
+        for i in range(count) if email(i) not in existing
+    ])
+    return list(UserProfile.objects.filter(email__in=[email(i) for i in range(count)]).order_by('id'))
+
+
+def kyc_payload(profile):
+    return {
+        'pan': f'ABCDE{profile.id % 10000:04d}F', 'aadhaar': f'{profile.id:012d}',
+        'mobile': f'9{profile.id:09d}', 'accountName': profile.name,
+        'bankAccount': f'{profile.id:012d}', 'ifsc': 'HDFC0001234',
+    }
+
+
+def verified_users(count):
+    from django.utils import timezone
+    from app.models import Kyc, UserProfile
+
+    profiles = load_users(count)
+    pending = [p for p in profiles if p.kyc_status != 'Verified']
+    Kyc.objects.filter(user__in=pending).delete()
+    Kyc.objects.bulk_create([
+        Kyc(
+            user=p, pan=data['pan'], aadhaar=data['aadhaar'], mobile=data['mobile'],
+            account_name=data['accountName'], bank_account=data['bankAccount'], ifsc=data['ifsc'],
+            aadhaar_mobile_linked=True, verified_at=timezone.now(),
+        )
+        for p, data in ((p, kyc_payload(p)) for p in pending)
+    ])
+    UserProfile.objects.filter(id__in=[p.id for p in pending]).update(kyc_status='Verified')
+    return profiles
+
+
+def load_orders(count, status=None):
+    from app.models import Investment
+
+    orders = Investment.objects.filter(user__email__startswith='load').order_by('id')
+    if not orders.exists():
+        profiles = verified_users(count)
+        Investment.objects.bulk_create([
+            Investment(
+                user=p, amount=Decimal('25000'), order_id=f'AO2-LOAD-{p.id:08d}',
+                status='Pending Bank Transfer', payment_method='bank',
+            )
+            for p in profiles
+        ])
+    if status:
+        orders = orders.filter(status=status)
+    return list(orders.values_list('id', 'user_id', 'order_id', 'amount'))
+
+
+def confirmed_orders(count):
+    from django.db import transaction
+    from app.models import Investment
+    from app.services import ledger, portfolio
+
+    confirmed = load_orders(count, 'Confirmed')
+    if confirmed:
+        return confirmed
+    pending = load_orders(count, 'Pending Bank Transfer')
+    with transaction.atomic():
+        Investment.objects.filter(id__in=[row[0] for row in pending]).update(status='Confirmed')
+        portfolio.investments_confirmed([(uid, amount) for _, uid, _, amount in pending])
+        ledger.investments_confirmed([(uid, amount, order_id) for _, uid, order_id, amount in pending])
+    return pending
+
+
+def tokens(user_ids):
+    from app.api.authentication import issue_token
+    from app.models import UserProfile
+
+    return {p.id: issue_token(p) for p in UserProfile.objects.filter(id__in=user_ids)}
+
+
+# -- steps: each returns [(name, method, path, body, headers)] ---------------------
+
+def otp_codes(stub, emails, timeout=30):
+    """{email: code} from the mails the server sent to the SMTP stub."""
+    deadline = time.monotonic() + timeout
+    codes = {}
+    while time.monotonic() < deadline:
+        with stub.lock:
+            messages = list(stub.messages)
+        codes = {}
+        for message in messages:
+            match = OTP_RE.search(message)
+            if match:
+                codes[match.group(1).decode()] = match.group(2).decode()
+        if all(e in codes for e in emails):
+            break
+        time.sleep(0.1)
+    return codes
+
+
+def webhook_delivery(order_id, amount, n):
+    body = {
+        'type': 'PAYMENT_SUCCESS_WEBHOOK',
+        'event_time': datetime.now(dt_timezone.utc).isoformat(),
+        'data': {
+            'order': {'order_id': order_id, 'order_amount': float(amount)},
+            'payment': {
+                'cf_payment_id': f'LOAD{n:010d}', 'bank_reference': f'UTRLOAD{n:010d}',
+                'payment_amount': float(amount), 'payment_status': 'SUCCESS',
+            },
+        },
+    }
+    timestamp = str(int(time.time()))
+    signature = base64.b64encode(hmac.new(
+        WEBHOOK_SECRET.encode(), f'{timestamp}{json.dumps(body)}'.encode(), hashlib.sha256,
+    ).digest()).decode()
+    return body, {'x-webhook-timestamp': timestamp, 'x-webhook-signature': signature}
+
+
+def build_step(name, args, rng):
+    from app.api.authentication import issue_token
+
+    if name == 'kyc':
+        profiles = load_users(args.users)
+        tokens_by_id = tokens([p.id for p in profiles])
+        return [
+            ('kyc-verification', 'POST', '/api/kyc-verification/', kyc_payload(p), auth(tokens_by_id[p.id]))
+            for p in profiles
+        ]
+    if name == 'invest':
+        profiles = verified_users(args.users)
+        tokens_by_id = tokens([p.id for p in profiles])
+        requests = []
+        for i, p in enumerate(profiles):
+            body = (
+                {'amount': 25000, 'payment_method': 'upi'} if i % 4 == 3
+                else {'amount': 25000, 'payment_method': 'bank', 'requestVirtualAccount': True}
+            )
+            requests.append(('invest', 'POST', '/api/invest/', body, auth(tokens_by_id[p.id])))
+        return requests
+    if name == 'poll':
+        orders = load_orders(args.users)
+        tokens_by_id = tokens({uid for _, uid, _, _ in orders})
+        requests = [
+            ('check-transaction', 'GET', f'/api/check-transaction/{order_id}/', None, auth(tokens_by_id[uid]))
+            for _, uid, order_id, _ in orders for _ in range(args.polls)
+        ]
+        rng.shuffle(requests)
+        return requests
+    if name == 'webhook':
+        requests = []
+        for n, (_, _, order_id, amount) in enumerate(load_orders(args.users, 'Pending Bank Transfer')):
+            body, headers = webhook_delivery(order_id, amount, n)
+            requests.append(('webhook', 'POST', '/api/webhooks/cashfree/', body, headers))
+            if rng.random() < args.webhook_retries:
+                requests.append(('webhook-retry', 'POST', '/api/webhooks/cashfree/', body, headers))
+        rng.shuffle(requests)
+        return requests
+    if name == 'withdraw':
+        orders = confirmed_orders(args.users)
+        tokens_by_id = tokens({uid for _, uid, _, _ in orders})
+        return [
+            ('withdraw', 'POST', '/api/withdraw/', {'investment_id': inv_id, 'amount': 1000}, auth(tokens_by_id[uid]))
+            for inv_id, uid, _, _ in orders
+        ]
+    if name == 'admin':
+        from app.models import Investment, Withdrawal
+
+        headers = auth(issue_token(admin_email=ADMIN_EMAIL))
+        actions = [
+            ('admin-process-withdrawal', 'POST', f'/api/admin/withdrawals/{wd_id}/process/',
+             {'utr': f'UTRPAY{wd_id:010d}'}, headers) if wd_id % 5 else
+            ('admin-reject-withdrawal', 'POST', f'/api/admin/withdrawals/{wd_id}/reject/',
+             {'reason': 'Load test'}, headers)
+            for wd_id in Withdrawal.objects.filter(status='Pending', user__email__startswith='load')
+            .order_by('id').values_list('id', flat=True)
+        ] + [
+            ('admin-confirm-bank-transfer', 'POST', f'/api/admin/investments/{inv_id}/confirm/',
+             {'utr': f'UTRBANK{inv_id:010d}'}, headers)
+            for inv_id in Investment.objects.filter(status='Pending Bank Transfer', user__email__startswith='load')
+            .order_by('id').values_list('id', flat=True)
+        ]
+        requests = []
+        for i, action in enumerate(actions):
+            if i % 10 == 0:
+                requests += [
+                    ('admin-withdrawals', 'GET', '/api/admin/withdrawals/', None, headers),
+                    ('admin-bank-transfers', 'GET', '/api/admin/investments/', None, headers),
+                    ('admin-stats', 'GET', '/api/admin/stats/', None, headers),
+                ]
+            requests.append(action)
+        return requests
+    raise ValueError(name)
+
+
+# -- comparison ---------------------------------------------------------------------
+
+def compare(baseline, current, threshold, min_delta_ms):
+    """Per-endpoint percentile changes and the list of regressions."""
+    endpoints, regressions = {}, []
+    for step, results in current['steps'].items():
+        for endpoint, stats in results.items():
+            before = baseline.get('steps', {}).get(step, {}).get(endpoint)
+            if before is None or endpoint == 'overall':
+                continue
+            key = f'{step}/{endpoint}'
+            endpoints[key] = {}
+            for field in PERCENTILES + ('rps',):
+                old, new = before[field], stats[field]
+                change = round((new - old) / old, 3) if old else None
+                endpoints[key][field] = {'baseline': old, 'current': new, 'change': change}
+                if (
+                    field in PERCENTILES and old and new > old * (1 + threshold)
+                    and new - old >= min_delta_ms
+                ):
+                    regressions.append(f'{key} {field} {old} -> {new} (+{change:.0%})')
+            if stats['errors'] > before['errors']:
+                regressions.append(f'{key} errors {before["errors"]} -> {stats["errors"]}')
+    return {'threshold': threshold, 'minDeltaMs': min_delta_ms, 'regressions': regressions, 'endpoints': endpoints}
+
+
+# -- server ------------------------------------------------------------------------
+
+def server_argv(kind, port, args):
+    if kind == 'gunicorn':
+        return [
+            'gunicorn', 'ankuon.wsgi:application', '--workers', str(args.workers),
+            '--worker-class', 'gthread', '--threads', str(args.threads),
+            '--bind', f'127.0.0.1:{port}', '--timeout', '120',
+        ]
+    if kind == 'uvicorn':
+        return [
+            'uvicorn', 'ankuon.asgi:application', '--workers', str(args.workers),
+            '--host', '127.0.0.1', '--port', str(port), '--no-access-log',
+        ]
+    return [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload']
+
+
+def pick_server(requested):
+    if requested != 'auto':
+        return requested
+    for kind in ('gunicorn', 'uvicorn'):
+        if Server.available(kind):
+            return kind
+    return 'runserver'
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated subset, in any order.')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--polls', type=int, default=5, help='check-transaction calls per order.')
+    parser.add_argument('--webhook-retries', type=float, default=0.25, help='Share of deliveries resent.')
+    parser.add_argument('--gateway-delay', type=float, default=0.05, help='Fake Cashfree latency per call.')
+    parser.add_argument('--smtp-delay', type=float, default=0.0, help='SMTP stub connect latency.')
+    parser.add_argument('--server', choices=('auto', 'gunicorn', 'uvicorn', 'runserver'), default='auto')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn gthread threads per worker.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='Also write the JSON results here.')
+    parser.add_argument('--baseline', help='Results of an earlier run to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative percentile growth.')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0, help='Ignore smaller absolute growth.')
+    parser.add_argument('--use-env-db', action='store_true')
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+    if 'otp' in scenarios and args.workers > 1 and not os.getenv('REDIS_URL'):
+        parser.error('--workers > 1 needs REDIS_URL: OTPs are kept in process memory otherwise')
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    db_path = setup_django(use_env_db=args.use_env_db)
+    gateway = FakeCashfree(delay=args.gateway_delay).start()
+    stub = SMTPStub(connect_delay=args.smtp_delay).start()
+    env = dict(
+        os.environ,
+        CASHFREE_VA_BASE_URL=gateway.base_url,
+        CASHFREE_APP_ID=gateway.client_id,
+        CASHFREE_SECRET_KEY=WEBHOOK_SECRET,
+        EMAIL_HOST=stub.host,
+        EMAIL_PORT=str(stub.port),
+        EMAIL_USE_TLS='False',
+        EMAIL_HOST_USER='',  # the stub speaks no AUTH
+        EMAIL_HOST_PASSWORD='',
+        VA_POOL_SIZE='0',
+        ALLOWED_HOSTS='127.0.0.1,localhost',
+        DEBUG='False',
+        PYTHONPATH=str(ROOT),
+        PYTHONUNBUFFERED='1',
+    )
+    if not os.getenv('REDIS_URL'):
+        env.setdefault('OTP_STORE', 'memory')  # one worker, checked above
+    if db_path:
+        # writers queue on the lock instead of failing a read -> write upgrade
+        env['DATABASE_URL'] = f'sqlite:///{db_path}?timeout=60&transaction_mode=IMMEDIATE'
+
+    server = pick_server(args.server)
+    rng = random.Random(args.seed)
+    results = {
+        'meta': {
+            'commit': git_commit(), 'startedAt': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'server': server, 'workers': args.workers, 'threads': args.threads,
+            'users': args.users, 'concurrency': args.concurrency, 'polls': args.polls,
+            'webhookRetries': args.webhook_retries, 'gatewayDelay': args.gateway_delay,
+            'database': 'env' if args.use_env_db else 'sqlite',
+        },
+        'steps': {},
+    }
+    port = free_port()
+    try:
+        with Server(server_argv(server, port, args), port, env=env, cwd=str(ROOT)):
+            base_url = f'http://127.0.0.1:{port}'
+            for name in SCENARIOS:
+                if name not in scenarios:
+                    continue
+                if name == 'otp':
+                    emails = [email(i) for i in range(args.users)]
+                    sends = [
+                        ('send-otp', 'POST', '/api/send-otp/', {'email': e, 'name': f'Load {i}'}, None)
+                        for i, e in enumerate(emails)
+                    ]
+                    results['steps']['send-otp'] = run_load(
+                        base_url, sends.__getitem__, len(sends), args.concurrency, ok=succeeded,
+                    )
+                    codes = otp_codes(stub, emails)
+                    verifies = [
+                        ('verify-otp', 'POST', '/api/verify-otp/', {'email': e, 'otp': codes.get(e, '000000')}, None)
+                        for e in emails
+                    ]
+                    results['steps']['verify-otp'] = run_load(
+                        base_url, verifies.__getitem__, len(verifies), args.concurrency, ok=succeeded,
+                    )
+                    continue
+                requests = build_step(name, args, rng)
+                if requests:
+                    results['steps'][name] = run_load(
+                        base_url, requests.__getitem__, len(requests), args.concurrency, ok=succeeded,
+                    )
+    finally:
+        gateway.stop()
+        stub.stop()
+        if db_path:
+            for suffix in ('', '-wal', '-shm', '-journal'):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+    results['meta']['gatewayCalls'] = len(gateway.requests)
+    results['meta']['mailsSent'] = len(stub.messages)
+    if baseline is not None:
+        results['comparison'] = compare(baseline, results, args.threshold, args.min_delta_ms)
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+    if baseline is not None and results['comparison']['regressions']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
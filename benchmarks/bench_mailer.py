@@ -0,0 +1,51 @@
+"""Per-message send_mail vs the pooled, batched mailer against a local SMTP stub.
+
+    python -m benchmarks.bench_mailer --messages 500 --connect-delay 0.05
+
+``--connect-delay`` approximates the TCP+TLS handshake to a real relay.
+"""
+import argparse
+import json
+
+from benchmarks import setup_django, timed
+from benchmarks.smtp_stub import SMTPStub
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--connect-delay', type=float, default=0.05)
+    parser.add_argument('--drop-every', type=int, default=None)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.mail import EmailMessage, send_mail
+    from django.test.utils import override_settings
+    from app.services.mailer import Mailer
+
+    results = {'messages': args.messages, 'connectDelay': args.connect_delay}
+
+    stub = SMTPStub(connect_delay=args.connect_delay, drop_every=args.drop_every).start()
+    with override_settings(**stub.settings()):
+        with timed(results, 'perMessageSeconds'):
+            for i in range(args.messages):
+                send_mail('OTP', f'Your OTP is {i:06d}', 'noreply@ankuon2.com', [f'u{i}@example.com'])
+        results['perMessageConnections'] = stub.connections
+
+        stub.connections = 0
+        mailer = Mailer(backoff=0.01)
+        with timed(results, 'pooledSeconds'):
+            for i in range(args.messages):
+                mailer.send(EmailMessage('OTP', f'Your OTP is {i:06d}', 'noreply@ankuon2.com', [f'u{i}@example.com']))
+            mailer.flush(timeout=600)
+        results['pooledConnections'] = stub.connections
+        results['pooled'] = mailer.stats()
+        mailer.shutdown()
+    stub.stop()
+
+    results['speedup'] = round(results['perMessageSeconds'] / max(results['pooledSeconds'], 1e-9), 1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
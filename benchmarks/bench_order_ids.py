@@ -0,0 +1,119 @@
+"""Collisions and throughput: random ``AO2-YYYYMMDD-NNNNN`` ids vs app.services.order_ids.
+
+    python -m benchmarks.bench_order_ids --ids 200000 --threads 8 --processes 4
+
+Reports duplicate counts for one day's worth of ids under each scheme,
+generator throughput (single thread, threaded, batch reservation and
+several processes with distinct node ids) and, with --insert, the time to
+insert that many investments keyed by each kind of id.
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import threading
+import time
+
+from benchmarks import setup_django, timed
+
+
+def legacy_id(day='20261018'):
+    return f'AO2-{day}-{random.randint(10000, 99999)}'
+
+
+def generate_on_node(args):
+    node, count = args
+    from app.services.order_ids import OrderIdGenerator
+    generator = OrderIdGenerator(node)
+    return [generator.next_id() for _ in range(count)]
+
+
+def rate(count, seconds):
+    return round(count / seconds) if seconds else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ids', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--insert', type=int, default=0, help='Also insert this many investments per scheme.')
+    args = parser.parse_args()
+
+    setup_django()
+    from app.services.order_ids import OrderIdGenerator
+
+    results = {'ids': args.ids}
+
+    legacy = [legacy_id() for _ in range(args.ids)]
+    results['legacyDuplicates'] = len(legacy) - len(set(legacy))
+
+    generator = OrderIdGenerator(1)
+    with timed(results, 'singleThreadSeconds'):
+        single = [generator.next_id() for _ in range(args.ids)]
+    results['singleThreadIdsPerSecond'] = rate(args.ids, results['singleThreadSeconds'])
+    results['singleThreadDuplicates'] = len(single) - len(set(single))
+    results['singleThreadSorted'] = single == sorted(single)
+
+    generator = OrderIdGenerator(2)
+    per_thread = args.ids // args.threads
+    collected = []
+    lock = threading.Lock()
+
+    def worker():
+        ids = [generator.next_id() for _ in range(per_thread)]
+        with lock:
+            collected.extend(ids)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    with timed(results, 'threadedSeconds'):
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    results['threadedIdsPerSecond'] = rate(len(collected), results['threadedSeconds'])
+    results['threadedDuplicates'] = len(collected) - len(set(collected))
+
+    generator = OrderIdGenerator(3)
+    with timed(results, 'reserveSeconds'):
+        reserved = []
+        while len(reserved) < args.ids:
+            reserved.extend(generator.reserve(min(args.batch, args.ids - len(reserved))))
+    results['reserveIdsPerSecond'] = rate(args.ids, results['reserveSeconds'])
+    results['reserveDuplicates'] = len(reserved) - len(set(reserved))
+
+    per_process = args.ids // args.processes
+    started = time.perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        batches = pool.map(generate_on_node, [(10 + n, per_process) for n in range(args.processes)])
+    elapsed = time.perf_counter() - started
+    merged = [i for batch in batches for i in batch]
+    results['multiProcessIdsPerSecond'] = rate(len(merged), elapsed)
+    results['multiProcessDuplicates'] = len(merged) - len(set(merged))
+
+    if args.insert:
+        from app.models import Investment, UserProfile
+        user = UserProfile.objects.create(email='orderids@example.com', name='Order Ids')
+        fresh = OrderIdGenerator(4)
+        schemes = {
+            'legacy': list({legacy_id(): None for _ in range(args.insert * 2)})[:args.insert],
+            'generated': fresh.reserve(args.insert),
+        }
+        for name, ids in schemes.items():
+            Investment.objects.all().delete()
+            with timed(results, f'{name}InsertSeconds'):
+                for start in range(0, len(ids), 1000):
+                    Investment.objects.bulk_create([
+                        Investment(user=user, amount=1000, order_id=order_id, status='Pending', payment_method='upi')
+                        for order_id in ids[start:start + 1000]
+                    ])
+            results[f'{name}Inserted'] = len(ids)
+
+    json.dump(results, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()
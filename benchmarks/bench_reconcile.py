@@ -0,0 +1,90 @@
+"""Reconcile a synthetic bank statement against pending bank transfers.
+
+    python -m benchmarks.bench_reconcile --rows 1000000 --pending 20000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+from datetime import timedelta
+
+from benchmarks import setup_django, peak_rss_mb, timed
+
+
+def seed_pending(count):
+    from django.utils import timezone
+    from app.models import UserProfile, Investment
+
+    users = UserProfile.objects.bulk_create(
+        [UserProfile(email=f'bench{i}@example.com', name=f'Bench {i}') for i in range(1000)]
+    )
+    now = timezone.now()
+    batch = []
+    for i in range(count):
+        batch.append(Investment(
+            user=users[i % len(users)],
+            amount=10000 + random.randint(0, 500000),
+            order_id=f'AO2-BENCH-{i:08d}',
+            status='Pending Bank Transfer',
+            payment_method='bank',
+            virtual_account={'vAccountId': f'AO2BENCH{i:08d}', 'accountNumber': f'9900{i:010d}'},
+        ))
+        if len(batch) == 5000:
+            Investment.objects.bulk_create(batch)
+            batch = []
+    Investment.objects.bulk_create(batch)
+    Investment.objects.update(date=now - timedelta(days=1))
+    return list(Investment.objects.values_list('amount', 'virtual_account'))
+
+
+def write_statement(path, rows, pending, match_ratio):
+    """Stream ``rows`` credits to ``path``; ``match_ratio`` of them pay a pending VA."""
+    today = __import__('datetime').date.today().isoformat()
+    with open(path, 'w') as f:
+        f.write('date,amount,utr,account,narrative,type\n')
+        for i in range(rows):
+            if pending and random.random() < match_ratio:
+                amount, va = pending[random.randrange(len(pending))]
+                account = va['accountNumber']
+            else:
+                amount, account = random.randint(100, 2000000), f'55{i:012d}'
+            f.write(f'{today},{amount},UTR{i:012d},{account},NEFT CR {account},CR\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--pending', type=int, default=20_000)
+    parser.add_argument('--match-ratio', type=float, default=0.01)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    db_path = setup_django()
+    from app.services import reconciliation
+
+    results = {'rows': args.rows, 'pending': args.pending}
+    with timed(results, 'seed_seconds'):
+        pending = seed_pending(args.pending)
+    fd, statement = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    try:
+        with timed(results, 'write_statement_seconds'):
+            write_statement(statement, args.rows, pending, args.match_ratio)
+        del pending
+        rss_before = peak_rss_mb()
+        with open(statement, newline='') as stream, open(os.devnull, 'w') as report:
+            with timed(results, 'reconcile_seconds'):
+                counts = reconciliation.reconcile(stream, report=report, dry_run=args.dry_run)
+        results['counts'] = counts
+        results['rows_per_second'] = round(args.rows / max(results['reconcile_seconds'], 1e-9))
+        results['peak_rss_mb_before'] = round(rss_before, 1)
+        results['peak_rss_mb_after'] = round(peak_rss_mb(), 1)
+    finally:
+        os.unlink(statement)
+        os.unlink(db_path)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""Local stand-in for the Cashfree Auto Collect API (/authorize, /createVA).
+
+    gateway = FakeCashfree(delay=0.2).start()
+    ... CASHFREE_VA_BASE_URL=gateway.base_url ...
+    gateway.fail_next(3)   # next three createVA calls answer 503
+    gateway.stop()
+
+Speaks HTTP/1.1 with keep-alive and counts TCP connections, so tests can
+assert that the client reuses its pooled connection.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.fake.lock:
+            self.server.fake.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body):
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'null') if length else None
+        path = self.path[len(fake.prefix):] if self.path.startswith(fake.prefix) else self.path
+        with fake.lock:
+            fake.requests.append((path, body))
+            failing = fake._failures > 0
+            if failing and path == '/createVA':
+                fake._failures -= 1
+        if fake.delay:
+            time.sleep(fake.delay)
+
+        if path == '/authorize':
+            if self.headers.get('X-Client-Id') != fake.client_id:
+                return self._reply(401, {'status': 'ERROR', 'message': 'Invalid clientId'})
+            return self._reply(200, {
+                'status': 'SUCCESS',
+                'data': {'token': fake.token, 'expiry': int(time.time()) + 600},
+            })
+        if path == '/createVA':
+            if self.headers.get('Authorization') != f'Bearer {fake.token}':
+                return self._reply(403, {'status': 'ERROR', 'message': 'Token is not valid'})
+            if failing:
+                return self._reply(503, {'status': 'ERROR', 'message': 'Service unavailable'})
+            va_id = (body or {}).get('vAccountId', '')
+            with fake.lock:
+                if va_id in fake.accounts:
+                    return self._reply(409, {'status': 'ERROR', 'message': 'Virtual account already exists'})
+                number = f'808080{len(fake.accounts) + 1:010d}'
+                fake.accounts[va_id] = number
+            return self._reply(200, {
+                'status': 'SUCCESS',
+                'data': {'accountNumber': number, 'ifsc': 'YESB0CMSNOC'},
+            })
+        return self._reply(404, {'status': 'ERROR', 'message': 'Not found'})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class FakeCashfree:
+    def __init__(self, host='127.0.0.1', port=0, delay=0.0, client_id='test-app', token='fake-token'):
+        self.delay = delay
+        self.client_id = client_id
+        self.token = token
+        self.prefix = '/cac/v1'
+        self.lock = threading.Lock()
+        self.requests = []
+        self.accounts = {}
+        self.connections = 0
+        self._failures = 0
+        self._server = _Server((host, port), _Handler)
+        self._server.fake = self
+        self.host, self.port = self._server.server_address
+        self.base_url = f'http://{self.host}:{self.port}{self.prefix}'
+
+    def fail_next(self, count):
+        with self.lock:
+            self._failures = count
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def settings(self):
+        """Django settings pointing the VA client at this fake."""
+        return {
+            'CASHFREE_VA_BASE_URL': self.base_url,
+            'CASHFREE_APP_ID': self.client_id,
+            'CASHFREE_SECRET_KEY': 'test-secret',
+            'CASHFREE_VA_BACKOFF_SECONDS': 0.001,
+        }
@@ -0,0 +1,137 @@
+"""Small threaded HTTP load generator shared by the server benchmarks.
+
+Each worker thread keeps one keep-alive connection and pulls request
+specs from ``next_request(i)`` -> (name, method, path, body, headers).
+"""
+import http.client
+import json
+import shutil
+import socket
+import subprocess
+import threading
+import time
+from urllib.parse import urlsplit
+
+# settings.py redirects plain HTTP to HTTPS outside DEBUG
+DEFAULT_HEADERS = {'X-Forwarded-Proto': 'https', 'Content-Type': 'application/json'}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'rps': round(len(values) / elapsed, 1) if elapsed else 0.0,
+        'p50Ms': round(percentile(values, 0.50) * 1000, 2),
+        'p95Ms': round(percentile(values, 0.95) * 1000, 2),
+        'p99Ms': round(percentile(values, 0.99) * 1000, 2),
+        'maxMs': round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+def run_load(base_url, next_request, total, concurrency, timeout=60, ok=None):
+    """Issue ``total`` requests from ``concurrency`` threads; per-name + overall stats.
+
+    ``ok(status)`` decides which responses count as errors (default: 5xx).
+    """
+    ok = ok or (lambda status: status < 500)
+    parts = urlsplit(base_url)
+    counter = iter(range(total))
+    lock = threading.Lock()
+    samples = {}
+    failures = {}
+
+    def worker():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            name, method, path, body, headers = next_request(i)
+            payload = json.dumps(body).encode() if body is not None else None
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=payload, headers={**DEFAULT_HEADERS, **(headers or {})})
+                response = conn.getresponse()
+                response.read()
+                succeeded = ok(response.status)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+                succeeded = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples.setdefault(name, []).append(elapsed)
+                if not succeeded:
+                    failures[name] = failures.get(name, 0) + 1
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    result = {name: summarize(values, failures.get(name, 0), elapsed) for name, values in samples.items()}
+    result['overall'] = summarize(
+        [v for values in samples.values() for v in values], sum(failures.values()), elapsed,
+    )
+    return result
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+class Server:
+    """Context manager running a server command until the block exits."""
+
+    def __init__(self, argv, port, env=None, cwd=None):
+        self.argv = argv
+        self.port = port
+        self.env = env
+        self.cwd = cwd
+        self.process = None
+
+    @staticmethod
+    def available(executable):
+        return shutil.which(executable) is not None
+
+    def __enter__(self):
+        self.process = subprocess.Popen(
+            self.argv, env=self.env, cwd=self.cwd,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        if not wait_for_port(self.port):
+            self.process.kill()
+            raise RuntimeError(f'{self.argv[0]} did not start on port {self.port}')
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
@@ -0,0 +1,95 @@
+"""Minimal in-process SMTP server for tests and mail benchmarks.
+
+    stub = SMTPStub(connect_delay=0.05).start()
+    ... EMAIL_HOST='127.0.0.1', EMAIL_PORT=stub.port, EMAIL_USE_TLS=False ...
+    stub.stop()
+
+Speaks just enough ESMTP for smtplib (no TLS/AUTH). ``connect_delay``
+stands in for the TCP+TLS handshake, ``drop_every`` closes the session
+after that many messages to exercise reconnects.
+"""
+import socketserver
+import threading
+import time
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        stub = self.server.stub
+        with stub.lock:
+            stub.connections += 1
+        if stub.connect_delay:
+            time.sleep(stub.connect_delay)
+        self.reply('220 stub ESMTP')
+        delivered = 0
+        data = None
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            if data is not None:
+                if line.rstrip(b'\r\n') == b'.':
+                    with stub.lock:
+                        stub.messages.append(b''.join(data))
+                    data = None
+                    delivered += 1
+                    self.reply('250 OK queued')
+                    if stub.drop_every and delivered >= stub.drop_every:
+                        return
+                else:
+                    data.append(line[1:] if line.startswith(b'..') else line)
+                continue
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.reply('250-stub')
+                self.reply('250 8BITMIME')
+            elif command == b'DATA':
+                data = []
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self.reply('221 Bye')
+                return
+            elif command in (b'HELO', b'MAIL', b'RCPT', b'RSET', b'NOOP'):
+                self.reply('250 OK')
+            else:
+                self.reply('502 Command not implemented')
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPStub:
+    def __init__(self, host='127.0.0.1', port=0, connect_delay=0.0, drop_every=None):
+        self.connect_delay = connect_delay
+        self.drop_every = drop_every
+        self.lock = threading.Lock()
+        self.messages = []
+        self.connections = 0
+        self._server = _Server((host, port), _Handler)
+        self._server.stub = self
+        self.host, self.port = self._server.server_address
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def settings(self):
+        """Django email settings pointing at this stub."""
+        return {
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': self.host,
+            'EMAIL_PORT': self.port,
+            'EMAIL_USE_TLS': False,
+            'EMAIL_USE_SSL': False,
+            'EMAIL_HOST_USER': '',
+            'EMAIL_HOST_PASSWORD': '',
+        }